@@ -3,9 +3,8 @@
 
 import os
 import sys
+import xmlrpc.client
 import psycopg2
-import datetime
-import random
 from dotenv import load_dotenv
 
 # Carregar variáveis de ambiente do arquivo .env
@@ -20,6 +19,13 @@ DB_CONFIG = {
     'port': int(os.getenv('DB_PORT', 5435))
 }
 
+# Acesso ao Odoo, que executa a correção pela chave de acesso
+ODOO_CONFIG = {
+    'url': os.getenv('ODOO_URL', 'http://localhost:8069'),
+    'user': os.getenv('ODOO_USER', 'odoo18'),
+    'password': os.getenv('ODOO_PASSWORD', 'odoo18'),
+}
+
 def conectar_bd():
     """Estabelece conexão com o banco de dados."""
     try:
@@ -92,41 +98,37 @@ def atualizar_tipo_operacao(conn):
         conn.rollback()
         return 0
 
-def atualizar_datas_nulas(conn):
-    """Atualiza os registros com data_emissao nula usando datas aleatórias nos últimos 90 dias."""
+def atualizar_dados_pela_chave(conn):
+    """Corrige data_emissao e preenche serie, numero e modelo nulos a partir da chave de acesso.
+
+    A correção é a do módulo importar_nfe (ImportarNFe._preencher_dados_da_chave),
+    executada pelo Odoo via XML-RPC para que exista em um só lugar: a data de
+    emissão vazia ou fora do mês da chave é relida do XML original e, sem
+    data no XML, passa a ser o primeiro dia do mês da chave no horário local.
+    """
     try:
+        common = xmlrpc.client.ServerProxy(f"{ODOO_CONFIG['url']}/xmlrpc/2/common")
+        uid = common.authenticate(DB_CONFIG['dbname'], ODOO_CONFIG['user'], ODOO_CONFIG['password'], {})
+        if not uid:
+            print("Falha na autenticação no Odoo. Verifique ODOO_USER e ODOO_PASSWORD.")
+            return False
+        
+        models = xmlrpc.client.ServerProxy(f"{ODOO_CONFIG['url']}/xmlrpc/2/object")
+        acao = models.execute_kw(DB_CONFIG['dbname'], uid, ODOO_CONFIG['password'],
+                                 'importar_nfe.nfe', 'action_preencher_dados_da_chave', [])
+        print(acao['params']['message'])
+        
+        # Registros que continuam sem data têm chave inválida
         cursor = conn.cursor()
-        
-        # Verificar quantos registros precisam ser atualizados
         cursor.execute("SELECT COUNT(*) FROM importar_nfe_nfe WHERE data_emissao IS NULL")
-        count_null = cursor.fetchone()[0]
-        
-        if count_null == 0:
-            print("Não há registros com data_emissao nula para atualizar.")
-            return 0
-        
-        print(f"Atualizando {count_null} registros com data_emissao nula...")
+        restantes = cursor.fetchone()[0]
+        if restantes:
+            print(f"{restantes} registros continuam sem data_emissao (chave de acesso inválida).")
         
-        # Data atual e data há 90 dias atrás
-        hoje = datetime.datetime.now()
-        data_inicio = hoje - datetime.timedelta(days=90)
-        
-        # Atualizar registros com datas aleatórias entre data_inicio e hoje
-        cursor.execute("""
-            UPDATE importar_nfe_nfe 
-            SET data_emissao = TIMESTAMP '2023-01-01 00:00:00' + 
-                              RANDOM() * (TIMESTAMP '2023-12-31 23:59:59' - TIMESTAMP '2023-01-01 00:00:00')
-            WHERE data_emissao IS NULL
-        """)
-        
-        conn.commit()
-        print(f"Atualizados {cursor.rowcount} registros com datas aleatórias.")
-        
-        return cursor.rowcount
+        return True
     except Exception as e:
-        print(f"Erro ao atualizar datas nulas: {e}")
-        conn.rollback()
-        return 0
+        print(f"Erro ao atualizar dados pela chave de acesso: {e}")
+        return False
 
 def corrigir_dados(conn):
     """Executa todas as correções necessárias nos dados."""
@@ -139,10 +141,9 @@ def corrigir_dados(conn):
         print("\n=== Atualizando tipo_operacao para 'saida' ===")
         atualizar_tipo_operacao(conn)
     
-    # Atualizar datas nulas
-    if count_null > 0:
-        print("\n=== Atualizando datas nulas ===")
-        atualizar_datas_nulas(conn)
+    # Preencher datas nulas (e série/número/modelo vazios) a partir da chave de acesso
+    print("\n=== Preenchendo dados pela chave de acesso ===")
+    atualizar_dados_pela_chave(conn)
     
     # Verificar estado final
     print("\n=== Estado final dos dados ===")
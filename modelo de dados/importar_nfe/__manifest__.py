@@ -25,7 +25,7 @@ Funcionalidades:
     'license': 'LGPL-3',
 
     # any module necessary for this one to work correctly
-    'depends': ['base', 'account', 'web', 'mail'],
+    'depends': ['base', 'account', 'web', 'mail', 'bus'],
 
     # always loaded
     'data': [
@@ -36,6 +36,7 @@ Funcionalidades:
         'views/server_actions.xml',
         'views/menu_items.xml',
         'data/sequence.xml',
+        'data/cron.xml',
     ],
     # only loaded in demonstration mode
     'demo': [
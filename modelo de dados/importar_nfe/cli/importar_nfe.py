@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Importação de NFes pela linha de comando, sem passar pelo servidor web
+
+    odoo-bin importar_nfe -c odoo.conf -d banco /caminho/dos/xmls \\
+        [--processos 4] [--lote 500] [--retomar] [--simular] [--usuario login]
+
+A pasta é importada neste processo pela mesma importação em lotes do wizard
+e das importações em segundo plano (importar_nfe.importacao): leitura
+paralela, gravação e checkpoint a cada lote e registro dos arquivos
+importados. Com --retomar, a última importação interrompida da mesma pasta
+continua do checkpoint; com --simular, os XMLs são apenas lidos e
+conferidos com as NFes existentes, sem gravar nada.
+"""
+
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from odoo import api, SUPERUSER_ID
+from odoo.cli import Command
+from odoo.modules.registry import Registry
+from odoo.tools import config
+
+from ..models.importador import ARQUIVOS_POR_TAREFA
+from ..tools import nfe_parser, varredura
+
+_logger = logging.getLogger(__name__)
+
+
+def _conferir_arquivo(caminho):
+    """Lê o arquivo e devolve (chave, erro); usado pela simulação nos processos de leitura"""
+    dados, _conteudo, erro = nfe_parser.ler_arquivo(caminho)
+    if erro:
+        return None, erro
+    if not dados.chave_acesso:
+        return None, 'Chave de acesso não encontrada no XML'
+    return dados.chave_acesso, None
+
+
+class ImportarNfe(Command):
+    """Importa uma pasta de XMLs de NFe sem passar pelo servidor web"""
+    name = 'importar_nfe'
+
+    def run(self, args):
+        parser = argparse.ArgumentParser(
+            prog=f'{os.path.basename(sys.argv[0])} {self.name}',
+            description='Importa uma pasta de XMLs de NFe sem passar pelo servidor web. '
+                        'As demais opções (-c, -d, --addons-path...) são as do Odoo.',
+        )
+        parser.add_argument('pasta', help='pasta com os XMLs')
+        parser.add_argument('--sem-subpastas', action='store_true',
+                            help='não percorre as subpastas')
+        parser.add_argument('--processos', type=int, default=1,
+                            help='processos de leitura paralela dos XMLs (padrão: 1)')
+        parser.add_argument('--lote', type=int, default=200,
+                            help='máximo de arquivos por lote (padrão: 200)')
+        parser.add_argument('--retomar', action='store_true',
+                            help='continua a última importação interrompida da mesma pasta')
+        parser.add_argument('--simular', action='store_true',
+                            help='apenas lê os XMLs e informa o que seria importado, sem gravar')
+        parser.add_argument('--usuario',
+                            help='login do usuário que faz a importação (padrão: superusuário)')
+        opcoes, argumentos_odoo = parser.parse_known_args(args)
+
+        config.parse_config(argumentos_odoo)
+        dbname = config['db_name']
+        if not dbname:
+            parser.error('informe o banco de dados (-d)')
+        pasta = os.path.abspath(opcoes.pasta)
+        if not os.path.isdir(pasta):
+            parser.error(f'pasta não encontrada: {pasta}')
+
+        with Registry(dbname).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            if opcoes.usuario:
+                usuario = env['res.users'].search([('login', '=', opcoes.usuario)], limit=1)
+                if not usuario:
+                    parser.error(f'usuário não encontrado: {opcoes.usuario}')
+                env = env(user=usuario.id)
+            if opcoes.simular:
+                codigo = self._simular(env, pasta, opcoes)
+            else:
+                codigo = self._importar(env, pasta, opcoes)
+        sys.exit(codigo)
+
+    def _importar(self, env, pasta, opcoes):
+        """Importa a pasta por uma importação em segundo plano executada neste processo"""
+        Importacao = env['importar_nfe.importacao']
+        incluir_subpastas = not opcoes.sem_subpastas
+        valores = {
+            'processos_leitura': opcoes.processos,
+            'tamanho_lote': opcoes.lote,
+            'execucao': 'linha_comando',
+        }
+
+        importacao = Importacao.browse()
+        if opcoes.retomar:
+            # Importações da tarefa agendada só são retomadas se estiverem paradas
+            importacao = Importacao.search([
+                ('pasta_path', '=', pasta),
+                ('incluir_subpastas', '=', incluir_subpastas),
+                ('state', 'in', ('pendente', 'executando', 'erro', 'cancelada')),
+                '|', ('execucao', '=', 'linha_comando'), ('state', 'in', ('erro', 'cancelada')),
+            ], limit=1)
+            if not importacao:
+                _logger.info('Nenhuma importação interrompida da pasta %s; iniciando uma nova', pasta)
+
+        if importacao:
+            _logger.info('Retomando a importação %s após o arquivo %s: %s',
+                         importacao.id, importacao.arquivos_processados, importacao.ultimo_arquivo or '-')
+            importacao.write(dict(valores, state='pendente', data_fim=False))
+        else:
+            importacao = Importacao.create(dict(valores, pasta_path=pasta, incluir_subpastas=incluir_subpastas))
+        env.cr.commit()
+
+        importacao._executar()
+
+        print(f'Importação {importacao.id} ({dict(importacao._fields["state"].selection)[importacao.state]}): '
+              f'{importacao.arquivos_processados} arquivos, {importacao.total_importados} importados, '
+              f'{importacao.total_duplicados} já importados, {importacao.total_erros} erros')
+        return 1 if importacao.state == 'erro' else 0
+
+    def _simular(self, env, pasta, opcoes):
+        """Lê os XMLs da pasta e conta o que seria importado, sem gravar nada"""
+        arquivos = varredura.percorrer_pasta(pasta, not opcoes.sem_subpastas)
+        nfe_model = env['importar_nfe.nfe']
+        contagem = {'arquivos': 0, 'novas': 0, 'existentes': 0, 'erros': 0}
+        novas = set()
+
+        executor = None
+        if opcoes.processos > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            executor = ProcessPoolExecutor(max_workers=opcoes.processos,
+                                           mp_context=multiprocessing.get_context('fork'))
+        try:
+            while True:
+                lote = list(itertools.islice(arquivos, max(opcoes.lote, 1)))
+                if not lote:
+                    break
+                if executor is not None:
+                    leituras = list(executor.map(_conferir_arquivo, lote, chunksize=ARQUIVOS_POR_TAREFA))
+                else:
+                    leituras = [_conferir_arquivo(caminho) for caminho in lote]
+                existentes = nfe_model._chaves_existentes({chave for chave, _erro in leituras if chave})
+
+                for caminho, (chave, erro) in zip(lote, leituras):
+                    contagem['arquivos'] += 1
+                    if erro:
+                        contagem['erros'] += 1
+                        _logger.warning('%s: %s', caminho, erro)
+                    elif chave in existentes or chave in novas:
+                        contagem['existentes'] += 1
+                    else:
+                        contagem['novas'] += 1
+                        novas.add(chave)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        env.cr.rollback()
+
+        print('Simulação: {arquivos} arquivos, {novas} NFes novas, {existentes} já importadas, '
+              '{erros} com erro'.format(**contagem))
+        return 1 if contagem['erros'] else 0
@@ -1,3 +1,6 @@
 # -*- coding: utf-8 -*-
 
 from . import controllers
+from . import progresso
+from . import importacao
+from . import envio
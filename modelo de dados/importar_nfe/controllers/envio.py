@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+from odoo import http
+from odoo.exceptions import UserError
+from odoo.http import request
+
+
+class ImportarNFeEnvio(http.Controller):
+    """Envio de arquivos grandes em partes, com retomada
+
+    1. POST /importar_nfe/envio/iniciar (JSON-RPC: nome, tamanho e,
+       opcionalmente, sha256 do arquivo): devolve o id do envio e o tamanho
+       das partes
+    2. PUT /importar_nfe/envio/<id>/parte?offset=<posição>&sha256=<hash da
+       parte>, com os bytes da parte no corpo da requisição
+    3. se a conexão cair, POST /importar_nfe/envio/<id> (JSON-RPC) informa
+       quantos bytes já foram recebidos; o envio continua dessa posição
+    4. POST /importar_nfe/envio/<id>/concluir (JSON-RPC): o arquivo é
+       conferido e importado por uma importação em segundo plano
+       (importar_nfe.importacao), retomada do último lote gravado se for
+       interrompida; acompanhe pela situação do envio ou por
+       /importar_nfe/progresso com a importação informada
+    """
+
+    def _envio(self, envio_id):
+        """Envio do usuário atual; outros usuários não enxergam o envio"""
+        envio = request.env['importar_nfe.envio'].browse(envio_id).exists()
+        if not envio or envio.create_uid != request.env.user:
+            raise request.not_found()
+        return envio
+
+    @http.route('/importar_nfe/envio/iniciar', type='json', auth='user')
+    def iniciar(self, nome, tamanho, sha256=None):
+        return request.env['importar_nfe.envio']._iniciar(nome, tamanho, sha256)._como_dict()
+
+    @http.route('/importar_nfe/envio/<int:envio_id>/parte', type='http', auth='user',
+                methods=['PUT', 'POST'], csrf=False)
+    def parte(self, envio_id, offset, sha256, **kwargs):
+        envio = self._envio(envio_id)
+        # Lê no máximo uma parte (+1 byte para detectar partes maiores)
+        conteudo = request.httprequest.stream.read(envio.tamanho_parte + 1)
+        try:
+            envio._receber_parte(int(offset), conteudo, sha256)
+        except (UserError, ValueError) as e:
+            request.env.cr.rollback()
+            return request.make_json_response(dict(envio._como_dict(), erro=str(e)), status=409)
+        return request.make_json_response(envio._como_dict())
+
+    @http.route('/importar_nfe/envio/<int:envio_id>', type='json', auth='user')
+    def situacao(self, envio_id):
+        return self._envio(envio_id)._como_dict()
+
+    @http.route('/importar_nfe/envio/<int:envio_id>/concluir', type='json', auth='user')
+    def concluir(self, envio_id):
+        envio = self._envio(envio_id)
+        envio._concluir()
+        return envio._como_dict()
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+from odoo import http
+from odoo.http import request
+
+
+class ImportarNFeImportacao(http.Controller):
+
+    @http.route('/importar_nfe/importar', type='http', auth='user', methods=['POST'], csrf=False)
+    def importar(self, **kwargs):
+        """Importa os XMLs (ou ZIPs) enviados em um POST multipart, campo 'arquivos'
+
+        Os arquivos são lidos direto do upload, sem base64; para integrações
+        por JSON-RPC/XML-RPC (inclusive com chave de API), use o método
+        importar_xmls de importar_nfe.wizard.
+
+        Returns:
+            JSON com os totais e o resultado de cada XML (ver importar_xmls)
+        """
+        arquivos = request.httprequest.files.getlist('arquivos')
+        if not arquivos:
+            return request.make_json_response({'erro': 'Nenhum arquivo enviado no campo "arquivos"'}, status=400)
+        resultado = request.env['importar_nfe.wizard']._importar_arquivos_recebidos(
+            (arquivo.filename or 'arquivo.xml', arquivo.stream) for arquivo in arquivos)
+        return request.make_json_response(resultado)
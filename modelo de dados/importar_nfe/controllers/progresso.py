@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+from odoo import http
+from odoo.http import request
+
+# Modelos cujas importações publicam progresso
+MODELOS_IMPORTACAO = ('importar_nfe.wizard', 'importar_nfe.importacao', 'importar_nfe.caixa_entrada')
+
+
+class ImportarNFeProgresso(http.Controller):
+
+    @http.route('/importar_nfe/progresso', type='json', auth='user')
+    def progresso(self, res_model, res_id):
+        """Progresso de uma importação em andamento ou concluída
+
+        Lê apenas a linha de progresso (importar_nfe.progresso_importacao),
+        sem carregar o wizard ou a importação: pode ser consultado com
+        frequência pelo navegador. As mesmas informações são enviadas pelo
+        bus (tipo 'importar_nfe/progresso') a cada atualização.
+
+        Args:
+            res_model: um dos MODELOS_IMPORTACAO
+            res_id: id do registro de origem
+
+        Returns:
+            dicionário do progresso (ver _como_dict) ou None se a importação
+            ainda não publicou progresso
+        """
+        if res_model not in MODELOS_IMPORTACAO:
+            raise request.not_found()
+        # O usuário precisa poder ler a importação de origem
+        origem = request.env[res_model].browse(int(res_id))
+        origem.check_access_rights('read')
+        origem.check_access_rule('read')
+
+        progresso = request.env['importar_nfe.progresso_importacao'].sudo().search([
+            ('res_model', '=', res_model),
+            ('res_id', '=', origem.id),
+        ], limit=1)
+        return progresso._como_dict() if progresso else None
@@ -6,6 +6,13 @@ from . import destinatario
 from . import produto
 from . import item
 from . import item_rel
+from . import arquivo_importado
+from . import log_importacao
+from . import progresso_importacao
+from . import importador
+from . import importacao
+from . import caixa_entrada
+from . import envio
 from . import wizard
 from . import arquivo
 from . import migration
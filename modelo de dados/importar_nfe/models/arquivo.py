@@ -3,9 +3,14 @@
 from odoo import models, fields, api
 
 class ImportarNFeArquivo(models.TransientModel):
+    """Arquivo enviado no wizard, no modo de múltiplos arquivos
+
+    Cada arquivo (XML ou ZIP) é um registro; o conteúdo fica em um anexo no
+    filestore e é lido de lá na importação.
+    """
     _name = 'importar_nfe.arquivo'
     _description = 'Arquivo XML para importação'
     
-    wizard_id = fields.Many2one('importar_nfe.wizard', string='Wizard', ondelete='cascade')
-    arquivo = fields.Binary(string='Arquivo XML', required=True)
+    wizard_id = fields.Many2one('importar_nfe.wizard', string='Wizard', required=True, ondelete='cascade')
+    arquivo = fields.Binary(string='Arquivo XML', required=True, attachment=True)
     nome = fields.Char(string='Nome do Arquivo')
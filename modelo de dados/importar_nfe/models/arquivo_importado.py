@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+import hashlib
+import os
+
+class ImportarNFeArquivoImportado(models.Model):
+    """Registro dos arquivos já processados pelas importações por pasta
+
+    Guarda caminho, tamanho, data de modificação e hash de cada arquivo lido,
+    com o resultado da importação. Nas próximas importações da mesma pasta,
+    arquivos com o mesmo tamanho e data de modificação de um registro com NFe
+    são ignorados apenas pelo stat, sem abrir o arquivo.
+    """
+    _name = 'importar_nfe.arquivo_importado'
+    _description = 'Arquivo Importado'
+    _order = 'data_importacao desc, id desc'
+    _rec_name = 'caminho'
+
+    caminho = fields.Char(string='Caminho', required=True, index=True, readonly=True)
+    tamanho = fields.Integer(string='Tamanho (bytes)', readonly=True)
+    data_modificacao = fields.Float(string='Data de Modificação (mtime)', readonly=True,
+                                    help='st_mtime do arquivo no momento da importação')
+    hash_conteudo = fields.Char(string='Hash SHA-256', readonly=True)
+    resultado = fields.Selection([
+        ('importado', 'Importado'),
+        ('duplicado', 'Já Importado'),
+        ('erro', 'Erro'),
+    ], string='Resultado', required=True, readonly=True)
+    nfe_id = fields.Many2one('importar_nfe.nfe', string='NFe', ondelete='set null', readonly=True)
+    data_importacao = fields.Datetime(string='Data da Importação', readonly=True)
+
+    _sql_constraints = [
+        ('caminho_uniq', 'unique(caminho)', 'O arquivo já consta no registro de arquivos importados!')
+    ]
+
+    @api.model
+    def _estado_arquivo(self, caminho):
+        """Retorna (tamanho, mtime) do arquivo, ou None se não for possível ler o stat"""
+        try:
+            estado = os.stat(caminho)
+        except OSError:
+            return None
+        return estado.st_size, estado.st_mtime
+
+    @api.model
+    def _hash_conteudo(self, conteudo):
+        return hashlib.sha256(conteudo).hexdigest()
+
+    @api.model
+    def _arquivos_inalterados(self, estados):
+        """Seleciona os arquivos já importados que não mudaram desde a importação
+
+        Args:
+            estados: dicionário {caminho: (tamanho, mtime)} dos arquivos do lote
+
+        Returns:
+            dicionário {caminho: id da NFe} dos arquivos que podem ser ignorados
+        """
+        registros = self.search_read(
+            [('caminho', 'in', list(estados)), ('nfe_id', '!=', False)],
+            ['caminho', 'tamanho', 'data_modificacao', 'nfe_id'],
+        )
+        return {
+            registro['caminho']: registro['nfe_id'][0]
+            for registro in registros
+            if estados[registro['caminho']] == (registro['tamanho'], registro['data_modificacao'])
+        }
+
+    @api.model
+    def _registrar(self, resultados):
+        """Grava o resultado dos arquivos processados em um lote
+
+        Uma consulta, um create para os arquivos novos e um UPDATE para os já
+        registrados, qualquer que seja o tamanho do lote.
+
+        Args:
+            resultados: dicionário {caminho: valores} com tamanho,
+                data_modificacao, resultado, nfe_id e, quando o conteúdo foi
+                lido, hash_conteudo
+        """
+        if not resultados:
+            return
+        agora = fields.Datetime.now()
+        existentes = {
+            registro['caminho']: registro['id']
+            for registro in self.search_read([('caminho', 'in', list(resultados))], ['caminho'])
+        }
+        novos = []
+        atualizados = []
+        for caminho, valores in resultados.items():
+            if caminho in existentes:
+                atualizados.append((
+                    existentes[caminho], valores.get('tamanho'), valores.get('data_modificacao'),
+                    valores['resultado'], valores.get('nfe_id') or None, valores.get('hash_conteudo') or None,
+                ))
+            else:
+                novos.append(dict(valores, caminho=caminho, data_importacao=agora))
+        if novos:
+            self.create(novos)
+        if atualizados:
+            self._atualizar_registros(atualizados, agora)
+
+    @api.model
+    def _atualizar_registros(self, linhas, agora):
+        """Atualiza os registros existentes de um lote em um único UPDATE
+
+        Args:
+            linhas: tuplas (id, tamanho, data_modificacao, resultado, nfe_id,
+                hash_conteudo); sem hash, o hash gravado é mantido
+            agora: data da importação
+        """
+        self.flush_model()
+        self.env.cr.execute("""
+            UPDATE importar_nfe_arquivo_importado AS registro
+               SET tamanho = novo.tamanho,
+                   data_modificacao = novo.data_modificacao,
+                   resultado = novo.resultado,
+                   nfe_id = novo.nfe_id,
+                   hash_conteudo = COALESCE(novo.hash_conteudo, registro.hash_conteudo),
+                   data_importacao = %s,
+                   write_uid = %s,
+                   write_date = %s
+              FROM unnest(%s::int[], %s::int[], %s::float8[], %s::varchar[], %s::int[], %s::varchar[])
+                   AS novo(id, tamanho, data_modificacao, resultado, nfe_id, hash_conteudo)
+             WHERE registro.id = novo.id
+        """, [agora, self.env.uid, agora, *(list(coluna) for coluna in zip(*linhas))])
+        self.invalidate_model(['tamanho', 'data_modificacao', 'resultado', 'nfe_id', 'hash_conteudo',
+                               'data_importacao', 'write_uid', 'write_date'])
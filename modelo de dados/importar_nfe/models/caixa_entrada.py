@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+from ..tools import varredura
+import itertools
+import logging
+import os
+import shutil
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Tempo máximo (segundos) de importação em uma execução do agendador; o que
+# ficar para trás é importado em uma nova execução, disparada em seguida
+TEMPO_LIMITE_PADRAO = 50
+
+class ImportarNFeCaixaEntrada(models.Model):
+    """Pasta de entrada monitorada continuamente
+
+    Cada execução da tarefa agendada verifica a pasta uma vez e importa os
+    arquivos novos em pequenos lotes; o intervalo da tarefa agendada define
+    a frequência das verificações. Depois que o lote é gravado, cada
+    arquivo é movido para a pasta de processados ou, se a importação falhou,
+    para a pasta de erros: a caixa de entrada contém apenas o que ainda não
+    foi importado e nenhuma verificação relê arquivos antigos.
+    """
+    _name = 'importar_nfe.caixa_entrada'
+    _inherit = ['importar_nfe.importador']
+    _description = 'Caixa de Entrada de NFe'
+    _order = 'name'
+
+    name = fields.Char(string='Descrição', required=True)
+    active = fields.Boolean(string='Ativa', default=True)
+    pasta_path = fields.Char(string='Pasta de Entrada', required=True,
+                             help='Pasta onde os XMLs são depositados (ex.: exportação do ERP)')
+    incluir_subpastas = fields.Boolean(string='Incluir Subpastas', default=False)
+    pasta_processados = fields.Char(string='Pasta de Processados', required=True,
+                                    help='Destino dos arquivos importados ou já existentes')
+    pasta_erros = fields.Char(string='Pasta de Erros', required=True,
+                              help='Destino dos arquivos que não puderam ser importados')
+    idade_minima = fields.Integer(string='Idade Mínima (s)', default=2,
+                                  help='Arquivos modificados há menos tempo são considerados ainda em gravação '
+                                       'e ficam para a próxima verificação')
+    tamanho_lote = fields.Integer(string='Arquivos por Lote', default=50,
+                                  help='Máximo de arquivos por lote; o tamanho de cada lote é ajustado pelo tempo '
+                                       'e pela memória observados')
+    ultima_entrada = fields.Datetime(string='Última Entrada', readonly=True,
+                                     help='Última verificação em que havia arquivos novos')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            vals.update({campo: valor for campo, valor in self._pastas_padrao(vals.get('pasta_path')).items()
+                         if not vals.get(campo)})
+        return super().create(vals_list)
+
+    @api.onchange('pasta_path')
+    def _onchange_pasta_path(self):
+        for campo, valor in self._pastas_padrao(self.pasta_path).items():
+            if not self[campo]:
+                self[campo] = valor
+
+    @api.model
+    def _pastas_padrao(self, pasta_path):
+        """Pastas de processados e de erros ao lado da pasta de entrada"""
+        if not pasta_path:
+            return {}
+        pai = os.path.dirname(os.path.normpath(pasta_path))
+        return {
+            'pasta_processados': os.path.join(pai, 'processados'),
+            'pasta_erros': os.path.join(pai, 'erros'),
+        }
+
+    @api.constrains('pasta_path', 'pasta_processados', 'pasta_erros', 'incluir_subpastas')
+    def _check_pastas(self):
+        for record in self:
+            entrada = os.path.realpath(record.pasta_path)
+            for destino in (record.pasta_processados, record.pasta_erros):
+                destino = os.path.realpath(destino)
+                if destino == entrada or (record.incluir_subpastas and destino.startswith(entrada + os.sep)):
+                    raise ValidationError(_('As pastas de processados e de erros não podem ficar dentro '
+                                            'da pasta de entrada monitorada.'))
+
+    def action_verificar_agora(self):
+        """Dispara a verificação das caixas de entrada o quanto antes"""
+        self.env.ref('importar_nfe.ir_cron_importar_nfe_caixa_entrada').sudo()._trigger()
+
+    @api.model
+    def _cron_monitorar_caixas_entrada(self):
+        """Tarefa agendada: verifica uma vez cada caixa de entrada ativa
+
+        A importação de cada execução para no tempo limite (parâmetro
+        importar_nfe.caixa_entrada_tempo_limite), gravando o que já foi
+        importado. Se ficaram arquivos ou caixas para trás, uma nova execução
+        é disparada em seguida, sem ocupar o worker à espera de novos arquivos.
+        """
+        tempo_limite = int(self.env['ir.config_parameter'].sudo().get_param(
+            'importar_nfe.caixa_entrada_tempo_limite', TEMPO_LIMITE_PADRAO))
+        prazo = time.monotonic() + tempo_limite
+
+        pendente = False
+        for caixa in self.search([]):
+            if time.monotonic() >= prazo:
+                pendente = True
+                break
+            # Importar com as permissões de quem configurou a caixa de entrada
+            pendente |= caixa.with_user(caixa.create_uid).with_context(prazo_importacao=prazo)._verificar()
+        self.env.cr.commit()
+
+        if pendente:
+            self.env.ref('importar_nfe.ir_cron_importar_nfe_caixa_entrada').sudo()._trigger()
+
+    def _verificar(self):
+        """Importa os arquivos estáveis da pasta de entrada, se houver algum
+
+        Returns:
+            True se a importação parou no tempo limite e há arquivos para trás
+        """
+        self.ensure_one()
+        if not os.path.isdir(self.pasta_path):
+            _logger.warning("Pasta de entrada da caixa %s não encontrada: %s", self.id, self.pasta_path)
+            return False
+
+        arquivos_xml = varredura.percorrer_pasta(self.pasta_path, self.incluir_subpastas,
+                                                 modificados_ate=time.time() - self.idade_minima)
+        primeiro = next(arquivos_xml, None)
+        if primeiro is None:
+            return False
+
+        self._adicionar_log(f'Novos arquivos na pasta de entrada: {self.pasta_path}')
+        try:
+            self.ultima_entrada = fields.Datetime.now()
+            self._importar_em_lotes(itertools.chain([primeiro], arquivos_xml), 0, self.tamanho_lote or 50)
+        except Exception as e:
+            # Os arquivos ficam na caixa de entrada e são tentados na próxima verificação
+            _logger.error("Erro na caixa de entrada %s: %s", self.id, str(e), exc_info=True)
+            self.env.cr.rollback()
+            self.env.invalidate_all()
+            self._descartar_log()
+            self._adicionar_log(f'Erro na verificação da pasta de entrada: {str(e)}', 'erro')
+            self._gravar_log()
+            self.env.cr.commit()
+            return False
+        self._gravar_log()
+        self.env.cr.commit()
+        return self._interromper_importacao()
+
+    def _interromper_importacao(self):
+        """Para ao atingir o tempo limite da execução; o restante fica para a próxima"""
+        prazo = self.env.context.get('prazo_importacao')
+        return bool(prazo and time.monotonic() >= prazo)
+
+    def _lote_concluido(self, lote, arquivos_processados):
+        """Grava o lote e, só então, tira os arquivos da caixa de entrada"""
+        resultado = super()._lote_concluido(lote, arquivos_processados)
+        self._mover_arquivos(lote)
+        return resultado
+
+    def _mover_arquivos(self, arquivos):
+        """Move os arquivos para a pasta de processados ou de erros
+
+        O resultado de cada arquivo vem do registro de arquivos importados,
+        gravado junto com o lote. Arquivos sem registro (ex.: cujo stat
+        falhou) também vão para a pasta de erros, para não serem tentados a
+        cada verificação; os removidos durante a importação são ignorados.
+        """
+        resultados = {
+            registro['caminho']: registro['resultado']
+            for registro in self.env['importar_nfe.arquivo_importado'].search_read(
+                [('caminho', 'in', list(arquivos))], ['caminho', 'resultado'])
+        }
+        for arquivo in arquivos:
+            resultado = resultados.get(arquivo)
+            if resultado is None and not os.path.lexists(arquivo):
+                continue
+            pasta_destino = self.pasta_processados if resultado in ('importado', 'duplicado') else self.pasta_erros
+            destino = os.path.join(pasta_destino, os.path.relpath(arquivo, self.pasta_path))
+            try:
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                shutil.move(arquivo, self._destino_livre(destino))
+            except OSError as e:
+                self._adicionar_log(f'Não foi possível mover o arquivo {os.path.basename(arquivo)}: {str(e)}',
+                                    'aviso', os.path.basename(arquivo))
+
+    @api.model
+    def _destino_livre(self, destino):
+        """Caminho de destino que não sobrescreve um arquivo existente (nome_1.xml, nome_2.xml...)"""
+        raiz, extensao = os.path.splitext(destino)
+        numero = 0
+        while os.path.exists(destino):
+            numero += 1
+            destino = f'{raiz}_{numero}{extensao}'
+        return destino
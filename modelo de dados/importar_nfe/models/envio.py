@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import config
+import datetime
+import hashlib
+import logging
+import os
+
+_logger = logging.getLogger(__name__)
+
+# Tamanho fixo das partes (a última pode ser menor); abaixo do limite de
+# conteúdo das requisições HTTP do Odoo
+TAMANHO_PARTE = 8 * 1024 * 1024
+
+# Envios sem partes novas há mais tempo que isto são descartados
+DIAS_ENVIO_ABANDONADO = 2
+
+class ImportarNFeEnvio(models.Model):
+    """Envio de um arquivo grande (ZIP ou XML) em partes
+
+    O cliente inicia o envio informando nome e tamanho e manda partes de
+    tamanho fixo, cada uma com sua posição (offset) e SHA-256. As partes
+    são gravadas direto em um arquivo no filestore, sem base64; se a conexão
+    cair, o cliente consulta quantos bytes já foram recebidos e continua
+    dali. Ao concluir o envio, o arquivo é importado por uma importação em
+    segundo plano (importar_nfe.importacao), com a leitura em streaming dos
+    XMLs do ZIP e checkpoint a cada lote.
+    """
+    _name = 'importar_nfe.envio'
+    _description = 'Envio de Arquivo em Partes'
+    _order = 'id desc'
+
+    name = fields.Char(string='Nome do Arquivo', required=True, readonly=True)
+    # Float: tamanhos acima de 2 GB não cabem em um Integer
+    tamanho = fields.Float(string='Tamanho (bytes)', digits=(16, 0), required=True, readonly=True)
+    tamanho_parte = fields.Integer(string='Tamanho da Parte (bytes)', required=True, readonly=True,
+                                   default=TAMANHO_PARTE)
+    bytes_recebidos = fields.Float(string='Bytes Recebidos', digits=(16, 0), readonly=True, default=0)
+    hash_conteudo = fields.Char(string='SHA-256', readonly=True,
+                                help='SHA-256 do arquivo completo, conferido ao concluir o envio, se informado')
+    importacao_ids = fields.One2many('importar_nfe.importacao', 'envio_id', string='Importações')
+    importacao_id = fields.Many2one('importar_nfe.importacao', string='Importação',
+                                    compute='_compute_importacao', store=True)
+    state = fields.Selection([
+        ('recebendo', 'Recebendo'),
+        ('importando', 'Importando'),
+        ('importado', 'Importado'),
+        ('erro', 'Erro'),
+        ('cancelado', 'Cancelado'),
+    ], string='Status', compute='_compute_importacao', store=True)
+    progresso = fields.Float(string='Recebido (%)', compute='_compute_progresso')
+    data_ultima_parte = fields.Datetime(string='Última Parte', readonly=True)
+
+    @api.depends('importacao_ids.state')
+    def _compute_importacao(self):
+        estados = {
+            'pendente': 'importando',
+            'executando': 'importando',
+            'concluida': 'importado',
+            'erro': 'erro',
+            'cancelada': 'cancelado',
+        }
+        for record in self:
+            # importar_nfe.importacao é ordenada da mais recente para a mais antiga
+            record.importacao_id = record.importacao_ids[:1]
+            record.state = estados[record.importacao_id.state] if record.importacao_id else 'recebendo'
+
+    @api.depends('tamanho', 'bytes_recebidos')
+    def _compute_progresso(self):
+        for record in self:
+            record.progresso = 100.0 * record.bytes_recebidos / record.tamanho if record.tamanho else 0.0
+
+    def _caminho_arquivo(self):
+        """Arquivo do envio no filestore do banco"""
+        return os.path.join(config.filestore(self.env.cr.dbname), 'importar_nfe', 'envios', f'{self.id}.parcial')
+
+    @api.model
+    def _iniciar(self, nome, tamanho, hash_conteudo=None):
+        """Inicia um envio e reserva o arquivo no filestore
+
+        Args:
+            nome: nome do arquivo enviado
+            tamanho: tamanho total em bytes
+            hash_conteudo: SHA-256 (hexadecimal) do arquivo completo, opcional
+        """
+        tamanho = int(tamanho)
+        if tamanho <= 0:
+            raise UserError(_('Informe o tamanho do arquivo a enviar.'))
+        envio = self.create({
+            'name': os.path.basename(nome or '') or 'arquivo.zip',
+            'tamanho': tamanho,
+            'hash_conteudo': (hash_conteudo or '').lower() or False,
+            'data_ultima_parte': fields.Datetime.now(),
+        })
+        caminho = envio._caminho_arquivo()
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        open(caminho, 'wb').close()
+        return envio
+
+    def _receber_parte(self, offset, conteudo, hash_parte):
+        """Grava uma parte do arquivo na posição informada
+
+        Partes devem chegar em ordem: offset igual ao total recebido. Uma
+        parte já recebida (ex.: reenviada porque a resposta se perdeu) é
+        aceita sem nova gravação.
+
+        Args:
+            offset: posição da parte no arquivo
+            conteudo: bytes da parte
+            hash_parte: SHA-256 (hexadecimal) dos bytes da parte
+        """
+        self.ensure_one()
+        # Serializa as partes de um mesmo envio
+        self.env.cr.execute('SELECT id FROM importar_nfe_envio WHERE id = %s FOR UPDATE', (self.id,))
+        self.invalidate_recordset(['bytes_recebidos', 'importacao_id', 'state'])
+        if self.state != 'recebendo':
+            raise UserError(_('O envio não está recebendo partes.'))
+        if hashlib.sha256(conteudo).hexdigest() != (hash_parte or '').lower():
+            raise UserError(_('SHA-256 da parte não confere; envie a parte novamente.'))
+
+        recebidos = int(self.bytes_recebidos)
+        tamanho = int(self.tamanho)
+        esperado = min(self.tamanho_parte, tamanho - offset)
+        if offset < 0 or offset % self.tamanho_parte or offset >= tamanho or len(conteudo) != esperado:
+            raise UserError(_('Parte inválida: as partes têm %s bytes (a última pode ser menor) e começam '
+                              'em múltiplos desse tamanho.') % self.tamanho_parte)
+        if offset + len(conteudo) <= recebidos:
+            return self
+        if offset != recebidos:
+            raise UserError(_('Parte fora de ordem: esperada a posição %s.') % recebidos)
+
+        with open(self._caminho_arquivo(), 'r+b') as arquivo:
+            arquivo.seek(offset)
+            arquivo.write(conteudo)
+            arquivo.truncate()
+        self.write({
+            'bytes_recebidos': offset + len(conteudo),
+            'data_ultima_parte': fields.Datetime.now(),
+        })
+        return self
+
+    def _concluir(self):
+        """Confere o arquivo completo e cria a importação em segundo plano"""
+        self.ensure_one()
+        self.env.cr.execute('SELECT id FROM importar_nfe_envio WHERE id = %s FOR UPDATE', (self.id,))
+        self.invalidate_recordset(['bytes_recebidos', 'importacao_id', 'state'])
+        if self.state != 'recebendo':
+            raise UserError(_('O envio já foi concluído.'))
+        if int(self.bytes_recebidos) != int(self.tamanho):
+            raise UserError(_('Envio incompleto: %s de %s bytes recebidos.')
+                            % (int(self.bytes_recebidos), int(self.tamanho)))
+        if self.hash_conteudo:
+            soma = hashlib.sha256()
+            with open(self._caminho_arquivo(), 'rb') as arquivo:
+                for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+                    soma.update(bloco)
+            if soma.hexdigest() != self.hash_conteudo:
+                raise UserError(_('SHA-256 do arquivo não confere com o informado no início do envio.'))
+        importacao = self.env['importar_nfe.importacao'].create({'envio_id': self.id})
+        importacao._agendar_execucao()
+        return importacao
+
+    def _como_dict(self):
+        """Situação do envio em formato JSON
+
+        O andamento da importação também pode ser acompanhado por
+        /importar_nfe/progresso, com a importação informada aqui.
+        """
+        self.ensure_one()
+        importacao = self.importacao_id
+        return {
+            'envio': self.id,
+            'nome': self.name,
+            'estado': self.state,
+            'tamanho': int(self.tamanho),
+            'tamanho_parte': self.tamanho_parte,
+            'recebido': int(self.bytes_recebidos),
+            'importacao': importacao.id,
+            'importados': importacao.total_importados,
+            'duplicados': importacao.total_duplicados,
+            'erros': importacao.total_erros,
+        }
+
+    def _descartar_arquivo(self):
+        """Remove do filestore os arquivos recebidos (ex.: após a importação)"""
+        for record in self:
+            _remover_arquivo(record._caminho_arquivo())
+
+    def unlink(self):
+        caminhos = [record._caminho_arquivo() for record in self]
+        resultado = super().unlink()
+        for caminho in caminhos:
+            _remover_arquivo(caminho)
+        return resultado
+
+    @api.autovacuum
+    def _gc_envios_abandonados(self):
+        """Remove os envios que não recebem partes há DIAS_ENVIO_ABANDONADO dias"""
+        limite = fields.Datetime.now() - datetime.timedelta(days=DIAS_ENVIO_ABANDONADO)
+        self.search([('importacao_ids', '=', False), ('data_ultima_parte', '<', limite)]).unlink()
+
+
+def _remover_arquivo(caminho):
+    """Remove o arquivo de um envio do filestore, se existir"""
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        _logger.warning("Não foi possível remover o arquivo de envio %s", caminho, exc_info=True)
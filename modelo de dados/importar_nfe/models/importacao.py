@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError, ValidationError
+from ..tools import zip_nfe
+import logging
+import os
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Tempo (segundos) que uma execução do agendador pode gastar iniciando novos lotes
+TEMPO_LIMITE_PADRAO = 60
+
+# Lotes seguidos com erro que interrompem a importação (falha persistente, ex.:
+# banco indisponível); um lote isolado com erro é registrado e pulado
+MAXIMO_LOTES_COM_ERRO_SEGUIDOS = 3
+
+# Lotes seguidos com erro de cada importação em andamento, por _chave_log()
+_lotes_com_erro_seguidos = {}
+
+class ImportarNFeImportacao(models.Model):
+    """Importação de uma pasta de XMLs executada em segundo plano
+
+    A origem também pode ser um arquivo enviado em partes
+    (importar_nfe.envio): os XMLs do ZIP são lidos em streaming e o
+    checkpoint é o último membro do ZIP processado.
+
+    A importação é feita pela tarefa agendada em lotes: ao fim de cada lote a
+    transação é gravada junto com o checkpoint (último arquivo processado).
+    Se o servidor for reiniciado ou a execução interrompida, a próxima
+    execução do agendador continua a partir do checkpoint. Um lote que falha
+    é descartado e pulado (ver _lote_com_erro).
+    """
+    _name = 'importar_nfe.importacao'
+    _inherit = ['importar_nfe.importador']
+    _description = 'Importação de NFe em Segundo Plano'
+    _order = 'id desc'
+
+    name = fields.Char(string='Descrição', required=True, default=lambda self: _('Nova Importação'))
+    pasta_path = fields.Char(string='Caminho da Pasta')
+    envio_id = fields.Many2one('importar_nfe.envio', string='Arquivo Enviado', readonly=True, ondelete='cascade',
+                               help='Arquivo recebido em partes importado no lugar de uma pasta')
+    incluir_subpastas = fields.Boolean(string='Incluir Subpastas', default=True)
+    tamanho_lote = fields.Integer(string='Arquivos por Lote', default=200,
+                                  help='Máximo de arquivos importados entre duas gravações do checkpoint; o tamanho '
+                                       'de cada lote é ajustado pelo tempo e pela memória observados')
+    state = fields.Selection([
+        ('pendente', 'Pendente'),
+        ('executando', 'Em Execução'),
+        ('concluida', 'Concluída'),
+        ('erro', 'Erro'),
+        ('cancelada', 'Cancelada'),
+    ], string='Status', default='pendente', required=True, readonly=True)
+    execucao = fields.Selection([
+        ('agendador', 'Tarefa Agendada'),
+        ('linha_comando', 'Linha de Comando'),
+    ], string='Executada por', default='agendador', required=True, readonly=True,
+        help='Importações da linha de comando (odoo-bin importar_nfe) são executadas pelo próprio '
+             'comando e ignoradas pela tarefa agendada')
+
+    # Checkpoint
+    total_arquivos = fields.Integer(string='Total de Arquivos', readonly=True,
+                                    help='Conhecido ao fim da varredura da pasta')
+    arquivos_processados = fields.Integer(string='Arquivos Processados', readonly=True)
+    ultimo_arquivo = fields.Char(string='Último Arquivo Processado', readonly=True)
+    progresso = fields.Float(string='Progresso (%)', compute='_compute_progresso')
+
+    data_inicio = fields.Datetime(string='Início', readonly=True)
+    data_fim = fields.Datetime(string='Fim', readonly=True)
+
+    @api.depends('state', 'total_arquivos', 'arquivos_processados')
+    def _compute_progresso(self):
+        for record in self:
+            if record.state == 'concluida':
+                record.progresso = 100.0
+            elif record.total_arquivos:
+                record.progresso = 100.0 * record.arquivos_processados / record.total_arquivos
+            else:
+                record.progresso = 0.0
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals.get('name', _('Nova Importação')) != _('Nova Importação'):
+                continue
+            if vals.get('pasta_path'):
+                vals['name'] = _('Importação de %s') % vals['pasta_path']
+            elif vals.get('envio_id'):
+                vals['name'] = _('Importação de %s') % self.env['importar_nfe.envio'].browse(vals['envio_id']).name
+        return super().create(vals_list)
+
+    @api.constrains('pasta_path', 'envio_id')
+    def _check_origem(self):
+        for record in self:
+            if not record.pasta_path and not record.envio_id:
+                raise ValidationError(_('Informe a pasta a importar.'))
+
+    def _agendar_execucao(self):
+        """Dispara a tarefa agendada de importação o quanto antes"""
+        self.env.ref('importar_nfe.ir_cron_importar_nfe_pasta').sudo()._trigger()
+
+    def action_retomar(self):
+        """Recoloca a importação na fila, continuando do último checkpoint"""
+        for record in self:
+            if record.state not in ('erro', 'cancelada'):
+                raise UserError(_('Apenas importações com erro ou canceladas podem ser retomadas.'))
+        self.write({'state': 'pendente', 'data_fim': False, 'execucao': 'agendador'})
+        self._agendar_execucao()
+
+    def action_cancelar(self):
+        """Cancela a importação; o lote em andamento é concluído antes de parar"""
+        for record in self:
+            if record.state not in ('pendente', 'executando'):
+                raise UserError(_('Apenas importações pendentes ou em execução podem ser canceladas.'))
+        self.write({'state': 'cancelada', 'data_fim': fields.Datetime.now()})
+
+    @api.model
+    def _cron_processar_importacoes(self):
+        """Tarefa agendada: processa as importações pendentes ou interrompidas
+
+        Cada execução inicia lotes até o tempo limite
+        (parâmetro importar_nfe.importacao_tempo_limite) e, se ainda houver
+        trabalho, agenda a próxima execução imediatamente.
+        """
+        tempo_limite = int(self.env['ir.config_parameter'].sudo().get_param(
+            'importar_nfe.importacao_tempo_limite', TEMPO_LIMITE_PADRAO))
+        prazo = time.monotonic() + tempo_limite
+
+        dominio = [('state', 'in', ('pendente', 'executando')), ('execucao', '=', 'agendador')]
+        for importacao in self.search(dominio, order='id'):
+            if time.monotonic() >= prazo:
+                break
+            # Importar com as permissões de quem criou a importação
+            importacao.with_user(importacao.create_uid).with_context(prazo_importacao=prazo)._executar()
+
+        if self.search_count(dominio):
+            self._agendar_execucao()
+
+    def _executar(self):
+        """Importa os arquivos da pasta a partir do checkpoint, gravando a cada lote"""
+        self.ensure_one()
+        _lotes_com_erro_seguidos.pop(self._chave_log(), None)
+        if self.state == 'pendente':
+            self.write({'state': 'executando', 'data_inicio': self.data_inicio or fields.Datetime.now()})
+            if self.envio_id:
+                self._adicionar_log(f'Iniciando importação do arquivo enviado: {self.envio_id.name}')
+            else:
+                self._adicionar_log(f'Iniciando importação da pasta: {self.pasta_path}')
+
+        try:
+            if self.envio_id:
+                if not os.path.isfile(self.envio_id._caminho_arquivo()):
+                    raise UserError(_('O arquivo enviado não está mais disponível.'))
+            elif not os.path.isdir(self.pasta_path):
+                raise UserError(_('A pasta especificada não existe.'))
+
+            # Retomar logo após o último arquivo processado: a varredura, em ordem
+            # alfabética, nem lista as subpastas que ficaram para trás; no ZIP
+            # enviado, os membros anteriores são pulados sem serem lidos
+            inicio = self.arquivos_processados if self.ultimo_arquivo else 0
+            if inicio:
+                self._adicionar_log(f'Retomando após o arquivo {inicio}: {self.ultimo_arquivo}')
+            self._gravar_log()
+            self.env.cr.commit()
+
+            if self.envio_id:
+                self._importar_conteudos(self._conteudos_envio(apos=self.ultimo_arquivo or None),
+                                         self.tamanho_lote or 200, offset_inicial=inicio)
+            else:
+                arquivos_xml = self._percorrer_arquivos_pasta(self.pasta_path, self.incluir_subpastas,
+                                                              apos=self.ultimo_arquivo or None)
+                self._importar_em_lotes(arquivos_xml, inicio, self.tamanho_lote or 200,
+                                        total_estimado=self._total_estimado())
+        except Exception as e:
+            _logger.error("Erro na importação %s: %s", self.id, str(e), exc_info=True)
+            self.env.cr.rollback()
+            self.env.invalidate_all()
+            self._descartar_log()
+            self._progresso_finalizar('erro')
+            self._adicionar_log(f'Erro na importação: {str(e)}', 'erro')
+            self._gravar_log()
+            self.write({'state': 'erro', 'data_fim': fields.Datetime.now()})
+            self.env.cr.commit()
+            return
+
+        # Sem interrupção, a importação só termina quando a varredura acaba
+        if self.state == 'executando' and not self._interromper_importacao():
+            self.write({
+                'state': 'concluida',
+                'data_fim': fields.Datetime.now(),
+                'total_arquivos': self.arquivos_processados,
+            })
+        self._gravar_log()
+        self.env.cr.commit()
+        if self.state == 'concluida' and self.envio_id:
+            # O arquivo recebido não é mais necessário
+            self.envio_id._descartar_arquivo()
+
+    def _conteudos_envio(self, apos=None):
+        """Gera (nome, conteudo, erro) dos XMLs do arquivo enviado, a partir do checkpoint
+
+        Args:
+            apos: nome do último XML já processado (ultimo_arquivo)
+        """
+        nome = self.envio_id.name
+        with open(self.envio_id._caminho_arquivo(), 'rb') as arquivo:
+            if zip_nfe.eh_zip(arquivo):
+                yield from zip_nfe.iterar_xmls_zip(arquivo, nome + '/', apos=apos)
+            elif not apos:
+                yield from self._conteudos_recebidos([(nome, arquivo)])
+
+    def _total_estimado(self):
+        """Quantidade de arquivos esperada, pela última importação concluída da mesma pasta
+        
+        A varredura em streaming só conhece o total ao terminar; para
+        sincronizações periódicas da mesma pasta, o total anterior é uma boa
+        estimativa para o tempo restante exibido no progresso.
+        """
+        if not self.pasta_path:
+            return None
+        anterior = self.search([
+            ('id', '!=', self.id),
+            ('pasta_path', '=', self.pasta_path),
+            ('incluir_subpastas', '=', self.incluir_subpastas),
+            ('state', '=', 'concluida'),
+        ], limit=1)
+        return anterior.total_arquivos or None
+
+    def _interromper_importacao(self):
+        """Para ao atingir o tempo limite da execução ou se a importação foi cancelada"""
+        prazo = self.env.context.get('prazo_importacao')
+        if prazo and time.monotonic() >= prazo:
+            return True
+        self.invalidate_recordset(['state'])
+        return self.state != 'executando'
+
+    def _lote_concluido(self, lote, arquivos_processados):
+        """Grava o checkpoint junto com as NFes do lote"""
+        _lotes_com_erro_seguidos.pop(self._chave_log(), None)
+        self.write({
+            'arquivos_processados': arquivos_processados,
+            'ultimo_arquivo': lote[-1],
+        })
+        return super()._lote_concluido(lote, arquivos_processados)
+
+    def _lote_com_erro(self, lote, erro):
+        """Descarta o lote com erro e continua a importação após ele
+
+        Os arquivos do lote entram no registro de arquivos importados com
+        resultado 'erro' (e são tentados de novo na próxima importação da
+        pasta) e o checkpoint avança para depois do lote. Após
+        MAXIMO_LOTES_COM_ERRO_SEGUIDOS lotes seguidos com erro, a importação é
+        interrompida no último checkpoint.
+        """
+        super()._lote_com_erro(lote, erro)
+        chave = self._chave_log()
+        seguidos = _lotes_com_erro_seguidos.get(chave, 0) + 1
+        if seguidos >= MAXIMO_LOTES_COM_ERRO_SEGUIDOS:
+            _lotes_com_erro_seguidos.pop(chave, None)
+            raise erro
+        _lotes_com_erro_seguidos[chave] = seguidos
+
+        registro_arquivos = self.env['importar_nfe.arquivo_importado']
+        resultados = {}
+        for arquivo in lote:
+            estado = registro_arquivos._estado_arquivo(arquivo)
+            if estado:
+                resultados[arquivo] = {
+                    'tamanho': estado[0],
+                    'data_modificacao': estado[1],
+                    'resultado': 'erro',
+                    'nfe_id': False,
+                }
+        registro_arquivos._registrar(resultados)
+
+        # Após o rollback, o checkpoint é o do último lote gravado
+        self.total_erros += len(lote)
+        self.write({
+            'arquivos_processados': self.arquivos_processados + len(lote),
+            'ultimo_arquivo': lote[-1],
+        })
+        self._adicionar_log(f'Lote descartado: {len(lote)} arquivos registrados com erro, de '
+                            f'{os.path.basename(lote[0])} a {os.path.basename(lote[-1])}; '
+                            f'a importação continua no próximo lote', 'erro')
+        self._gravar_log()
+        self.env.cr.commit()
+        return True
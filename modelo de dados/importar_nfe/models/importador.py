@@ -0,0 +1,785 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.tools import config
+from ..tools import nfe_parser, varredura, dimensionamento, zip_nfe
+import os
+import logging
+import datetime
+import gc
+import html
+import itertools
+import multiprocessing
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+_logger = logging.getLogger(__name__)
+
+# Arquivos enviados de uma vez a cada processo de leitura no modo paralelo
+ARQUIVOS_POR_TAREFA = 16
+
+# Eventos mais recentes exibidos no campo de log do formulário
+LINHAS_LOG_EXIBIDAS = 200
+
+_CORES_NIVEL_LOG = {
+    'sucesso': 'green',
+    'aviso': 'darkorange',
+    'erro': 'red',
+}
+
+# Eventos do log ainda não gravados, por (banco, modelo, id) do importador
+_logs_pendentes = {}
+
+# Intervalo mínimo (segundos) entre duas gravações do progresso
+INTERVALO_PROGRESSO = 2.0
+
+# Progresso das importações em andamento, por (banco, modelo, id) do importador
+_progressos = {}
+
+# Fração do limite flexível de memória dos workers (limit_memory_soft) usada como
+# teto da importação quando o parâmetro importar_nfe.limite_memoria_mb não existe
+FRACAO_LIMITE_WORKER = 0.8
+
+class ImportadorNFe(models.AbstractModel):
+    """Importação de arquivos XML de NFe em lotes
+    
+    Base comum do wizard de importação e das importações em segundo plano:
+    contadores, log, verificação de duplicados pela chave, leitura paralela
+    e o laço de lotes, com pontos de extensão para interromper a importação
+    e para agir ao fim de cada lote (ex.: gravar um checkpoint).
+    
+    Cada arquivo é importado dentro de um savepoint e cada lote é gravado
+    (commit) ao terminar: um XML com problema desfaz apenas a própria
+    importação, e uma falha do banco no meio do lote descarta apenas o lote.
+    """
+    _name = 'importar_nfe.importador'
+    _description = 'Importador de Arquivos de NFe'
+
+    modificados_desde = fields.Datetime(string='Somente Modificados Desde',
+                                        help='Na importação por pasta, considera apenas os arquivos modificados '
+                                             'a partir desta data')
+    processos_leitura = fields.Integer(string='Processos de Leitura', default=1,
+                                       help='Quantidade de processos que leem e interpretam os XMLs em paralelo '
+                                            'na importação por pasta; as gravações no banco continuam em um único '
+                                            'processo. Use 1 para leitura sequencial.')
+    
+    # Campos informativos
+    total_importados = fields.Integer(string='Total Importados', readonly=True, default=0)
+    total_erros = fields.Integer(string='Total Erros', readonly=True, default=0)
+    total_duplicados = fields.Integer(string='Total Já Importados', readonly=True, default=0,
+                                      help='Arquivos ignorados antes da leitura por já existir NFe com a mesma chave '
+                                           'ou por estarem inalterados desde a última importação')
+    mensagem_log = fields.Html(string='Log de Importação', compute='_compute_mensagem_log', sanitize=False,
+                               help='Eventos mais recentes do log de importação')
+    total_eventos_log = fields.Integer(string='Eventos no Log', compute='_compute_mensagem_log')
+
+    def _compute_mensagem_log(self):
+        log_model = self.env['importar_nfe.log_importacao'].sudo()
+        for record in self:
+            if not isinstance(record.id, int):
+                record.mensagem_log = False
+                record.total_eventos_log = 0
+                continue
+            dominio = [('res_model', '=', record._name), ('res_id', '=', record.id)]
+            eventos = log_model.search_read(dominio, ['data', 'nivel', 'mensagem', 'arquivo'],
+                                            order='id desc', limit=LINHAS_LOG_EXIBIDAS)
+            record.total_eventos_log = log_model.search_count(dominio) if len(eventos) == LINHAS_LOG_EXIBIDAS else len(eventos)
+            linhas = []
+            for evento in reversed(eventos):
+                horario = fields.Datetime.context_timestamp(record, evento['data']).strftime('%H:%M:%S')
+                texto = html.escape(f"[{horario}] {evento['mensagem']}")
+                cor = _CORES_NIVEL_LOG.get(evento['nivel'])
+                linhas.append(f'<span style="color: {cor};">{texto}</span>' if cor else texto)
+            record.mensagem_log = '<br/>'.join(linhas) if linhas else False
+
+    def _chave_log(self):
+        return (self.env.cr.dbname, self._name, self.id)
+
+    def _adicionar_log(self, mensagem, nivel='info', arquivo=None):
+        """Registra um evento no log de importação
+        
+        O evento é acumulado em memória e gravado junto com os demais, em uma
+        única inserção, por _gravar_log (ao fim de cada lote e da importação).
+        
+        Args:
+            mensagem: texto do evento
+            nivel: 'info', 'sucesso', 'aviso' ou 'erro'
+            arquivo: nome do arquivo a que o evento se refere
+        """
+        _logs_pendentes.setdefault(self._chave_log(), []).append({
+            'res_model': self._name,
+            'res_id': self.id,
+            'data': fields.Datetime.now(),
+            'nivel': nivel,
+            'mensagem': mensagem,
+            'arquivo': arquivo,
+        })
+        _logger.info(mensagem)
+
+    def _gravar_log(self):
+        """Grava no banco os eventos do log acumulados em memória"""
+        eventos = _logs_pendentes.pop(self._chave_log(), None)
+        if eventos:
+            self.env['importar_nfe.log_importacao'].sudo().create(eventos)
+
+    def _descartar_log(self):
+        """Descarta os eventos não gravados (ex.: após o rollback de um lote)"""
+        _logs_pendentes.pop(self._chave_log(), None)
+
+    def _limpar_log(self):
+        """Remove o log gravado e pendente do registro"""
+        self._descartar_log()
+        self.env['importar_nfe.log_importacao'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', 'in', self.ids),
+        ]).unlink()
+
+    def _progresso_iniciar(self, total_estimado=None, arquivos_processados=0):
+        """Começa a publicar o progresso da importação
+        
+        Args:
+            total_estimado: quantidade esperada de arquivos, se conhecida (para o tempo restante)
+            arquivos_processados: arquivos já processados antes desta execução (retomada)
+        """
+        _progressos[self._chave_log()] = {
+            'data_inicio': fields.Datetime.now(),
+            'arquivos_retomados': arquivos_processados,
+            'arquivos_encontrados': arquivos_processados,
+            'arquivos_processados': arquivos_processados,
+            'arquivos_lidos': 0,
+            'total_estimado': total_estimado or 0,
+            'gravado_em': 0.0,
+        }
+        self._progresso_gravar()
+    
+    def _progresso_registrar(self, processados=None, encontrados=None, lidos=0):
+        """Atualiza o progresso em memória e o publica a cada INTERVALO_PROGRESSO segundos
+        
+        Args:
+            processados: posição do último arquivo processado
+            encontrados: quantidade de arquivos já obtidos da origem (varredura, ZIP)
+            lidos: incremento de arquivos lidos e interpretados
+        """
+        progresso = _progressos.get(self._chave_log())
+        if progresso is None:
+            return
+        if processados is not None:
+            progresso['arquivos_processados'] = processados
+        if encontrados is not None:
+            progresso['arquivos_encontrados'] = encontrados
+        progresso['arquivos_lidos'] += lidos
+        if time.monotonic() - progresso['gravado_em'] >= INTERVALO_PROGRESSO:
+            self._progresso_gravar()
+    
+    def _progresso_finalizar(self, estado):
+        """Publica o estado final da importação ('concluida', 'parcial' ou 'erro')"""
+        if self._chave_log() in _progressos:
+            self._progresso_gravar(estado)
+            _progressos.pop(self._chave_log(), None)
+    
+    def _progresso_gravar(self, estado='executando'):
+        """Grava o progresso em um cursor próprio e o envia pelo bus
+        
+        O cursor separado torna o progresso visível imediatamente, sem
+        depender do commit do lote, e não bloqueia o registro da importação.
+        """
+        progresso = _progressos[self._chave_log()]
+        progresso['gravado_em'] = time.monotonic()
+        try:
+            valores = {
+                'res_model': self._name,
+                'res_id': self.id,
+                'estado': estado,
+                'total_importados': self.total_importados,
+                'total_duplicados': self.total_duplicados,
+                'total_erros': self.total_erros,
+                'data_atualizacao': fields.Datetime.now(),
+            }
+            valores.update({campo: valor for campo, valor in progresso.items() if campo != 'gravado_em'})
+            with self.env.registry.cursor() as cr:
+                env = api.Environment(cr, self.env.uid, self.env.context)
+                env['importar_nfe.progresso_importacao'].sudo()._atualizar(valores)
+        except Exception:
+            # O progresso é apenas informativo: uma falha aqui não interrompe a importação
+            _logger.warning("Não foi possível gravar o progresso da importação %s,%s", self._name, self.id,
+                            exc_info=True)
+    
+    def action_ver_log(self):
+        """Abre o log completo da importação"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Log de Importação'),
+            'res_model': 'importar_nfe.log_importacao',
+            'view_mode': 'list',
+            'domain': [('res_model', '=', self._name), ('res_id', '=', self.id)],
+            'target': 'current',
+        }
+
+    def _importar_xml_seguro(self, xml_content, nome_arquivo='', dados=None, cadastros=None, chaves_novas=None):
+        """Importa um XML de forma segura, tratando exceções
+        
+        A importação é feita em um savepoint: se falhar, apenas o que foi
+        gravado para este arquivo é desfeito e o cursor continua utilizável
+        para os demais arquivos do lote.
+        
+        Args:
+            xml_content: bytes originais do XML
+            nome_arquivo: nome exibido no log
+            dados: nfe_parser.NFeDados já lido (ex.: em um processo de
+                leitura); se omitido, o XML é lido aqui
+            cadastros: ids de emitentes, destinatários e produtos resolvidos
+                para o lote (ver _resolver_cadastros_lote)
+            chaves_novas: chaves que o lote já conferiu não estarem importadas
+        """
+        return self._tentar_importar_xml(xml_content, nome_arquivo, dados, cadastros, chaves_novas)[0]
+    
+    def _tentar_importar_xml(self, xml_content, nome_arquivo='', dados=None, cadastros=None, chaves_novas=None):
+        """Como _importar_xml_seguro, mas devolve também a mensagem de erro
+        
+        Returns:
+            tupla (nfe, erro): a NFe importada e None, ou False e a mensagem de erro
+        """
+        try:
+            nfe_model = self.env['importar_nfe.nfe']
+            with self.env.cr.savepoint():
+                if dados is not None:
+                    nfe = nfe_model.importar_dados_lidos(dados, xml_content, disable_messaging=True,
+                                                         cadastros=cadastros, chaves_novas=chaves_novas)
+                else:
+                    # Leitura em streaming: o XML é percorrido uma única vez, sem montar a árvore
+                    # Passar parâmetro para desativar mensagens durante importações em massa
+                    nfe = nfe_model.importar_xml_stream(xml_content, disable_messaging=True)
+            self.total_importados += 1
+            self._adicionar_log(f'Arquivo {nome_arquivo} importado com sucesso: NFe {nfe.name} - Chave {nfe.chave_acesso}',
+                                'sucesso', nome_arquivo)
+            return nfe, None
+        except Exception as e:
+            self._registrar_erro_arquivo(nome_arquivo, str(e), exc_info=True)
+            return False, str(e)
+    
+    def _resolver_cadastros_lote(self, lista_dados):
+        """Resolve os emitentes, destinatários e produtos de todas as NFes do lote
+        
+        Substitui as buscas feitas NFe a NFe e item a item por uma consulta
+        e um create por modelo. Se a resolução falhar (ex.: cadastro criado
+        ao mesmo tempo por outra importação), nada dela é mantido e cada NFe
+        resolve os próprios cadastros, no seu savepoint.
+        
+        Returns:
+            mapas de ids (ver importar_nfe.nfe._resolver_cadastros) ou None
+        """
+        if not lista_dados:
+            return None
+        try:
+            with self.env.cr.savepoint():
+                return self.env['importar_nfe.nfe']._resolver_cadastros(lista_dados)
+        except Exception as e:
+            _logger.warning("Cadastros do lote não resolvidos de uma vez; resolvendo por NFe: %s", str(e))
+            return None
+    
+    def _registrar_erro_arquivo(self, nome_arquivo, erro_msg, exc_info=False):
+        """Contabiliza e registra no log a falha de importação de um arquivo"""
+        self.total_erros += 1
+        self._adicionar_log(f'Erro ao importar arquivo {nome_arquivo}: {erro_msg}', 'erro', nome_arquivo)
+        _logger.error(f"Erro ao importar arquivo {nome_arquivo}: {erro_msg}", exc_info=exc_info)
+    
+    def _percorrer_arquivos_pasta(self, pasta_path, incluir_subpastas=True, apos=None):
+        """Gera os arquivos XML da pasta à medida que são encontrados
+        
+        As entradas de cada diretório são visitadas em ordem alfabética; a
+        ordem fixa permite retomar uma importação logo após o último arquivo
+        processado (apos).
+        """
+        modificados_desde = None
+        if self.modificados_desde:
+            modificados_desde = self.modificados_desde.replace(tzinfo=datetime.timezone.utc).timestamp()
+        return varredura.percorrer_pasta(pasta_path, incluir_subpastas,
+                                         modificados_desde=modificados_desde, apos=apos)
+    
+    def _interromper_importacao(self):
+        """Indica se a importação em lotes deve parar antes do próximo lote"""
+        return False
+    
+    def _lote_concluido(self, lote, arquivos_processados):
+        """Chamado ao fim de cada lote importado; grava o lote no banco
+        
+        Args:
+            lote: caminhos dos arquivos do lote
+            arquivos_processados: total de arquivos processados, incluindo este lote
+        """
+        self._gravar_log()
+        self.env.cr.commit()
+        return True
+    
+    def _lote_com_erro(self, lote, erro):
+        """Chamado quando um lote falha
+        
+        Por padrão o lote é descartado (rollback até o último lote gravado)
+        e a importação segue no próximo lote.
+        """
+        self.env.cr.rollback()
+        self.env.invalidate_all()
+        self._descartar_log()
+        return True
+    
+    def _importar_em_lotes(self, arquivos_xml, offset_inicial=0, tamanho_lote=1000, total_estimado=None):
+        """Importa arquivos XML em lotes para melhor gerenciamento de memória e performance
+        
+        Os caminhos são consumidos sob demanda: com a varredura da pasta em
+        streaming, a importação começa assim que o primeiro lote é encontrado.
+        
+        Args:
+            arquivos_xml: iterável com os caminhos dos arquivos a importar
+            offset_inicial: quantidade de arquivos já processados antes destes (retomada)
+            tamanho_lote: maior quantidade de arquivos por lote; o tamanho de
+                cada lote é ajustado pelo tempo e pela memória observados
+                (ver _criar_dimensionador_lote)
+            total_estimado: quantidade esperada de arquivos, se conhecida,
+                usada para estimar o tempo restante no progresso
+        
+        Returns:
+            ids das NFes importadas (ou já existentes) nos lotes processados
+        """
+        arquivos_xml = iter(arquivos_xml)
+        dimensionador = self._criar_dimensionador_lote(tamanho_lote)
+        
+        self._adicionar_log(f'Iniciando importação em lotes de até {dimensionador.maximo} arquivos')
+        
+        nfes_importadas = []
+        lotes_processados = 0
+        lotes_com_erro = 0
+        arquivos_processados = offset_inicial
+        concluida = False
+        
+        # Processos de leitura (modo paralelo), reutilizados por todos os lotes
+        executor = self._criar_executor_leitura()
+        self._progresso_iniciar(total_estimado, offset_inicial)
+        try:
+            # Processar cada lote
+            for num_lote in itertools.count(1):
+                if self._interromper_importacao():
+                    self._adicionar_log(f'Importação interrompida após {lotes_processados} lotes', 'aviso')
+                    break
+                
+                lote_atual = list(itertools.islice(arquivos_xml, dimensionador.tamanho))
+                if not lote_atual:
+                    concluida = True
+                    break
+                memoria_antes = dimensionamento.memoria_em_uso()
+                inicio_medicao = time.monotonic()
+                
+                inicio_lote = arquivos_processados
+                arquivos_processados += len(lote_atual)
+                self._progresso_registrar(encontrados=arquivos_processados)
+                
+                # Informações sobre o lote
+                self._adicionar_log(f'Processando lote {num_lote}: arquivos {inicio_lote + 1} a {arquivos_processados}')
+                
+                try:
+                    # Processar arquivos do lote atual
+                    nfes_lote = self._processar_lote(lote_atual, inicio_lote, executor)
+                    
+                    # Adicionar resumo do lote
+                    self._adicionar_log(f'Lote {num_lote} concluído com sucesso: {len(nfes_lote)} NFes no lote, '
+                                        f'{len(nfes_importadas) + len(nfes_lote)} até agora', 'sucesso')
+                    
+                    # Gravar o lote; se o commit falhar, o lote é tratado como erro
+                    self._lote_concluido(lote_atual, arquivos_processados)
+                    nfes_importadas.extend(nfes_lote)
+                    lotes_processados += 1
+                    self._progresso_registrar(processados=arquivos_processados)
+                    
+                    # Ajustar o próximo lote e liberar memória apenas perto do teto
+                    self._medir_lote(dimensionador, len(lote_atual), inicio_medicao, memoria_antes)
+                    
+                except Exception as e:
+                    _logger.error(f"Erro ao processar lote {num_lote}: {str(e)}", exc_info=True)
+                    lotes_com_erro += 1
+                    self._lote_com_erro(lote_atual, e)
+                    
+                    # Adicionar informação do erro
+                    self._adicionar_log(f'Erro no lote {num_lote}: {str(e)}', 'erro')
+        except Exception:
+            self._progresso_finalizar('erro')
+            raise
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        
+        # Resumo final
+        self._adicionar_log(
+            f'{"Importação concluída" if concluida and not lotes_com_erro else "Importação parcial"}: '
+            f'{lotes_processados} lotes, {arquivos_processados} arquivos, {len(nfes_importadas)} NFes; '
+            f'sucessos: {self.total_importados}, erros: {self.total_erros}, '
+            f'já importados (ignorados): {self.total_duplicados}',
+            'sucesso' if concluida and not lotes_com_erro else 'aviso')
+        self._gravar_log()
+        self._progresso_finalizar('concluida' if concluida and not lotes_com_erro else 'parcial')
+        
+        return nfes_importadas
+    
+    def _chave_do_arquivo(self, caminho):
+        """Obtém a chave de acesso de um arquivo sem parsear o XML
+        
+        Usa a convenção de nome (<chave>-nfe.xml) e, se não houver chave no
+        nome, o Id do infNFe nos primeiros bytes do arquivo. Apenas chaves com
+        dígito verificador válido são aceitas, para que um nome de arquivo
+        qualquer com 44 dígitos não descarte uma NFe nova.
+        """
+        chave = nfe_parser.chave_do_nome(os.path.basename(caminho))
+        if nfe_parser.chave_valida(chave):
+            return chave
+        try:
+            with open(caminho, 'rb') as f:
+                chave = nfe_parser.farejar_chave(f.read(nfe_parser.TAMANHO_CABECALHO))
+        except OSError:
+            # O erro de leitura é tratado na importação do arquivo
+            return None
+        return chave if nfe_parser.chave_valida(chave) else None
+    
+    def _chave_do_conteudo(self, nome, conteudo):
+        """Obtém a chave de acesso de um XML já em memória, sem parseá-lo
+        
+        Mesmo critério de _chave_do_arquivo: chave no nome ou Id do infNFe
+        no início do conteúdo, aceitas apenas com dígito verificador válido.
+        """
+        chave = nfe_parser.chave_do_nome(os.path.basename(nome))
+        if nfe_parser.chave_valida(chave):
+            return chave
+        chave = nfe_parser.farejar_chave(conteudo[:nfe_parser.TAMANHO_CABECALHO])
+        return chave if nfe_parser.chave_valida(chave) else None
+    
+    def _importar_conteudos(self, conteudos, tamanho_lote=200, total_estimado=None, resultados=None,
+                            offset_inicial=0):
+        """Importa, em lotes, XMLs lidos de outra origem que não uma pasta
+        
+        Os conteúdos são consumidos sob demanda (ex.: membros de um ZIP lidos
+        em streaming): apenas os XMLs do lote atual ficam em memória. Cada
+        lote é gravado ao terminar, como na importação por pasta.
+        
+        Args:
+            conteudos: iterável de tuplas (nome, conteudo, erro); quando erro
+                é informado, o item é contabilizado como erro sem importação
+            tamanho_lote: maior quantidade de XMLs por lote (ajustada como
+                em _importar_em_lotes)
+            total_estimado: quantidade esperada de XMLs, se conhecida
+            resultados: lista opcional que recebe o resultado de cada XML
+                (ver _processar_conteudos), incluída apenas depois que o
+                lote é gravado; os XMLs de um lote descartado constam como erro
+            offset_inicial: quantidade de XMLs já processados antes destes (retomada)
+        
+        Returns:
+            ids das NFes importadas (ou já existentes)
+        """
+        nfes_importadas = []
+        conteudos = iter(conteudos)
+        processados = offset_inicial
+        num_lote = 0
+        lotes_com_erro = 0
+        interrompida = False
+        dimensionador = self._criar_dimensionador_lote(tamanho_lote)
+        self._progresso_iniciar(total_estimado, offset_inicial)
+        try:
+            while True:
+                if self._interromper_importacao():
+                    self._adicionar_log(f'Importação interrompida após {num_lote} lotes', 'aviso')
+                    interrompida = True
+                    break
+                lote = list(itertools.islice(conteudos, dimensionador.tamanho))
+                if not lote:
+                    break
+                memoria_antes = dimensionamento.memoria_em_uso()
+                inicio_medicao = time.monotonic()
+                num_lote += 1
+                inicio_lote = processados
+                processados += len(lote)
+                self._progresso_registrar(encontrados=processados)
+                nomes = [nome for nome, _conteudo, _erro in lote]
+                resultados_lote = [] if resultados is not None else None
+                try:
+                    nfes_lote = self._processar_conteudos(lote, inicio_lote, resultados_lote)
+                    self._adicionar_log(f'Lote {num_lote} concluído: {processados} arquivos lidos, '
+                                        f'{len(nfes_importadas) + len(nfes_lote)} NFes até agora', 'sucesso')
+                    self._lote_concluido(nomes, processados)
+                    nfes_importadas.extend(nfes_lote)
+                    if resultados is not None:
+                        resultados.extend(resultados_lote)
+                    self._progresso_registrar(processados=processados)
+                    self._medir_lote(dimensionador, len(lote), inicio_medicao, memoria_antes)
+                except Exception as e:
+                    _logger.error(f"Erro ao processar lote {num_lote}: {str(e)}", exc_info=True)
+                    lotes_com_erro += 1
+                    if resultados is not None:
+                        resultados.extend({'arquivo': nome, 'resultado': 'erro', 'nfe_id': False,
+                                           'erro': _('Lote descartado: %s') % str(e)} for nome in nomes)
+                    self._lote_com_erro(nomes, e)
+                    self._adicionar_log(f'Erro no lote {num_lote}: {str(e)}', 'erro')
+        except Exception:
+            self._progresso_finalizar('erro')
+            raise
+        self._gravar_log()
+        self._progresso_finalizar('parcial' if lotes_com_erro or interrompida else 'concluida')
+        return nfes_importadas
+    
+    def _conteudos_recebidos(self, arquivos):
+        """Gera (nome, conteudo, erro) dos XMLs recebidos, expandindo os ZIPs em streaming
+        
+        Args:
+            arquivos: iterável de tuplas (nome, arquivo binário com seek), com
+                XMLs ou ZIPs; no lugar do arquivo, uma exceção indica que ele
+                não pôde ser aberto
+        """
+        for nome, arquivo in arquivos:
+            if isinstance(arquivo, Exception):
+                yield nome, None, _('Arquivo inválido: %s') % str(arquivo)
+                continue
+            try:
+                if zip_nfe.eh_zip(arquivo):
+                    yield from zip_nfe.iterar_xmls_zip(arquivo, nome + '/')
+                    continue
+                conteudo = arquivo.read(zip_nfe.TAMANHO_MAXIMO_XML + 1)
+            except (zipfile.BadZipFile, OSError) as e:
+                yield nome, None, str(e)
+                continue
+            if len(conteudo) > zip_nfe.TAMANHO_MAXIMO_XML:
+                yield nome, None, f'XML maior que o limite de {zip_nfe.TAMANHO_MAXIMO_XML // (1024 * 1024)} MB'
+                continue
+            yield nome, conteudo, None
+    
+    def _processar_conteudos(self, lote, offset_inicial=0, resultados=None):
+        """Importa um lote de XMLs em memória, ignorando as chaves já importadas
+        
+        Args:
+            lote: lista de tuplas (nome, conteudo, erro)
+            offset_inicial: quantidade de XMLs processados antes deste lote
+            resultados: lista opcional que recebe, para cada XML, um dicionário
+                com arquivo, resultado ('importado', 'duplicado' ou 'erro'),
+                nfe_id e erro
+        """
+        def registrar(nome, resultado, nfe_id=False, erro=False):
+            if resultados is not None:
+                resultados.append({'arquivo': nome, 'resultado': resultado, 'nfe_id': nfe_id, 'erro': erro})
+        
+        nfes_lote = []
+        chaves = [self._chave_do_conteudo(nome, conteudo) if conteudo is not None else None
+                  for nome, conteudo, _erro in lote]
+        consultadas = {chave for chave in chaves if chave}
+        existentes = self.env['importar_nfe.nfe']._chaves_existentes(consultadas)
+        # Chaves conferidas e ausentes do banco: a importação não as busca de novo
+        chaves_novas = consultadas - set(existentes)
+        duplicados_lote = 0
+        
+        # Os XMLs novos são lidos antes da gravação, para resolver os cadastros do lote de uma vez
+        leituras = [nfe_parser.ler_conteudo(conteudo) if not erro and not existentes.get(chave) else None
+                    for (_nome, conteudo, erro), chave in zip(lote, chaves)]
+        cadastros = self._resolver_cadastros_lote(
+            [leitura[0] for leitura in leituras if leitura and leitura[0]])
+        
+        for i, ((nome, conteudo, erro), chave, leitura) in enumerate(zip(lote, chaves, leituras)):
+            self._progresso_registrar(processados=offset_inicial + i)
+            if leitura and leitura[1]:
+                erro = _('Erro ao importar XML: %s') % leitura[1]
+            if erro:
+                self._registrar_erro_arquivo(nome, erro)
+                registrar(nome, 'erro', erro=erro)
+                continue
+            nfe_id = existentes.get(chave)
+            if nfe_id:
+                nfes_lote.append(nfe_id)
+                duplicados_lote += 1
+                registrar(nome, 'duplicado', nfe_id)
+                continue
+            self._progresso_registrar(lidos=1)
+            nfe, erro = self._tentar_importar_xml(conteudo, nome, leitura[0], cadastros, chaves_novas)
+            if nfe:
+                nfes_lote.append(nfe.id)
+                existentes[nfe.chave_acesso] = nfe.id
+                chaves_novas.discard(nfe.chave_acesso)
+                registrar(nome, 'importado', nfe.id)
+            else:
+                registrar(nome, 'erro', erro=erro)
+        
+        if duplicados_lote:
+            self.total_duplicados += duplicados_lote
+            self._adicionar_log(f'{duplicados_lote} arquivos já importados ignorados no lote')
+        return nfes_lote
+    
+    def _criar_executor_leitura(self):
+        """Cria o pool de processos de leitura, ou None se a leitura for sequencial
+        
+        Os processos são criados por fork: herdam os módulos já carregados e
+        executam apenas nfe_parser.ler_arquivo, sem acesso ao banco de dados.
+        """
+        processos = min(self.processos_leitura or 1, os.cpu_count() or 1)
+        if processos <= 1:
+            return None
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            self._adicionar_log('Leitura paralela indisponível nesta plataforma; usando leitura sequencial', 'aviso')
+            return None
+        self._adicionar_log(f'Leitura paralela com {processos} processos')
+        return ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context('fork'))
+    
+    def _processar_lote(self, arquivos_lote, offset_inicial, executor=None):
+        """Processa um lote de arquivos XML
+        
+        Arquivos que constam no registro de arquivos importados com o mesmo
+        tamanho e data de modificação são ignorados apenas pelo stat. Dos
+        demais, as chaves de acesso são obtidas sem parsear os XMLs e
+        confrontadas com as NFes existentes em uma única consulta; arquivos
+        já importados são ignorados antes de qualquer leitura do XML. O
+        resultado de cada arquivo é gravado no registro junto com o lote.
+        
+        Os arquivos restantes são lidos antes da gravação, e os emitentes,
+        destinatários e produtos de todas as NFes do lote são resolvidos de
+        uma vez (_resolver_cadastros_lote). Com um executor (modo paralelo),
+        a leitura e a interpretação são feitas pelos processos de leitura;
+        este processo apenas grava as NFes no banco, na ordem dos arquivos,
+        com o cursor do wizard.
+        """
+        nfes_lote = []
+        registro_arquivos = self.env['importar_nfe.arquivo_importado']
+        
+        # Arquivos inalterados desde a última importação: nem o cabeçalho é lido
+        estados = {}
+        for arquivo in arquivos_lote:
+            estado = registro_arquivos._estado_arquivo(arquivo)
+            if estado:
+                estados[arquivo] = estado
+        inalterados = registro_arquivos._arquivos_inalterados(estados)
+        
+        chaves_arquivos = {arquivo: self._chave_do_arquivo(arquivo)
+                           for arquivo in arquivos_lote if arquivo not in inalterados}
+        consultadas = {chave for chave in chaves_arquivos.values() if chave}
+        existentes = self.env['importar_nfe.nfe']._chaves_existentes(consultadas)
+        # Chaves conferidas e ausentes do banco: a importação não as busca de novo
+        chaves_novas = consultadas - set(existentes)
+        duplicados_lote = 0
+        resultados = {}
+        
+        def registrar(arquivo, resultado, nfe_id=False, xml_content=None):
+            if arquivo not in estados:
+                return
+            tamanho, data_modificacao = estados[arquivo]
+            valores = {
+                'tamanho': tamanho,
+                'data_modificacao': data_modificacao,
+                'resultado': resultado,
+                'nfe_id': nfe_id,
+            }
+            if xml_content is not None:
+                valores['hash_conteudo'] = registro_arquivos._hash_conteudo(xml_content)
+            resultados[arquivo] = valores
+        
+        pendentes = [arquivo for arquivo in arquivos_lote
+                     if arquivo in chaves_arquivos and chaves_arquivos[arquivo] not in existentes]
+        if executor is not None:
+            # map devolve os resultados na ordem dos arquivos
+            leituras = executor.map(nfe_parser.ler_arquivo, pendentes, chunksize=ARQUIVOS_POR_TAREFA)
+        else:
+            leituras = map(nfe_parser.ler_arquivo, pendentes)
+        leituras = dict(zip(pendentes, leituras))
+        cadastros = self._resolver_cadastros_lote(
+            [dados for dados, _conteudo, erro in leituras.values() if not erro])
+        
+        for i, arquivo in enumerate(arquivos_lote):
+            try:
+                indice_global = offset_inicial + i + 1
+                self._progresso_registrar(processados=offset_inicial + i)
+                
+                if arquivo in inalterados:
+                    nfes_lote.append(inalterados[arquivo])
+                    continue
+                
+                nfe_id = existentes.get(chaves_arquivos[arquivo])
+                if nfe_id:
+                    nfes_lote.append(nfe_id)
+                    duplicados_lote += 1
+                    registrar(arquivo, 'duplicado', nfe_id)
+                    continue
+                
+                nome_arquivo = os.path.basename(arquivo)
+                
+                # Atualizar o log com informações do progresso
+                if i % 10 == 0 or i == len(arquivos_lote) - 1:
+                    self._adicionar_log(f'Processando arquivo {indice_global}: {nome_arquivo}')
+                
+                dados, xml_content, erro = leituras[arquivo]
+                if erro:
+                    self._registrar_erro_arquivo(nome_arquivo, _('Erro ao importar XML: %s') % erro)
+                    registrar(arquivo, 'erro')
+                    continue
+                
+                # Importar o XML
+                self._progresso_registrar(lidos=1)
+                nfe = self._importar_xml_seguro(xml_content, nome_arquivo, dados, cadastros, chaves_novas)
+                if nfe:
+                    nfes_lote.append(nfe.id)
+                    existentes[nfe.chave_acesso] = nfe.id
+                    chaves_novas.discard(nfe.chave_acesso)
+                    registrar(arquivo, 'importado', nfe.id, xml_content)
+                    
+                    # A cada 100 arquivos processados dentro do lote, atualizar o log
+                    if len(nfes_lote) % 100 == 0:
+                        self._adicionar_log(f'Progresso intermediário: {len(nfes_lote)} NFes importadas no lote atual')
+                else:
+                    registrar(arquivo, 'erro', xml_content=xml_content)
+                            
+            except Exception as e:
+                self._adicionar_log(f'Erro ao processar arquivo {os.path.basename(arquivo)}: {str(e)}',
+                                    'erro', os.path.basename(arquivo))
+                _logger.error(f"Erro ao processar arquivo {os.path.basename(arquivo)}: {str(e)}", exc_info=True)
+                registrar(arquivo, 'erro')
+        
+        if inalterados:
+            self.total_duplicados += len(inalterados)
+            self._adicionar_log(f'{len(inalterados)} arquivos inalterados desde a última importação ignorados no lote')
+        if duplicados_lote:
+            self.total_duplicados += duplicados_lote
+            self._adicionar_log(f'{duplicados_lote} arquivos já importados ignorados no lote')
+        
+        registro_arquivos._registrar(resultados)
+        
+        return nfes_lote
+    
+    def _limite_memoria(self):
+        """Teto de memória (bytes) do processo durante a importação, ou None
+        
+        Parâmetro importar_nfe.limite_memoria_mb; sem ele, uma fração do
+        limite flexível de memória dos workers (limit_memory_soft), acima do
+        qual o Odoo recicla o worker ao fim da requisição.
+        """
+        limite_mb = int(self.env['ir.config_parameter'].sudo().get_param('importar_nfe.limite_memoria_mb', 0))
+        if limite_mb > 0:
+            return limite_mb * 1024 * 1024
+        limite = config.get('limit_memory_soft')
+        return int(limite * FRACAO_LIMITE_WORKER) if limite else None
+    
+    def _criar_dimensionador_lote(self, tamanho_lote):
+        """Cria o dimensionador dos lotes, limitado a tamanho_lote arquivos e ao teto de memória"""
+        return dimensionamento.DimensionadorLote(tamanho_lote, self._limite_memoria())
+    
+    def _medir_lote(self, dimensionador, arquivos, inicio, memoria_antes):
+        """Registra tempo e memória do lote concluído e libera memória se estiver perto do teto"""
+        memoria = dimensionamento.memoria_em_uso()
+        tamanho_anterior = dimensionador.tamanho
+        dimensionador.registrar(arquivos, time.monotonic() - inicio, memoria_antes, memoria)
+        if dimensionador.perto_do_limite(memoria):
+            self._limpar_recursos()
+            memoria = dimensionamento.memoria_em_uso()
+            dimensionador.recalcular(memoria)
+        if dimensionador.tamanho != tamanho_anterior:
+            self._adicionar_log(f'Tamanho do lote ajustado para {dimensionador.tamanho} arquivos '
+                                f'(memória em uso: {memoria // (1024 * 1024)} MB)')
+    
+    def _limpar_recursos(self):
+        """Limpa cache e libera memória após processamento de um lote"""
+        # Limpar cache do ORM para evitar crescimento excessivo de memória, mas sem fechar o cursor
+        self.env.cache.clear()
+        
+        # Sugestão para o garbage collector fazer seu trabalho
+        gc.collect()
+        
+        # Registrar no log
+        self._adicionar_log('Memória perto do limite: cache limpo e memória liberada', 'aviso')
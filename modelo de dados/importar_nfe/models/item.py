@@ -34,17 +34,4 @@ class ImportarNFeItem(models.Model):
     
     @api.model_create_multi
     def create(self, vals_list):
-        for vals in vals_list:
-            # Verificar se o item já existe para a NFe
-            if 'nfe_id' in vals and 'produto_id' in vals:
-                existing_item = self.search([
-                    ('nfe_id', '=', vals['nfe_id']),
-                    ('produto_id', '=', vals['produto_id']),
-                    ('numero_item', '=', vals.get('numero_item', 0))
-                ], limit=1)
-                
-                if existing_item:
-                    # Item já existe, não criar duplicado
-                    continue
-        
         return super(ImportarNFeItem, self).create(vals_list)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+
+class ImportarNFeLogImportacao(models.Model):
+    """Evento do log de uma importação de NFes
+
+    Cada mensagem do log é uma linha, vinculada ao wizard ou à importação em
+    segundo plano que a gerou (res_model/res_id). As linhas são acumuladas em
+    memória e gravadas em lote pelo importador.
+    """
+    _name = 'importar_nfe.log_importacao'
+    _description = 'Log de Importação de NFe'
+    _order = 'id'
+    _rec_name = 'mensagem'
+
+    res_model = fields.Char(string='Modelo de Origem', required=True, index=True, readonly=True)
+    res_id = fields.Many2oneReference(string='Registro de Origem', model_field='res_model',
+                                      required=True, index=True, readonly=True)
+    data = fields.Datetime(string='Data/Hora', required=True, readonly=True, default=fields.Datetime.now)
+    nivel = fields.Selection([
+        ('info', 'Informação'),
+        ('sucesso', 'Sucesso'),
+        ('aviso', 'Aviso'),
+        ('erro', 'Erro'),
+    ], string='Nível', required=True, default='info', readonly=True)
+    mensagem = fields.Text(string='Mensagem', required=True, readonly=True)
+    arquivo = fields.Char(string='Arquivo', readonly=True)
+
+    @api.autovacuum
+    def _gc_logs_orfaos(self):
+        """Remove os logs de wizards e importações que já foram excluídos"""
+        for modelo in ('importar_nfe.wizard', 'importar_nfe.importacao', 'importar_nfe.caixa_entrada'):
+            self.env.cr.execute(f"""
+                DELETE FROM importar_nfe_log_importacao l
+                 WHERE l.res_model = %s
+                   AND NOT EXISTS (SELECT 1 FROM {self.env[modelo]._table} r WHERE r.id = l.res_id)
+            """, (modelo,))
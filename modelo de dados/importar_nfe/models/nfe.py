@@ -2,15 +2,33 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
-import base64
+from odoo.osv import expression
 import xml.etree.ElementTree as ET
-from datetime import datetime
 import logging
-import re
 import html
 
+import pytz
+
+from ..tools import nfe_parser, xml_html
+
 _logger = logging.getLogger(__name__)
 
+# Fuso das datas sem hora quando nem o usuário nem a empresa têm um definido
+FUSO_HORARIO_PADRAO = 'America/Sao_Paulo'
+
+# NFes cujas datas são corrigidas por vez em _preencher_dados_da_chave
+TAMANHO_LOTE_CORRECAO = 500
+
+# Chave de acesso com 44 dígitos, mês válido e dígito verificador (módulo 11) correto
+SQL_CHAVE_VALIDA = """
+    chave_acesso ~ '^[0-9]{44}$'
+    AND substr(chave_acesso, 5, 2) BETWEEN '01' AND '12'
+    AND substr(chave_acesso, 44, 1)::int = (
+        SELECT CASE WHEN mod(soma, 11) < 2 THEN 0 ELSE 11 - mod(soma, 11) END
+          FROM (SELECT sum(substr(chave_acesso, 44 - i, 1)::int * (2 + (i - 1) % 8)) AS soma
+                  FROM generate_series(1, 43) AS i) AS dv)
+"""
+
 class ImportarNFe(models.Model):
     _name = 'importar_nfe.nfe'
     _description = 'Nota Fiscal Eletrônica'
@@ -55,6 +73,7 @@ class ImportarNFe(models.Model):
     # Campos computados
     quantidade_itens = fields.Integer(string='Quantidade de Itens', compute='_compute_quantidade_itens', store=True)
     xml_formatado = fields.Html(string='XML Formatado', compute='_compute_xml_formatado', sanitize=False)
+    xml_tem_mais = fields.Boolean(string='XML Truncado', compute='_compute_xml_formatado')
     
     # Status
     state = fields.Selection([
@@ -80,68 +99,67 @@ class ImportarNFe(models.Model):
             record.quantidade_itens = len(record.item_ids)
     
     @api.depends('xml_original')
+    @api.depends_context('xml_limite_linhas')
     def _compute_xml_formatado(self):
-        """Transforma o XML binário em HTML formatado para exibição"""
+        """Renderiza o XML original em HTML formatado para exibição
+        
+        Apenas as primeiras linhas (contexto xml_limite_linhas) são renderizadas,
+        lendo o anexo em streaming; o resultado fica em cache pelo checksum do
+        anexo, de modo que reabrir a mesma nota não re-parseia o XML.
+        """
+        limite = self.env.context.get('xml_limite_linhas') or xml_html.LINHAS_POR_PAGINA
+        anexos = {}
+        ids = [record._origin.id for record in self if record._origin.id]
+        if ids:
+            for anexo in self.env['ir.attachment'].sudo().search([
+                ('res_model', '=', self._name),
+                ('res_field', '=', 'xml_original'),
+                ('res_id', 'in', ids),
+            ]):
+                anexos[anexo.res_id] = anexo
+        
         for record in self:
-            if not record.xml_original:
+            record.xml_tem_mais = False
+            anexo = anexos.get(record._origin.id)
+            if not anexo or not anexo.file_size:
                 record.xml_formatado = "<p>Nenhum XML disponível</p>"
                 continue
             
+            if anexo.file_size < 10:
+                record.xml_formatado = "<p>XML inválido ou vazio</p>"
+                continue
+            
             try:
-                # Decodificar o XML binário
-                xml_content = base64.b64decode(record.xml_original)
-                
-                # Verificar se o conteúdo é válido antes de tentar parsear
-                if not xml_content or len(xml_content) < 10:
-                    record.xml_formatado = "<p>XML inválido ou vazio</p>"
-                    continue
-                
-                # Parsear o XML
-                try:
-                    tree = ET.ElementTree(ET.fromstring(xml_content))
-                except Exception as parse_error:
-                    record.xml_formatado = f"<p>Erro ao parsear XML: {html.escape(str(parse_error))}</p>"
-                    continue
-                
-                # Função para formatar o elemento XML recursivamente
-                def format_element(element, level=0):
-                    indent = '&nbsp;' * 4 * level
-                    tag = element.tag
-                    # Remover namespace se presente
-                    if '}' in tag:
-                        tag = tag.split('}', 1)[1]
-                    
-                    result = []
-                    attrs = ''
-                    if element.attrib:
-                        attrs = ' ' + ' '.join([f'<span style="color: #0000AA;">{k}</span>=<span style="color: #AA0000;">"{html.escape(v)}"</span>' for k, v in element.attrib.items()])
-                    
-                    # Abertura da tag
-                    result.append(f'{indent}<span style="color: #0000FF;">&lt;{tag}</span>{attrs}<span style="color: #0000FF;">&gt;</span>')
-                    
-                    # Conteúdo e filhos
-                    if element.text and element.text.strip():
-                        result.append(f'<span style="color: #000000;">{html.escape(element.text.strip())}</span>')
-                        
-                    if len(element) > 0:
-                        result.append('<br/>')
-                        for child in element:
-                            result.append(format_element(child, level + 1))
-                            result.append('<br/>')
-                        result.append(f'{indent}')
-                    
-                    # Fechamento da tag
-                    result.append(f'<span style="color: #0000FF;">&lt;/{tag}&gt;</span>')
-                    
-                    return ''.join(result)
-                
-                # Formatar o XML inteiro com sintaxe colorida
-                root = tree.getroot()
-                html_content = f'<pre style="font-family: monospace; white-space: pre-wrap;">{format_element(root)}</pre>'
-                
-                record.xml_formatado = html_content
+                html_content, tem_mais = xml_html.renderizar_com_cache(
+                    anexo.checksum, lambda: anexo.raw, limite)
+            except ET.ParseError as parse_error:
+                record.xml_formatado = f"<p>Erro ao parsear XML: {html.escape(str(parse_error))}</p>"
+                continue
             except Exception as e:
                 record.xml_formatado = f"<p>Erro ao renderizar XML: {html.escape(str(e))}</p>"
+                continue
+            
+            record.xml_formatado = html_content
+            record.xml_tem_mais = tem_mais
+    
+    def action_visualizar_xml(self, limite=None):
+        """Abre o visualizador do XML original com as primeiras linhas renderizadas"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('XML Original'),
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'views': [(self.env.ref('importar_nfe.importar_nfe_xml_form').id, 'form')],
+            'target': 'new',
+            'context': dict(self.env.context, xml_limite_linhas=limite or xml_html.LINHAS_POR_PAGINA),
+        }
+    
+    def action_mostrar_mais_xml(self):
+        """Reabre o visualizador com a próxima página de linhas do XML"""
+        limite = self.env.context.get('xml_limite_linhas') or xml_html.LINHAS_POR_PAGINA
+        return self.action_visualizar_xml(limite + xml_html.LINHAS_POR_PAGINA)
     
     @api.model_create_multi
     def create(self, vals_list):
@@ -150,554 +168,506 @@ class ImportarNFe(models.Model):
                 vals['name'] = self.env['ir.sequence'].next_by_code('importar_nfe.nfe') or _('Novo')
         return super(ImportarNFe, self).create(vals_list)
     
-    def _detectar_namespace(self, root):
-        """Detecta automaticamente o namespace do XML da NFe"""
-        nsmap = {}
-        
-        # Verificar se o root já tem o namespace definido
-        if hasattr(root, 'nsmap') and root.nsmap:
-            for prefix, uri in root.nsmap.items():
-                if uri and ('portalfiscal' in uri or 'nfe' in uri):
-                    if prefix is None:
-                        nsmap['nfe'] = uri
-                    else:
-                        nsmap[prefix] = uri
-        
-        # Se não encontrou namespace, tentar detectar pelos elementos
-        if not nsmap:
-            # Verificar se há namespace no elemento raiz
-            match = re.match(r'\{(.*?)\}', root.tag)
-            if match:
-                ns_uri = match.group(1)
-                nsmap['nfe'] = ns_uri
-            
-            # Tentar encontrar nos filhos
-            for child in root:
-                match = re.match(r'\{(.*?)\}', child.tag)
-                if match:
-                    ns_uri = match.group(1)
-                    nsmap['nfe'] = ns_uri
-                    break
-        
-        # Se ainda não encontrou, usar um namespace padrão
-        if not nsmap:
-            _logger.warning("Namespace não detectado, usando namespace padrão")
-            nsmap['nfe'] = 'http://www.portalfiscal.inf.br/nfe'
-        
-        return nsmap
-    
-    def _extrair_valor_seguro(self, elemento, ns, xpath, default=0.0):
-        """Extrai um valor numérico de forma segura, retornando o default em caso de erro"""
-        try:
-            # Tentar encontrar o elemento com namespace
-            valor_elem = elemento.find(xpath, ns)
-            if valor_elem is not None and valor_elem.text:
-                return float(valor_elem.text.replace(',', '.'))
-            
-            # Se não encontrou, tentar sem namespace
-            xpath_sem_ns = xpath.replace('nfe:', '')
-            valor_elem = elemento.find(xpath_sem_ns)
-            if valor_elem is not None and valor_elem.text:
-                return float(valor_elem.text.replace(',', '.'))
-                
-            return default
-        except (ValueError, AttributeError):
-            return default
-    
-    def _extrair_texto_seguro(self, elemento, ns, xpath, default=False):
-        """Extrai um texto de forma segura, retornando o default em caso de erro"""
-        try:
-            # Tentar encontrar o elemento com namespace
-            texto_elem = elemento.find(xpath, ns)
-            if texto_elem is not None and texto_elem.text:
-                return texto_elem.text.strip()
-            
-            # Se não encontrou, tentar sem namespace
-            xpath_sem_ns = xpath.replace('nfe:', '')
-            texto_elem = elemento.find(xpath_sem_ns)
-            if texto_elem is not None and texto_elem.text:
-                return texto_elem.text.strip()
-                
-            return default
-        except AttributeError:
-            return default
-    
     def _parsear_data(self, data_str):
-        """Converte string de data em objeto datetime"""
+        """Converte string de data em objeto datetime (UTC, como o Odoo armazena)
+        
+        Datas sem hora (dEmi das NFes 2.0, mês da chave de acesso) valem a
+        partir da meia-noite local, e não de 00:00 UTC, que no Brasil ainda é
+        o dia (e às vezes o mês) anterior. Datas que não podem ser convertidas
+        ficam vazias (False), para que o mês codificado na chave de acesso as
+        preencha (_preencher_dados_da_chave).
+        """
         if not data_str:
             return False
-            
-        # Remover timezone se presente
-        data_str = data_str.split('-0')[0].split('+0')[0].strip()
         
-        # Verificar se a data contém apenas o ano e mês (formato YYYY-MM)
-        if data_str and len(data_str.split('-')) == 2:
-            try:
-                ano, mes = data_str.split('-')
-                if ano.isdigit() and mes.isdigit() and len(ano) == 4 and len(mes) <= 2:
-                    return datetime(int(ano), int(mes), 1, 0, 0, 0)
-            except ValueError:
-                _logger.warning("Não foi possível converter a data de mês-ano: %s", data_str)
-        
-        # Verificar se a data contém apenas o ano
-        if data_str and data_str.isdigit() and len(data_str) == 4:
-            # Se for apenas o ano (exemplo: "2024"), usar 1º de janeiro desse ano
-            try:
-                return datetime(int(data_str), 1, 1, 0, 0, 0)
-            except ValueError:
-                _logger.warning("Não foi possível converter o ano: %s", data_str)
-                return False
-        
-        # Tentar vários formatos de data
-        formatos = [
-            '%Y-%m-%dT%H:%M:%S',  # 2023-01-01T10:30:00
-            '%Y-%m-%d %H:%M:%S',  # 2023-01-01 10:30:00
-            '%d/%m/%Y %H:%M:%S',  # 01/01/2023 10:30:00
-            '%d/%m/%Y',           # 01/01/2023
-            '%Y%m%d%H%M%S',       # 20230101103000
-            '%Y%m%d',             # 20230101
-            '%Y-%m-%d',           # 2023-01-01
-        ]
-        
-        for formato in formatos:
-            try:
-                return datetime.strptime(data_str, formato)
-            except ValueError:
-                continue
+        data = nfe_parser.converter_data(data_str)
+        if data:
+            if len(data_str.strip()) <= 10:
+                return self._meia_noite_local_em_utc(data)
+            return data
                 
         _logger.warning("Não foi possível converter a data: %s", data_str)
-        # Em caso de não conseguir converter, retornar a data atual
-        return datetime.now()
+        return False
     
-    def _buscar_elemento_recursivo(self, elemento, tag_procurada, ns=None):
-        """Busca um elemento recursivamente na árvore XML"""
-        if elemento is None:
-            return None
-            
-        # Verificar se o elemento atual é o procurado
-        tag_atual = elemento.tag
-        if ns:
-            # Remover namespace da tag atual se existir
-            match = re.match(r'\{.*?\}(.*)', tag_atual)
-            if match:
-                tag_atual = match.group(1)
-        
-        if tag_atual == tag_procurada:
-            return elemento
-            
-        # Buscar nos filhos
-        for filho in elemento:
-            resultado = self._buscar_elemento_recursivo(filho, tag_procurada, ns)
-            if resultado is not None:
-                return resultado
-                
-        return None
+    def _fuso_horario(self):
+        """Fuso horário local: o do usuário, o da empresa ou FUSO_HORARIO_PADRAO"""
+        return self.env.user.tz or self.env.company.partner_id.tz or FUSO_HORARIO_PADRAO
+    
+    def _meia_noite_local_em_utc(self, data):
+        """Converte a meia-noite local do dia informado em datetime UTC sem fuso"""
+        fuso = pytz.timezone(self._fuso_horario())
+        meia_noite = data.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+        return fuso.localize(meia_noite).astimezone(pytz.utc).replace(tzinfo=None)
+    
+    def _buscar_nfe_existente(self, chave_acesso):
+        """Retorna a NFe já importada com a chave de acesso informada, se houver"""
+        nfe_existente = self.search([('chave_acesso', '=', chave_acesso)], limit=1)
+        if nfe_existente:
+            _logger.info("NFe com chave %s já existe no sistema.", chave_acesso)
+        return nfe_existente
     
-    def _extrair_elemento_seguro(self, root, caminho_elementos, ns=None):
-        """Extrai um elemento de forma segura usando um caminho de elementos"""
-        elemento_atual = root
+    @api.model
+    def _chaves_existentes(self, chaves):
+        """Retorna {chave_acesso: id} das NFes já importadas entre as chaves informadas
         
-        for tag in caminho_elementos:
-            if elemento_atual is None:
-                return None
-                
-            # Tentar com namespace
-            if ns:
-                elemento_atual = elemento_atual.find(f'nfe:{tag}', ns)
-                
-            # Se não encontrou, tentar sem namespace
-            if elemento_atual is None:
-                elemento_atual = elemento_atual.find(tag)
-                
-            # Se ainda não encontrou, tentar buscar recursivamente
-            if elemento_atual is None:
-                elemento_atual = self._buscar_elemento_recursivo(root, tag, ns)
-                
-        return elemento_atual
+        Uma única consulta por lote; inclui NFes arquivadas, que também
+        violariam a restrição de chave única.
+        """
+        if not chaves:
+            return {}
+        registros = self.with_context(active_test=False).search_read(
+            [('chave_acesso', 'in', list(chaves))], ['chave_acesso'])
+        return {registro['chave_acesso']: registro['id'] for registro in registros}
+    
+    @api.model
+    def _preencher_dados_da_chave(self):
+        """Corrige a data de emissão e preenche série, número e modelo a partir da chave
+        
+        Apenas NFes cuja chave tem 44 dígitos, dígito verificador (módulo 11)
+        correto e mês válido. Série, número e modelo vazios são preenchidos
+        em uma única atualização em SQL.
+        
+        A data de emissão vazia ou de outro mês (no horário local) que não o
+        codificado na chave (AAMM) é relida do dhEmi/dEmi do XML original;
+        só quando o XML não traz data válida ela passa a ser o primeiro dia do
+        mês da chave, à meia-noite local. Corrige as datas aleatórias gravadas
+        pelo antigo fix_data.py, as reduzidas a 1º de janeiro e as
+        preenchidas com a data da importação, sem descartar dia e hora reais.
+        
+        Returns:
+            quantidade de NFes atualizadas
+        """
+        self.env.flush_all()
+        cr = self.env.cr
+        cr.execute(f"""
+            UPDATE importar_nfe_nfe
+               SET serie = COALESCE(NULLIF(serie, ''), substr(chave_acesso, 23, 3)::int::text),
+                   numero = COALESCE(NULLIF(numero, ''), substr(chave_acesso, 26, 9)::bigint::text),
+                   modelo = COALESCE(NULLIF(modelo, ''), substr(chave_acesso, 21, 2))
+             WHERE {SQL_CHAVE_VALIDA}
+               AND (serie IS NULL OR serie = ''
+                    OR numero IS NULL OR numero = ''
+                    OR modelo IS NULL OR modelo = '')
+         RETURNING id
+        """)
+        atualizadas = {nfe_id for nfe_id, in cr.fetchall()}
+        
+        # Datas vazias ou fora do mês da chave, comparadas no horário local
+        cr.execute(f"""
+            SELECT id, chave_acesso, data_emissao
+              FROM importar_nfe_nfe
+             WHERE {SQL_CHAVE_VALIDA}
+               AND (data_emissao IS NULL
+                    OR to_char(timezone(%s, data_emissao AT TIME ZONE 'UTC'), 'YYMM')
+                       <> substr(chave_acesso, 3, 4))
+        """, [self._fuso_horario()])
+        candidatas = cr.fetchall()
+        
+        for inicio in range(0, len(candidatas), TAMANHO_LOTE_CORRECAO):
+            lote = candidatas[inicio:inicio + TAMANHO_LOTE_CORRECAO]
+            anexos = {anexo.res_id: anexo for anexo in self.env['ir.attachment'].sudo().search([
+                ('res_model', '=', self._name),
+                ('res_field', '=', 'xml_original'),
+                ('res_id', 'in', [nfe_id for nfe_id, _chave, _data in lote]),
+            ])}
+            ids, datas = [], []
+            for nfe_id, chave_acesso, data_atual in lote:
+                data = self._data_emissao_do_xml(anexos.get(nfe_id))
+                if not data:
+                    ide_chave = nfe_parser.identificacao_da_chave(chave_acesso)
+                    data = self._parsear_data(ide_chave.data_emissao)
+                if data != data_atual:
+                    ids.append(nfe_id)
+                    datas.append(data)
+            if ids:
+                cr.execute("""
+                    UPDATE importar_nfe_nfe AS nfe
+                       SET data_emissao = correcao.data
+                      FROM unnest(%s::int[], %s::timestamp[]) AS correcao(id, data)
+                     WHERE nfe.id = correcao.id
+                """, [ids, datas])
+                atualizadas.update(ids)
+        
+        self.invalidate_model(['data_emissao', 'serie', 'numero', 'modelo'])
+        _logger.info("%s NFes atualizadas com dados da chave de acesso.", len(atualizadas))
+        return len(atualizadas)
     
-    def importar_xml(self, tree, disable_messaging=True):
+    def _data_emissao_do_xml(self, anexo):
+        """Data de emissão (dhEmi ou dEmi) lida do anexo do XML original, ou False"""
+        if not anexo:
+            return False
+        try:
+            dados = nfe_parser.ler_nfe(anexo.raw)
+        except (nfe_parser.NFeInvalida, ET.ParseError):
+            return False
+        if not dados or not dados.identificacao:
+            return False
+        return self._parsear_data(dados.identificacao.data_emissao)
+    
+    @api.model
+    def action_preencher_dados_da_chave(self):
+        """Ação de servidor: preenche os dados vazios das NFes a partir da chave"""
+        atualizadas = self._preencher_dados_da_chave()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Dados da Chave de Acesso'),
+                'message': _('%s NFes atualizadas a partir da chave de acesso.') % atualizadas,
+                'type': 'info',
+                'sticky': False,
+            }
+        }
+    
+    def _importar_dados(self, ler, xml_content, disable_messaging, cadastros=None, chaves_novas=None):
+        """Lê a NFe com a função de leitura informada e persiste o resultado
+        
+        A função ler recebe o callback parar_se de nfe_parser; a leitura é
+        interrompida se a chave pertencer a uma NFe já importada. Chaves em
+        chaves_novas, já conferidas pelo lote, não são buscadas de novo.
+        """
+        existente = self.browse()
+        
+        def ja_importada(chave_acesso):
+            nonlocal existente
+            if chaves_novas and chave_acesso in chaves_novas:
+                return False
+            existente = self._buscar_nfe_existente(chave_acesso)
+            return bool(existente)
+        
+        dados = ler(ja_importada)
+        if dados is None:
+            return existente
+        return self._persistir_nfe(dados, xml_content, disable_messaging, cadastros)
+    
+    def importar_xml(self, tree, disable_messaging=True, xml_content=None):
         """Importa os dados de um XML de NFe
         
         Args:
             tree: ElementTree contendo o XML da NFe
             disable_messaging: Se True, desativa mensagens de sistema durante importação em massa
+            xml_content: bytes (ou memoryview) originais do arquivo, armazenados sem
+                re-serialização; se omitido, o XML é serializado a partir da árvore
         """
         try:
-            # Salvar XML original como string binária
-            xml_str = ET.tostring(tree.getroot(), encoding='utf-8', method='xml')
-            
-            # Converter para base64 válido
-            xml_base64 = base64.b64encode(xml_str)
-            
-            root = tree.getroot()
-            # Detectar namespace automaticamente
-            ns = self._detectar_namespace(root)
-            
-            # Verificar se já existe NFe com a mesma chave de acesso
-            chave_acesso = None
-            
-            # Tentar encontrar a chave de acesso em diferentes locais
-            # Primeiro no padrão mais comum
-            infNFe = root.find('.//nfe:infNFe', ns)
-            if infNFe is not None:
-                chave_acesso = infNFe.get('Id', '')
-                if chave_acesso and chave_acesso.startswith('NFe'):
-                    chave_acesso = chave_acesso[3:]  # Remover prefixo 'NFe'
-            
-            # Se não encontrou, tentar outros caminhos
-            if not chave_acesso:
-                chave_acesso_elem = root.find('.//nfe:chNFe', ns)
-                if chave_acesso_elem is not None and chave_acesso_elem.text:
-                    chave_acesso = chave_acesso_elem.text
-            
-            if not chave_acesso:
-                chave_acesso_elem = self._buscar_elemento_recursivo(root, 'chNFe', ns)
-                if chave_acesso_elem is not None and chave_acesso_elem.text:
-                    chave_acesso = chave_acesso_elem.text
-            
-            if not chave_acesso:
-                raise UserError(_('XML inválido: chave de acesso não encontrada.'))
-            
-            # Verificar se já existe NFe com esta chave
-            nfe_existente = self.search([('chave_acesso', '=', chave_acesso)], limit=1)
-            if nfe_existente:
-                _logger.info("NFe com chave %s já existe no sistema.", chave_acesso)
-                return nfe_existente
-            
-            # Extrair informações básicas
-            if not infNFe:
-                # Tentar encontrar em outros locais
-                infNFe = self._extrair_elemento_seguro(root, ['NFe', 'infNFe'], ns)
-                if not infNFe:
-                    infNFe = self._buscar_elemento_recursivo(root, 'infNFe', ns)
-                
-            if not infNFe:
-                raise UserError(_('XML inválido: elemento infNFe não encontrado.'))
-            
-            # Extrair dados do emitente
-            emit = infNFe.find('.//nfe:emit', ns)
-            if not emit:
-                emit = self._buscar_elemento_recursivo(infNFe, 'emit', ns)
-                
-            if not emit:
-                raise UserError(_('XML inválido: elemento emit não encontrado.'))
-            
-            # Extrair CNPJ do emitente
-            cnpj_emit = self._extrair_texto_seguro(emit, ns, 'nfe:CNPJ')
-            if not cnpj_emit:
-                raise UserError(_('XML inválido: CNPJ do emitente não encontrado.'))
-            
-            # Buscar ou criar emitente
-            emitente = self.env['importar_nfe.emitente'].search([('cnpj', '=', cnpj_emit)], limit=1)
-            if not emitente:
-                emitente_vals = {
-                    'name': self._extrair_texto_seguro(emit, ns, 'nfe:xNome', 'Emitente'),
-                    'cnpj': cnpj_emit,
-                    'ie': self._extrair_texto_seguro(emit, ns, 'nfe:IE', ''),
-                    'logradouro': self._extrair_texto_seguro(emit, ns, 'nfe:enderEmit/nfe:xLgr', ''),
-                    'numero': self._extrair_texto_seguro(emit, ns, 'nfe:enderEmit/nfe:nro', ''),
-                    'complemento': self._extrair_texto_seguro(emit, ns, 'nfe:enderEmit/nfe:xCpl', ''),
-                    'bairro': self._extrair_texto_seguro(emit, ns, 'nfe:enderEmit/nfe:xBairro', ''),
-                    'municipio': self._extrair_texto_seguro(emit, ns, 'nfe:enderEmit/nfe:xMun', ''),
-                    'uf': self._extrair_texto_seguro(emit, ns, 'nfe:enderEmit/nfe:UF', ''),
-                    'cep': self._extrair_texto_seguro(emit, ns, 'nfe:enderEmit/nfe:CEP', ''),
-                    'telefone': self._extrair_texto_seguro(emit, ns, 'nfe:enderEmit/nfe:fone', ''),
-                }
-                emitente = self.env['importar_nfe.emitente'].create(emitente_vals)
-            
-            # Extrair dados do destinatário
-            dest = infNFe.find('.//nfe:dest', ns)
-            if not dest:
-                dest = self._buscar_elemento_recursivo(infNFe, 'dest', ns)
-            
-            # Se não encontrar o destinatário, criar um destinatário padrão
-            if not dest:
-                _logger.warning("Elemento dest não encontrado no XML. Usando destinatário padrão.")
-                destinatario = self.env['importar_nfe.destinatario'].search([('name', '=', 'Destinatário Padrão')], limit=1)
-                
-                if not destinatario:
-                    # Criar destinatário padrão se não existir
-                    destinatario_vals = {
-                        'name': 'Destinatário Padrão',
-                        'cnpj': False,
-                        'cpf': False,
-                        'ie': '',
-                    }
-                    destinatario = self.env['importar_nfe.destinatario'].create(destinatario_vals)
-            else:
-                # Extrair CNPJ ou CPF do destinatário
-                cnpj_dest = self._extrair_texto_seguro(dest, ns, 'nfe:CNPJ')
-                cpf_dest = self._extrair_texto_seguro(dest, ns, 'nfe:CPF')
-                
-                if not cnpj_dest and not cpf_dest:
-                    _logger.warning("CNPJ/CPF do destinatário não encontrado. Usando identificador alternativo.")
-                    # Tentar usar o nome como identificador
-                    nome_dest = self._extrair_texto_seguro(dest, ns, 'nfe:xNome', 'Destinatário Desconhecido')
-                    destinatario = self.env['importar_nfe.destinatario'].search([('name', '=', nome_dest)], limit=1)
-                    
-                    if not destinatario:
-                        # Criar destinatário com os dados disponíveis
-                        destinatario_vals = {
-                            'name': nome_dest,
-                            'cnpj': False,
-                            'cpf': False,
-                            'ie': self._extrair_texto_seguro(dest, ns, 'nfe:IE', ''),
-                            'logradouro': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:xLgr', ''),
-                            'numero': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:nro', ''),
-                            'complemento': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:xCpl', ''),
-                            'bairro': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:xBairro', ''),
-                            'municipio': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:xMun', ''),
-                            'uf': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:UF', ''),
-                            'cep': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:CEP', ''),
-                            'telefone': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:fone', ''),
-                        }
-                        destinatario = self.env['importar_nfe.destinatario'].create(destinatario_vals)
-                else:
-                    # Buscar ou criar destinatário
-                    domain = []
-                    if cnpj_dest:
-                        domain = [('cnpj', '=', cnpj_dest)]
-                    elif cpf_dest:
-                        domain = [('cpf', '=', cpf_dest)]
-                    
-                    destinatario = self.env['importar_nfe.destinatario'].search(domain, limit=1)
-                    if not destinatario:
-                        destinatario_vals = {
-                            'name': self._extrair_texto_seguro(dest, ns, 'nfe:xNome', 'Destinatário'),
-                            'cnpj': cnpj_dest or False,
-                            'cpf': cpf_dest or False,
-                            'ie': self._extrair_texto_seguro(dest, ns, 'nfe:IE', ''),
-                            'logradouro': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:xLgr', ''),
-                            'numero': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:nro', ''),
-                            'complemento': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:xCpl', ''),
-                            'bairro': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:xBairro', ''),
-                            'municipio': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:xMun', ''),
-                            'uf': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:UF', ''),
-                            'cep': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:CEP', ''),
-                            'telefone': self._extrair_texto_seguro(dest, ns, 'nfe:enderDest/nfe:fone', ''),
-                        }
-                        destinatario = self.env['importar_nfe.destinatario'].create(destinatario_vals)
-            
-            # Extrair identificação da NFe
-            ide = infNFe.find('.//nfe:ide', ns)
-            if not ide:
-                ide = self._buscar_elemento_recursivo(infNFe, 'ide', ns)
-                
-            if not ide:
-                _logger.warning('Elemento ide não encontrado no XML. Usando valores padrão.')
-                # Criar um dicionário para armazenar valores padrão que seriam extraídos do ide
-                ide_values = {
-                    'nNF': 'Novo',
-                    'serie': '',
-                    'mod': '',
-                    'dhEmi': False,
-                    'dhSaiEnt': False
-                }
-                # Função auxiliar para extrair valores do dicionário de valores padrão
-                def extrair_de_ide_dict(campo, default):
-                    return ide_values.get(campo, default)
-            else:
-                # Função auxiliar para extrair valores do elemento XML ide
-                def extrair_de_ide_dict(campo, default):
-                    return self._extrair_texto_seguro(ide, ns, f'nfe:{campo}', default)
-            
-            # Extrair valores totais
-            total = infNFe.find('.//nfe:total', ns)
-            if not total:
-                total = self._buscar_elemento_recursivo(infNFe, 'total', ns)
-                
-            if not total:
-                _logger.warning('Elemento total não encontrado no XML. Usando valores padrão.')
-                # Usar valores zerados para os campos financeiros quando não encontrar o elemento total
-                total_values = {
-                    'vProd': 0.0,
-                    'vFrete': 0.0,
-                    'vSeg': 0.0,
-                    'vDesc': 0.0,
-                    'vOutro': 0.0,
-                    'vNF': 0.0,
-                    'vICMS': 0.0,
-                    'vIPI': 0.0,
-                    'vPIS': 0.0,
-                    'vCOFINS': 0.0
-                }
-                # Função auxiliar para extrair valores do dicionário de valores padrão
-                def extrair_de_total_dict(xpath, default):
-                    campo = xpath.replace('.//nfe:', '').replace('./', '')
-                    return total_values.get(campo, default)
-            else:
-                # Função auxiliar para extrair valores do elemento XML total
-                def extrair_de_total_dict(xpath, default):
-                    return self._extrair_valor_seguro(total, ns, xpath, default)
-            
-            # Preparar valores da NFe
-            nfe_vals = {
-                'name': extrair_de_ide_dict('nNF', 'Novo'),
-                'chave_acesso': chave_acesso,
-                'numero': extrair_de_ide_dict('nNF', ''),
-                'serie': extrair_de_ide_dict('serie', ''),
-                'modelo': extrair_de_ide_dict('mod', ''),
-                'tipo_operacao': 'entrada',  # Padrão é entrada
-                'data_emissao': self._parsear_data(extrair_de_ide_dict('dhEmi', False)),
-                'data_entrada': self._parsear_data(extrair_de_ide_dict('dhSaiEnt', False)),
-                'emitente_id': emitente.id,
-                'destinatario_id': destinatario.id,
-                'valor_produtos': extrair_de_total_dict('.//nfe:vProd', 0.0),
-                'valor_frete': extrair_de_total_dict('.//nfe:vFrete', 0.0),
-                'valor_seguro': extrair_de_total_dict('.//nfe:vSeg', 0.0),
-                'valor_desconto': extrair_de_total_dict('.//nfe:vDesc', 0.0),
-                'valor_outros': extrair_de_total_dict('.//nfe:vOutro', 0.0),
-                'valor_total': extrair_de_total_dict('.//nfe:vNF', 0.0),
-                'valor_icms': extrair_de_total_dict('.//nfe:vICMS', 0.0),
-                'valor_ipi': extrair_de_total_dict('.//nfe:vIPI', 0.0),
-                'valor_pis': extrair_de_total_dict('.//nfe:vPIS', 0.0),
-                'valor_cofins': extrair_de_total_dict('.//nfe:vCOFINS', 0.0),
-                'state': 'imported',
-                'xml_original': xml_base64,
-                'xml_nome': f"NFe_{chave_acesso}.xml",
-            }
+            if xml_content is None:
+                xml_content = ET.tostring(tree.getroot(), encoding='utf-8', method='xml')
             
-            # Criar NFe sem disparar mensagens de sistema se solicitado
-            context = self.env.context.copy()
-            if disable_messaging:
-                context['tracking_disable'] = True
-                context['mail_create_nosubscribe'] = True
-                context['mail_auto_subscribe_no_notify'] = True
-                context['mail_notrack'] = True
-                
-            nfe = self.with_context(context).create(nfe_vals)
-            
-            # Verificar se o XML original foi salvo corretamente
-            if not nfe.xml_original:
-                nfe.write({
-                    'xml_original': xml_base64,
-                    'xml_nome': f"NFe_{chave_acesso}.xml",
-                })
-            
-            # Processar itens
-            itens = infNFe.findall('.//nfe:det', ns)
-            if not itens:
-                # Tentar encontrar itens sem namespace
-                itens = infNFe.findall('.//det')
-                
-            if not itens:
-                _logger.warning("Nenhum item encontrado na NFe %s", chave_acesso)
-            
-            for det in itens:
-                prod = det.find('nfe:prod', ns)
-                if not prod:
-                    prod = det.find('prod')
-                    
-                if not prod:
-                    _logger.warning("Elemento prod não encontrado no item %s", det.get('nItem', '?'))
-                    continue
-                    
-                # Criar ou buscar produto
-                codigo_produto = self._extrair_texto_seguro(prod, ns, 'nfe:cProd', '')
-                if not codigo_produto:
-                    codigo_produto = 'SEM_CODIGO'
-                
-                produto_vals = {
-                    'name': self._extrair_texto_seguro(prod, ns, 'nfe:xProd', 'Produto'),
-                    'codigo': codigo_produto,
-                    'descricao': self._extrair_texto_seguro(prod, ns, 'nfe:xProd', ''),
-                    'ncm': self._extrair_texto_seguro(prod, ns, 'nfe:NCM', ''),
-                    'cfop': self._extrair_texto_seguro(prod, ns, 'nfe:CFOP', ''),
-                    'unidade': self._extrair_texto_seguro(prod, ns, 'nfe:uCom', ''),
-                }
-                
-                produto = self.env['importar_nfe.produto'].search([('codigo', '=', codigo_produto)], limit=1)
-                if not produto:
-                    produto = self.env['importar_nfe.produto'].create(produto_vals)
-                
-                # Criar item
-                item_vals = {
-                    'nfe_id': nfe.id,
-                    'produto_id': produto.id,
-                    'numero_item': int(det.get('nItem', '0')),
-                    'quantidade': self._extrair_valor_seguro(prod, ns, 'nfe:qCom', 1.0),
-                    'valor_unitario': self._extrair_valor_seguro(prod, ns, 'nfe:vUnCom', 0.0),
-                    'valor_total': self._extrair_valor_seguro(prod, ns, 'nfe:vProd', 0.0),
-                    'valor_desconto': self._extrair_valor_seguro(prod, ns, 'nfe:vDesc', 0.0),
-                }
-                
-                # Adicionar valores de impostos se disponíveis
-                imposto = det.find('nfe:imposto', ns)
-                if not imposto:
-                    imposto = det.find('imposto')
-                    
-                if imposto is not None:
-                    # ICMS
-                    icms = imposto.find('.//nfe:ICMS', ns)
-                    if not icms:
-                        icms = imposto.find('.//ICMS')
-                        
-                    if icms is not None:
-                        # Tentar encontrar o valor do ICMS em qualquer subgrupo do ICMS
-                        for icms_tag in icms:
-                            valor_icms = self._extrair_valor_seguro(icms_tag, ns, 'nfe:vICMS', None)
-                            if valor_icms is not None:
-                                item_vals['valor_icms'] = valor_icms
-                                break
-                    
-                    # IPI
-                    ipi = imposto.find('.//nfe:IPI', ns)
-                    if not ipi:
-                        ipi = imposto.find('.//IPI')
-                        
-                    if ipi is not None:
-                        # Tentar encontrar o valor do IPI em qualquer subgrupo do IPI
-                        for ipi_tag in ipi:
-                            valor_ipi = self._extrair_valor_seguro(ipi_tag, ns, 'nfe:vIPI', None)
-                            if valor_ipi is not None:
-                                item_vals['valor_ipi'] = valor_ipi
-                                break
-                    
-                    # PIS
-                    pis = imposto.find('.//nfe:PIS', ns)
-                    if not pis:
-                        pis = imposto.find('.//PIS')
-                        
-                    if pis is not None:
-                        # Tentar encontrar o valor do PIS em qualquer subgrupo do PIS
-                        for pis_tag in pis:
-                            valor_pis = self._extrair_valor_seguro(pis_tag, ns, 'nfe:vPIS', None)
-                            if valor_pis is not None:
-                                item_vals['valor_pis'] = valor_pis
-                                break
-                    
-                    # COFINS
-                    cofins = imposto.find('.//nfe:COFINS', ns)
-                    if not cofins:
-                        cofins = imposto.find('.//COFINS')
-                        
-                    if cofins is not None:
-                        # Tentar encontrar o valor do COFINS em qualquer subgrupo do COFINS
-                        for cofins_tag in cofins:
-                            valor_cofins = self._extrair_valor_seguro(cofins_tag, ns, 'nfe:vCOFINS', None)
-                            if valor_cofins is not None:
-                                item_vals['valor_cofins'] = valor_cofins
-                                break
-                
-                item = self.env['importar_nfe.item'].create(item_vals)
-                
-                # Criar relacionamento NFe-Item
-                self.env['importar_nfe.nfe.item'].create({
-                    'nfe_id': nfe.id,
-                    'item_id': item.id,
-                })
-            
-            # Registrar mensagem no chatter apenas se não estiver desabilitado
-            if not disable_messaging:
-                nfe.message_post(
-                    body=_("NFe importada com sucesso. Chave de acesso: %s") % chave_acesso,
-                    subject=_("Importação de NFe")
-                )
-            
-            return nfe
+            return self._importar_dados(
+                lambda parar_se: nfe_parser.ler_nfe_arvore(tree.getroot(), parar_se),
+                xml_content, disable_messaging)
+        except Exception as e:
+            _logger.error("Erro ao importar XML: %s", str(e), exc_info=True)
+            raise UserError(_('Erro ao importar XML: %s') % str(e))
+    
+    def importar_xml_stream(self, xml_content, disable_messaging=True):
+        """Importa um XML de NFe lendo o documento em streaming
+        
+        Diferente de importar_xml, o XML é lido direto dos bytes por
+        nfe_parser.ler_nfe (em streaming, sem montar a árvore inteira, se
+        for muito grande) e nada é gravado se a chave revela uma NFe já
+        importada.
+        
+        Args:
+            xml_content: bytes (ou memoryview) com o conteúdo original do XML
+            disable_messaging: Se True, desativa mensagens de sistema durante importação em massa
+        """
+        try:
+            return self._importar_dados(
+                lambda parar_se: nfe_parser.ler_nfe(xml_content, parar_se),
+                xml_content, disable_messaging)
+        except Exception as e:
+            _logger.error("Erro ao importar XML: %s", str(e), exc_info=True)
+            raise UserError(_('Erro ao importar XML: %s') % str(e))
+    
+    def importar_dados_lidos(self, dados, xml_content, disable_messaging=True, cadastros=None,
+                             chaves_novas=None):
+        """Importa uma NFe já lida fora do ORM (ex.: em um processo de leitura)
+        
+        Args:
+            dados: nfe_parser.NFeDados produzido por ler_nfe
+            xml_content: bytes originais do XML
+            disable_messaging: Se True, desativa mensagens de sistema durante importação em massa
+            cadastros: ids de emitentes, destinatários e produtos já resolvidos
+                para o lote (ver _resolver_cadastros)
+            chaves_novas: chaves que o lote já sabe não estarem importadas
+                (ver _chaves_existentes); dispensam a busca pela chave
+        """
+        try:
+            return self._importar_dados(
+                lambda parar_se: None if parar_se(dados.chave_acesso) else dados,
+                xml_content, disable_messaging, cadastros, chaves_novas)
         except Exception as e:
             _logger.error("Erro ao importar XML: %s", str(e), exc_info=True)
             raise UserError(_('Erro ao importar XML: %s') % str(e))
+    
+    def _valores_parte(self, parte, nome_padrao):
+        """Monta os valores de emitente/destinatário a partir de um nfe_parser.Parte"""
+        return {
+            'name': parte.nome or nome_padrao,
+            'cnpj': parte.cnpj or False,
+            'cpf': parte.cpf or False,
+            'ie': parte.ie or '',
+            'logradouro': parte.logradouro or '',
+            'numero': parte.numero or '',
+            'complemento': parte.complemento or '',
+            'bairro': parte.bairro or '',
+            'municipio': parte.municipio or '',
+            'uf': parte.uf or '',
+            'cep': parte.cep or '',
+            'telefone': parte.telefone or '',
+        }
+    
+    def _destinatario_da_nfe(self, dest):
+        """Chave de busca (campo, valor) e valores de criação do destinatário
+        
+        O destinatário é identificado pelo CNPJ, pelo CPF ou, sem nenhum dos
+        dois, pelo nome; NFes sem destinatário usam o Destinatário Padrão.
+        """
+        if not dest:
+            return ('name', 'Destinatário Padrão'), {
+                'name': 'Destinatário Padrão',
+                'cnpj': False,
+                'cpf': False,
+                'ie': '',
+            }
+        if not dest.cnpj and not dest.cpf:
+            valores = self._valores_parte(dest, 'Destinatário Desconhecido')
+            return ('name', valores['name']), valores
+        valores = self._valores_parte(dest, 'Destinatário')
+        if dest.cnpj:
+            return ('cnpj', dest.cnpj), valores
+        return ('cpf', dest.cpf), valores
+    
+    def _produto_do_item(self, det):
+        """Chave de busca (campo, valor) e valores de criação do produto de um item"""
+        codigo_produto = det.codigo or 'SEM_CODIGO'
+        return ('codigo', codigo_produto), {
+            'name': det.descricao or 'Produto',
+            'codigo': codigo_produto,
+            'descricao': det.descricao or '',
+            'ncm': det.ncm or '',
+            'cfop': det.cfop or '',
+            'unidade': det.unidade or '',
+        }
+    
+    @api.model
+    def _resolver_cadastros(self, lista_dados):
+        """Resolve de uma vez os emitentes, destinatários e produtos de várias NFes
+        
+        Reúne os CNPJs, CPFs e códigos de produto de todas as NFes, busca os
+        cadastros existentes com uma consulta por modelo e cria os que faltam
+        com um único create por modelo. Cadastros arquivados também são
+        encontrados, pois violariam as restrições de unicidade.
+        
+        Args:
+            lista_dados: NFeDados lidos por nfe_parser
+        
+        Returns:
+            dicionário com os ids de 'emitentes', 'destinatarios' e
+            'produtos', cada um indexado pela chave (campo, valor)
+        """
+        emitentes, destinatarios, produtos = {}, {}, {}
+        for dados in lista_dados:
+            emit = dados.emitente
+            if emit and emit.cnpj and ('cnpj', emit.cnpj) not in emitentes:
+                emitente_vals = self._valores_parte(emit, 'Emitente')
+                del emitente_vals['cpf']
+                emitentes[('cnpj', emit.cnpj)] = emitente_vals
+            chave, destinatario_vals = self._destinatario_da_nfe(dados.destinatario)
+            destinatarios.setdefault(chave, destinatario_vals)
+            for det in dados.itens:
+                chave, produto_vals = self._produto_do_item(det)
+                produtos.setdefault(chave, produto_vals)
+        
+        return {
+            'emitentes': self._buscar_ou_criar('importar_nfe.emitente', emitentes),
+            'destinatarios': self._buscar_ou_criar('importar_nfe.destinatario', destinatarios),
+            'produtos': self._buscar_ou_criar('importar_nfe.produto', produtos),
+        }
+    
+    @api.model
+    def _buscar_ou_criar(self, modelo, valores_por_chave):
+        """Ids dos registros do modelo para cada chave (campo, valor), criando os ausentes
+        
+        Uma consulta para todas as chaves e um único create para as que não
+        existem; havendo mais de um registro para a chave, vale o mais antigo.
+        """
+        if not valores_por_chave:
+            return {}
+        valores_por_campo = {}
+        for campo, valor in valores_por_chave:
+            valores_por_campo.setdefault(campo, set()).add(valor)
+        dominio = expression.OR([[(campo, 'in', list(valores))] for campo, valores in valores_por_campo.items()])
+        
+        ids = {}
+        registros = self.env[modelo].with_context(active_test=False).search_read(
+            dominio, list(valores_por_campo), order='id')
+        for registro in registros:
+            for campo in valores_por_campo:
+                chave = (campo, registro[campo])
+                if chave in valores_por_chave:
+                    ids.setdefault(chave, registro['id'])
+        
+        faltantes = [chave for chave in valores_por_chave if chave not in ids]
+        if faltantes:
+            novos = self.env[modelo].create([valores_por_chave[chave] for chave in faltantes])
+            ids.update(zip(faltantes, novos.ids))
+        return ids
+    
+    def _cadastros_resolvidos(self, dados, cadastros):
+        """Indica se os cadastros resolvidos incluem todos os da NFe"""
+        return (('cnpj', dados.emitente.cnpj) in cadastros['emitentes']
+                and self._destinatario_da_nfe(dados.destinatario)[0] in cadastros['destinatarios']
+                and all(self._produto_do_item(det)[0] in cadastros['produtos'] for det in dados.itens))
+    
+    def _salvar_xml_original(self, xml_content):
+        """Grava os bytes originais do XML no anexo do campo xml_original
+        
+        O conteúdo é gravado como está (raw), sem re-serializar a árvore nem
+        passar por base64, mantendo o XML idêntico ao arquivo recebido para
+        futuras verificações da assinatura.
+        """
+        self.ensure_one()
+        self.env['ir.attachment'].sudo().create({
+            'name': 'xml_original',
+            'res_model': self._name,
+            'res_field': 'xml_original',
+            'res_id': self.id,
+            'type': 'binary',
+            'mimetype': 'application/xml',
+            'raw': xml_content,
+        })
+    
+    def _persistir_nfe(self, dados, xml_content, disable_messaging=True, cadastros=None):
+        """Cria a NFe, seus parceiros, produtos e itens a partir dos registros lidos
+        
+        Args:
+            dados: nfe_parser.NFeDados produzido por ler_nfe ou ler_nfe_arvore
+            xml_content: bytes (ou memoryview) originais do XML
+            disable_messaging: Se True, desativa mensagens de sistema durante importação em massa
+            cadastros: ids de emitentes, destinatários e produtos já resolvidos
+                para o lote (ver _resolver_cadastros); o que faltar é
+                resolvido aqui, só para esta NFe
+        """
+        chave_acesso = dados.chave_acesso
+        if not nfe_parser.chave_valida(chave_acesso):
+            _logger.warning("Chave de acesso %s com formato ou dígito verificador inválido.", chave_acesso)
+        
+        # Dados do emitente
+        emit = dados.emitente
+        if not emit:
+            raise UserError(_('XML inválido: elemento emit não encontrado.'))
+        
+        if not emit.cnpj:
+            raise UserError(_('XML inválido: CNPJ do emitente não encontrado.'))
+        
+        # Dados do destinatário
+        dest = dados.destinatario
+        if not dest:
+            _logger.warning("Elemento dest não encontrado no XML. Usando destinatário padrão.")
+        elif not dest.cnpj and not dest.cpf:
+            _logger.warning("CNPJ/CPF do destinatário não encontrado. Usando identificador alternativo.")
+        
+        # Buscar ou criar emitente, destinatário e produtos
+        if cadastros is None or not self._cadastros_resolvidos(dados, cadastros):
+            cadastros = self._resolver_cadastros([dados])
+        emitente_id = cadastros['emitentes'][('cnpj', emit.cnpj)]
+        destinatario_id = cadastros['destinatarios'][self._destinatario_da_nfe(dest)[0]]
+        
+        # Identificação da NFe
+        ide = dados.identificacao
+        if not ide:
+            # Número, série, modelo e mês de emissão estão codificados na chave
+            ide = nfe_parser.identificacao_da_chave(chave_acesso)
+            if ide:
+                _logger.warning('Elemento ide não encontrado no XML. Usando dados da chave de acesso.')
+            else:
+                _logger.warning('Elemento ide não encontrado no XML. Usando valores padrão.')
+                ide = nfe_parser.Identificacao()
+        
+        # Valores totais
+        total = dados.totais
+        if not total:
+            _logger.warning('Elemento total não encontrado no XML. Usando valores padrão.')
+            # Usar valores zerados para os campos financeiros quando não encontrar o elemento total
+            total = nfe_parser.Totais()
+        
+        # Sem data de emissão válida no XML: primeiro dia do mês codificado na
+        # chave, à meia-noite local
+        data_emissao = self._parsear_data(ide.data_emissao)
+        if not data_emissao:
+            ide_chave = nfe_parser.identificacao_da_chave(chave_acesso)
+            data_emissao = self._parsear_data(ide_chave.data_emissao) if ide_chave else False
+        
+        # Preparar valores da NFe
+        nfe_vals = {
+            'name': ide.numero or 'Novo',
+            'chave_acesso': chave_acesso,
+            'numero': ide.numero or '',
+            'serie': ide.serie or '',
+            'modelo': ide.modelo or '',
+            'tipo_operacao': 'entrada',  # Padrão é entrada
+            'data_emissao': data_emissao,
+            'data_entrada': self._parsear_data(ide.data_entrada),
+            'emitente_id': emitente_id,
+            'destinatario_id': destinatario_id,
+            'state': 'imported',
+            'xml_nome': f"NFe_{chave_acesso}.xml",
+        }
+        # Os atributos de Totais têm os mesmos nomes dos campos da NFe
+        for campo in nfe_parser.CAMPOS_TOTAL.values():
+            nfe_vals[campo] = getattr(total, campo)
+        
+        # Criar NFe sem disparar mensagens de sistema se solicitado
+        context = self.env.context.copy()
+        if disable_messaging:
+            context['tracking_disable'] = True
+            context['mail_create_nosubscribe'] = True
+            context['mail_auto_subscribe_no_notify'] = True
+            context['mail_notrack'] = True
+            
+        nfe = self.with_context(context).create(nfe_vals)
+        nfe._salvar_xml_original(xml_content)
+        
+        # Processar itens
+        if not dados.itens:
+            _logger.warning("Nenhum item encontrado na NFe %s", chave_acesso)
+        
+        # Itens e relacionamentos NFe-Item criados com um create cada: os campos
+        # relacionados dos itens e a quantidade de itens da NFe são calculados uma vez
+        itens_vals = []
+        for det in dados.itens:
+            impostos = det.impostos
+            itens_vals.append({
+                'nfe_id': nfe.id,
+                'produto_id': cadastros['produtos'][self._produto_do_item(det)[0]],
+                'numero_item': det.numero_item,
+                'quantidade': det.quantidade,
+                'valor_unitario': det.valor_unitario,
+                'valor_total': det.valor_total,
+                'valor_desconto': det.valor_desconto,
+                'valor_icms': impostos.valor_icms,
+                'valor_ipi': impostos.valor_ipi,
+                'valor_pis': impostos.valor_pis,
+                'valor_cofins': impostos.valor_cofins,
+            })
+        
+        if itens_vals:
+            itens = self.env['importar_nfe.item'].with_context(context).create(itens_vals)
+            self.env['importar_nfe.nfe.item'].create([{
+                'nfe_id': nfe.id,
+                'item_id': item.id,
+            } for item in itens])
+        
+        # Registrar mensagem no chatter apenas se não estiver desabilitado
+        if not disable_messaging:
+            nfe.message_post(
+                body=_("NFe importada com sucesso. Chave de acesso: %s") % chave_acesso,
+                subject=_("Importação de NFe")
+            )
+        
+        return nfe
             
     def toggle_active(self):
         """Alterna o estado ativo/arquivado da NFe."""
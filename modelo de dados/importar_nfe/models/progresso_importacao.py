@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+
+class ImportarNFeProgressoImportacao(models.Model):
+    """Progresso de uma importação em andamento
+
+    Uma linha por wizard ou importação em segundo plano (res_model/res_id),
+    atualizada pelo importador em um cursor próprio: o progresso fica
+    visível assim que é gravado, sem esperar o commit do lote, e consultá-lo
+    não toca no registro da importação. Cada atualização também é enviada
+    pelo bus ao usuário que executa a importação.
+    """
+    _name = 'importar_nfe.progresso_importacao'
+    _description = 'Progresso de Importação de NFe'
+    _order = 'id desc'
+
+    res_model = fields.Char(string='Modelo de Origem', required=True, readonly=True)
+    res_id = fields.Many2oneReference(string='Registro de Origem', model_field='res_model',
+                                      required=True, readonly=True)
+    estado = fields.Selection([
+        ('executando', 'Em Execução'),
+        ('concluida', 'Concluída'),
+        ('parcial', 'Parcial'),
+        ('erro', 'Erro'),
+    ], string='Status', required=True, default='executando', readonly=True)
+    arquivos_retomados = fields.Integer(string='Arquivos de Execuções Anteriores', readonly=True,
+                                        help='Arquivos já processados quando esta execução começou (retomada)')
+    arquivos_encontrados = fields.Integer(string='Arquivos Encontrados', readonly=True)
+    arquivos_processados = fields.Integer(string='Arquivos Processados', readonly=True)
+    arquivos_lidos = fields.Integer(string='Arquivos Lidos', readonly=True,
+                                    help='Arquivos cujo XML foi lido e interpretado')
+    total_importados = fields.Integer(string='Importados', readonly=True)
+    total_duplicados = fields.Integer(string='Já Importados', readonly=True)
+    total_erros = fields.Integer(string='Erros', readonly=True)
+    total_estimado = fields.Integer(string='Total Estimado', readonly=True)
+    data_inicio = fields.Datetime(string='Início', readonly=True)
+    data_atualizacao = fields.Datetime(string='Atualizado em', readonly=True)
+
+    _sql_constraints = [
+        ('origem_uniq', 'unique(res_model, res_id)', 'Já existe progresso para esta importação!')
+    ]
+
+    @api.model
+    def _atualizar(self, valores):
+        """Cria ou atualiza o progresso da importação e o envia pelo bus
+
+        Args:
+            valores: campos do progresso, incluindo res_model e res_id
+        """
+        progresso = self.search([
+            ('res_model', '=', valores['res_model']),
+            ('res_id', '=', valores['res_id']),
+        ], limit=1)
+        if progresso:
+            progresso.write(valores)
+        else:
+            progresso = self.create(valores)
+        self.env['bus.bus']._sendone(self.env.user.partner_id, 'importar_nfe/progresso', progresso._como_dict())
+        return progresso
+
+    def _como_dict(self):
+        """Progresso em formato JSON, com vazão (arquivos/s) e tempo restante estimado"""
+        self.ensure_one()
+        decorrido = 0.0
+        if self.data_inicio and self.data_atualizacao:
+            decorrido = (self.data_atualizacao - self.data_inicio).total_seconds()
+        vazao = (self.arquivos_processados - self.arquivos_retomados) / decorrido if decorrido > 0 else None
+        restante = None
+        if vazao and self.total_estimado and self.estado == 'executando':
+            restante = max(self.total_estimado - self.arquivos_processados, 0) / vazao
+        return {
+            'res_model': self.res_model,
+            'res_id': self.res_id,
+            'estado': self.estado,
+            'arquivos_encontrados': self.arquivos_encontrados,
+            'arquivos_processados': self.arquivos_processados,
+            'arquivos_lidos': self.arquivos_lidos,
+            'importados': self.total_importados,
+            'duplicados': self.total_duplicados,
+            'erros': self.total_erros,
+            'total_estimado': self.total_estimado or None,
+            'inicio': fields.Datetime.to_string(self.data_inicio),
+            'atualizacao': fields.Datetime.to_string(self.data_atualizacao),
+            'arquivos_por_segundo': round(vazao, 2) if vazao else None,
+            'segundos_restantes': round(restante) if restante is not None else None,
+        }
+
+    @api.autovacuum
+    def _gc_progressos_orfaos(self):
+        """Remove o progresso de wizards e importações que já foram excluídos"""
+        for modelo in ('importar_nfe.wizard', 'importar_nfe.importacao', 'importar_nfe.caixa_entrada'):
+            self.env.cr.execute(f"""
+                DELETE FROM importar_nfe_progresso_importacao p
+                 WHERE p.res_model = %s
+                   AND NOT EXISTS (SELECT 1 FROM {self.env[modelo]._table} r WHERE r.id = p.res_id)
+            """, (modelo,))
@@ -3,18 +3,17 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 import base64
-import xml.etree.ElementTree as ET
+import collections
+import io
+import itertools
 import os
-import glob
 import logging
-import tempfile
-import datetime
-import gc
 
 _logger = logging.getLogger(__name__)
 
 class ImportarNFeWizard(models.TransientModel):
     _name = 'importar_nfe.wizard'
+    _inherit = ['importar_nfe.importador']
     _description = 'Wizard para importar NFe'
 
     modo_importacao = fields.Selection([
@@ -25,23 +24,20 @@ class ImportarNFeWizard(models.TransientModel):
 
     arquivo_xml = fields.Binary(string='Arquivo XML')
     arquivo_xml_nome = fields.Char(string='Nome do Arquivo XML')
-    arquivos_xml = fields.Binary(string='Arquivos XML')
-    arquivos_xml_nomes = fields.Char(string='Nomes dos Arquivos XML')
+    arquivo_ids = fields.One2many('importar_nfe.arquivo', 'wizard_id', string='Arquivos XML',
+                                  help='Arquivos XML ou ZIP; todos são importados juntos, em lotes')
     pasta_path = fields.Char(string='Caminho da Pasta')
     incluir_subpastas = fields.Boolean(string='Incluir Subpastas', default=True,
                                       help='Se marcado, buscará arquivos XML em todas as subpastas')
-    
-    # Campos informativos
-    total_importados = fields.Integer(string='Total Importados', readonly=True, default=0)
-    total_erros = fields.Integer(string='Total Erros', readonly=True, default=0)
-    mensagem_log = fields.Text(string='Log de Importação', readonly=True)
+    executar_em_segundo_plano = fields.Boolean(string='Executar em Segundo Plano', default=True,
+                                               help='Se marcado, a importação da pasta é feita por uma tarefa agendada, '
+                                                    'com gravação a cada lote e retomada automática após interrupções')
 
     @api.onchange('modo_importacao')
     def _onchange_modo_importacao(self):
         """Limpa os campos não utilizados quando o modo de importação muda"""
         if self.modo_importacao == 'arquivo_unico':
-            self.arquivos_xml = False
-            self.arquivos_xml_nomes = False
+            self.arquivo_ids = [(5, 0, 0)]
             self.pasta_path = False
         elif self.modo_importacao == 'multiplos_arquivos':
             self.arquivo_xml = False
@@ -50,14 +46,13 @@ class ImportarNFeWizard(models.TransientModel):
         elif self.modo_importacao == 'pasta':
             self.arquivo_xml = False
             self.arquivo_xml_nome = False
-            self.arquivos_xml = False
-            self.arquivos_xml_nomes = False
+            self.arquivo_ids = [(5, 0, 0)]
 
     def action_import(self):
         # Validar campos obrigatórios
         if self.modo_importacao == 'arquivo_unico' and not self.arquivo_xml:
             raise UserError(_('Por favor, selecione um arquivo XML.'))
-        elif self.modo_importacao == 'multiplos_arquivos' and not self.arquivos_xml:
+        elif self.modo_importacao == 'multiplos_arquivos' and not self.arquivo_ids:
             raise UserError(_('Por favor, selecione os arquivos XML.'))
         elif self.modo_importacao == 'pasta' and not self.pasta_path:
             raise UserError(_('Por favor, digite o caminho da pasta.'))
@@ -65,56 +60,26 @@ class ImportarNFeWizard(models.TransientModel):
         # Reiniciar contadores e log
         self.total_importados = 0
         self.total_erros = 0
-        self.mensagem_log = ''
+        self.total_duplicados = 0
+        self._limpar_log()
         
         # Chamar o método de importação adequado
-        if self.modo_importacao == 'arquivo_unico':
-            return self._importar_arquivo_unico()
-        elif self.modo_importacao == 'multiplos_arquivos':
-            return self._importar_multiplos_arquivos()
-        elif self.modo_importacao == 'pasta':
-            return self._importar_da_pasta()
-
-    def _adicionar_log(self, mensagem):
-        """Adiciona uma mensagem ao log de importação"""
-        # Se a mensagem já tem formatação HTML completa, adicionar diretamente
-        if mensagem.startswith('<div') or mensagem.startswith('<span'):
-            html_mensagem = mensagem + '\n'
-        else:
-            # Adicionar timestamp para mensagens regulares
-            timestamp = datetime.datetime.now().strftime('%H:%M:%S')
-            
-            # Formatar a mensagem com HTML para melhor visualização
-            if mensagem.startswith(' Erro') or 'Erro ao processar' in mensagem:
-                html_mensagem = f'<span style="color: red;">[{timestamp}] {mensagem}</span><br/>\n'
-            elif mensagem.startswith(' Arquivo') and 'importado com sucesso' in mensagem:
-                html_mensagem = f'<span style="color: green;">[{timestamp}] {mensagem}</span><br/>\n'
-            elif 'Progresso:' in mensagem:
-                html_mensagem = f'<span style="color: blue; font-weight: bold;">[{timestamp}] {mensagem}</span><br/>\n'
-            elif '<strong>' in mensagem:
-                # Já tem formatação, só adicionar timestamp
-                html_mensagem = f'[{timestamp}] {mensagem}<br/>\n'
-            else:
-                html_mensagem = f'[{timestamp}] {mensagem}<br/>\n'
-        
-        self.mensagem_log = (self.mensagem_log or '') + html_mensagem
-        _logger.info(mensagem.replace('<strong>', '').replace('</strong>', '').replace('<br/>', ''))
-
-    def _importar_xml_seguro(self, xml_content, nome_arquivo=''):
-        """Importa um XML de forma segura, tratando exceções"""
         try:
-            tree = ET.ElementTree(ET.fromstring(xml_content))
-            # Passar parâmetro para desativar mensagens durante importações em massa
-            nfe = self.env['importar_nfe.nfe'].importar_xml(tree, disable_messaging=True)
-            self.total_importados += 1
-            self._adicionar_log(f' Arquivo {nome_arquivo} importado com sucesso: NFe {nfe.name} - Chave {nfe.chave_acesso}')
-            return nfe
-        except Exception as e:
-            self.total_erros += 1
-            erro_msg = str(e)
-            self._adicionar_log(f' Erro ao importar arquivo {nome_arquivo}: {erro_msg}')
-            _logger.error(f"Erro ao importar arquivo {nome_arquivo}: {erro_msg}", exc_info=True)
-            return False
+            if self.modo_importacao == 'arquivo_unico':
+                acao = self._importar_arquivo_unico()
+            elif self.modo_importacao == 'multiplos_arquivos':
+                acao = self._importar_multiplos_arquivos()
+            elif self.executar_em_segundo_plano:
+                acao = self._criar_importacao_em_segundo_plano()
+            else:
+                acao = self._importar_da_pasta()
+        except Exception:
+            # A transação será desfeita: os eventos pendentes do log não se aplicam
+            self._descartar_log()
+            self._progresso_finalizar('erro')
+            raise
+        self._gravar_log()
+        return acao
 
     def _importar_arquivo_unico(self):
         try:
@@ -131,7 +96,6 @@ class ImportarNFeWizard(models.TransientModel):
                     'view_mode': 'form',
                     'res_id': self.id,
                     'target': 'new',
-                    'context': {'default_mensagem_log': self.mensagem_log}
                 }
             
             return {
@@ -146,51 +110,10 @@ class ImportarNFeWizard(models.TransientModel):
 
     def _importar_multiplos_arquivos(self):
         try:
-            self._adicionar_log('Iniciando importação de múltiplos arquivos')
+            self._adicionar_log(f'Iniciando importação de {len(self.arquivo_ids)} arquivos enviados')
             
-            # Criar diretório temporário para salvar os arquivos
-            temp_dir = tempfile.mkdtemp()
-            self._adicionar_log(f'Diretório temporário criado: {temp_dir}')
-            
-            # Extrair arquivos do campo binário
-            xml_content = base64.b64decode(self.arquivos_xml)
-            
-            # Salvar o conteúdo em um arquivo temporário
-            temp_zip = os.path.join(temp_dir, 'arquivos.zip')
-            with open(temp_zip, 'wb') as f:
-                f.write(xml_content)
-            
-            # Tentar descompactar se for um arquivo zip
-            try:
-                import zipfile
-                with zipfile.ZipFile(temp_zip, 'r') as zip_ref:
-                    zip_ref.extractall(temp_dir)
-                self._adicionar_log('Arquivos ZIP extraídos com sucesso')
-            except:
-                self._adicionar_log('Não foi possível extrair como ZIP, tentando processar como XML único')
-                # Se não for um ZIP, tenta processar como um único XML
-                with open(temp_zip, 'rb') as f:
-                    xml_content = f.read()
-                    self._importar_xml_seguro(xml_content, 'arquivo.xml')
-            
-            # Procurar por arquivos XML no diretório temporário
-            arquivos_xml = glob.glob(os.path.join(temp_dir, '**', '*.xml'), recursive=True)
-            self._adicionar_log(f'Encontrados {len(arquivos_xml)} arquivos XML')
-            
-            nfes_importadas = []
-            for arquivo in arquivos_xml:
-                try:
-                    with open(arquivo, 'rb') as f:
-                        xml_content = f.read()
-                        nfe = self._importar_xml_seguro(xml_content, os.path.basename(arquivo))
-                        if nfe:
-                            nfes_importadas.append(nfe.id)
-                except Exception as e:
-                    self._adicionar_log(f' Erro ao processar arquivo {os.path.basename(arquivo)}: {str(e)}')
-            
-            # Limpar diretório temporário
-            import shutil
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            # Todos os arquivos (XMLs e XMLs de dentro dos ZIPs) passam pelos mesmos lotes
+            nfes_importadas = self._importar_conteudos(self._conteudos_recebidos(self._abrir_arquivos_enviados()))
             
             self._adicionar_log(f'Importação concluída. Total importados: {self.total_importados}. Total erros: {self.total_erros}')
             
@@ -201,7 +124,6 @@ class ImportarNFeWizard(models.TransientModel):
                     'view_mode': 'form',
                     'res_id': self.id,
                     'target': 'new',
-                    'context': {'default_mensagem_log': self.mensagem_log}
                 }
             
             return {
@@ -214,6 +136,99 @@ class ImportarNFeWizard(models.TransientModel):
         except Exception as e:
             raise UserError(_('Erro ao importar arquivos: %s') % str(e))
 
+    def _abrir_arquivos_enviados(self):
+        """Gera (nome, arquivo binário) de cada arquivo enviado (importar_nfe.arquivo)
+        
+        O conteúdo de cada arquivo fica em um anexo; quando armazenado no
+        filestore, o arquivo é aberto diretamente do disco, sem decodificar o
+        base64 nem carregar o upload em memória. Cada arquivo fica aberto
+        apenas enquanto seus XMLs são consumidos.
+        """
+        anexos = {
+            anexo.res_id: anexo
+            for anexo in self.env['ir.attachment'].sudo().search([
+                ('res_model', '=', 'importar_nfe.arquivo'),
+                ('res_field', '=', 'arquivo'),
+                ('res_id', 'in', self.arquivo_ids.ids),
+            ])
+        }
+        for registro in self.arquivo_ids:
+            anexo = anexos.get(registro.id)
+            nome = registro.nome or (anexo and anexo.name) or 'arquivo.xml'
+            try:
+                if anexo and anexo.store_fname:
+                    arquivo = open(anexo._full_path(anexo.store_fname), 'rb')
+                else:
+                    arquivo = io.BytesIO(anexo.raw if anexo else base64.b64decode(registro.arquivo or b''))
+            except (OSError, ValueError) as e:
+                yield nome, e
+                continue
+            with arquivo:
+                yield nome, arquivo
+
+    @api.model
+    def importar_xmls(self, arquivos):
+        """Importa um lote de XMLs enviados por uma integração (JSON-RPC/XML-RPC)
+        
+        Os XMLs passam pela importação em lotes (verificação de duplicados
+        pela chave, um savepoint por arquivo, gravação a cada lote). ZIPs são
+        reconhecidos pelo conteúdo e têm seus XMLs importados.
+        
+        Args:
+            arquivos: lista de dicionários {'nome': nome do arquivo,
+                'conteudo': XML ou ZIP em base64}
+        
+        Returns:
+            dicionário com o id da importação (wizard), os totais e, em
+            'resultados', um item por XML com arquivo, resultado ('importado',
+            'duplicado' ou 'erro'), nfe_id e erro
+        """
+        def abrir():
+            for arquivo in arquivos:
+                nome = arquivo.get('nome') or 'arquivo.xml'
+                try:
+                    yield nome, io.BytesIO(base64.b64decode(arquivo.get('conteudo') or b''))
+                except (TypeError, ValueError) as e:
+                    yield nome, e
+        return self._importar_arquivos_recebidos(abrir())
+    
+    @api.model
+    def _importar_arquivos_recebidos(self, arquivos):
+        """Importa arquivos recebidos por uma integração em um novo wizard
+        
+        Args:
+            arquivos: iterável de tuplas (nome, arquivo binário com seek); no
+                lugar do arquivo, uma exceção indica que ele não pôde ser lido
+        
+        Returns:
+            o mesmo dicionário de importar_xmls
+        """
+        wizard = self.create({'modo_importacao': 'multiplos_arquivos'})
+        wizard._adicionar_log('Iniciando importação de arquivos recebidos por integração')
+        # Gravar o wizard antes dos lotes: um lote com erro volta até o último
+        # commit e não pode levar o próprio wizard junto
+        wizard._gravar_log()
+        self.env.cr.commit()
+
+        resultados = []
+        try:
+            wizard._importar_conteudos(wizard._conteudos_recebidos(arquivos), resultados=resultados)
+        except Exception:
+            wizard._descartar_log()
+            wizard._progresso_finalizar('erro')
+            raise
+        wizard._gravar_log()
+
+        # Totais pelos resultados em memória, que incluem os arquivos dos lotes descartados
+        totais = collections.Counter(resultado['resultado'] for resultado in resultados)
+        return {
+            'importacao': wizard.id,
+            'importados': totais['importado'],
+            'duplicados': totais['duplicado'],
+            'erros': totais['erro'],
+            'resultados': resultados,
+        }
+    
     def _importar_da_pasta(self):
         try:
             if not os.path.exists(self.pasta_path):
@@ -225,28 +240,25 @@ class ImportarNFeWizard(models.TransientModel):
             self._adicionar_log(f'Buscando arquivos XML na pasta{" e subpastas" if self.incluir_subpastas else ""}...')
             
             try:
-                arquivos_xml = glob.glob(os.path.join(self.pasta_path, '**', '*.xml'), recursive=self.incluir_subpastas)
+                # Os arquivos são importados à medida que a varredura os encontra
+                arquivos_xml = self._percorrer_arquivos_pasta(self.pasta_path, self.incluir_subpastas)
+                primeiro_arquivo = next(arquivos_xml, None)
             except Exception as e:
-                self._adicionar_log(f'<span style="color: red;">Erro ao buscar arquivos: {str(e)}</span>')
+                self._adicionar_log(f'Erro ao buscar arquivos: {str(e)}', 'erro')
                 raise UserError(_('Erro ao buscar arquivos XML: %s') % str(e))
             
-            if not arquivos_xml:
+            if primeiro_arquivo is None:
                 if self.incluir_subpastas:
                     raise UserError(_('Nenhum arquivo XML encontrado na pasta especificada ou suas subpastas.'))
                 else:
                     raise UserError(_('Nenhum arquivo XML encontrado na pasta especificada.'))
-            
-            # Ordenar arquivos para processamento mais previsível
-            arquivos_xml.sort()
-            
-            total_arquivos = len(arquivos_xml)
-            self._adicionar_log(f'<strong>Encontrados {total_arquivos} arquivos XML</strong>')
+            arquivos_xml = itertools.chain([primeiro_arquivo], arquivos_xml)
             
             # Iniciar importação em lotes com tratamento de erros aprimorado
             try:
-                return self._importar_em_lotes(arquivos_xml)
+                nfes_importadas = self._importar_em_lotes(arquivos_xml)
             except Exception as e:
-                self._adicionar_log(f'<span style="color: red;">Erro durante o processamento em lotes: {str(e)}</span>')
+                self._adicionar_log(f'Erro durante o processamento em lotes: {str(e)}', 'erro')
                 _logger.error("Erro durante processamento em lotes: %s", str(e), exc_info=True)
                 
                 # Se houver algum problema com o processamento em lotes, 
@@ -257,130 +269,51 @@ class ImportarNFeWizard(models.TransientModel):
                     'view_mode': 'form',
                     'res_id': self.id,
                     'target': 'new',
-                    'context': {'default_mensagem_log': self.mensagem_log}
                 }
             
-        except Exception as e:
-            self._adicionar_log(f'<span style="color: red;">Erro ao importar da pasta: {str(e)}</span>')
-            raise UserError(_('Erro ao importar da pasta: %s') % str(e))
-    
-    def _importar_em_lotes(self, arquivos_xml):
-        """Importa arquivos XML em lotes para melhor gerenciamento de memória e performance"""
-        tamanho_lote = 1000  # Tamanho do lote fixo
-        total_arquivos = len(arquivos_xml)
-        total_lotes = (total_arquivos + tamanho_lote - 1) // tamanho_lote  # Arredonda para cima
-        
-        self._adicionar_log(f'<strong>Iniciando importação em {total_lotes} lotes de {tamanho_lote} arquivos</strong>')
-        
-        nfes_importadas = []
-        
-        # Processar cada lote
-        for num_lote in range(total_lotes):
-            inicio_lote = num_lote * tamanho_lote
-            fim_lote = min((num_lote + 1) * tamanho_lote, total_arquivos)
             
-            lote_atual = arquivos_xml[inicio_lote:fim_lote]
-            
-            # Informações sobre o lote
-            self._adicionar_log(f'<div style="background-color: #f0f0f0; padding: 5px; margin: 10px 0; border-left: 3px solid #875A7B;">')
-            self._adicionar_log(f'<strong>Processando lote {num_lote + 1}/{total_lotes}</strong>')
-            self._adicionar_log(f'Arquivos: {inicio_lote + 1} a {fim_lote} de {total_arquivos}')
-            self._adicionar_log(f'</div>')
+            if not nfes_importadas:
+                return {
+                    'type': 'ir.actions.act_window',
+                    'res_model': 'importar_nfe.wizard',
+                    'view_mode': 'form',
+                    'res_id': self.id,
+                    'target': 'new',
+                }
             
-            try:
-                # Processar arquivos do lote atual
-                nfes_lote = self._processar_lote(lote_atual, inicio_lote)
-                nfes_importadas.extend(nfes_lote)
-                
-                # Limpar cache e liberar memória
-                self._limpar_recursos()
-                
-                # Adicionar resumo do lote
-                self._adicionar_log(f'<div style="background-color: #f0f0f0; padding: 5px; margin: 10px 0; border-left: 3px solid #28a745;">')
-                self._adicionar_log(f'<strong>Lote {num_lote + 1} concluído com sucesso</strong>')
-                self._adicionar_log(f'NFes importadas no lote: {len(nfes_lote)}')
-                self._adicionar_log(f'Total importadas até agora: {len(nfes_importadas)}')
-                self._adicionar_log(f'</div>')
-                
-            except Exception as e:
-                # Adicionar informação do erro
-                self._adicionar_log(f'<div style="background-color: #f0f0f0; padding: 5px; margin: 10px 0; border-left: 3px solid #dc3545;">')
-                self._adicionar_log(f'<strong>Erro no lote {num_lote + 1}</strong>')
-                self._adicionar_log(f'Detalhes: {str(e)}')
-                self._adicionar_log(f'</div>')
-                
-                _logger.error(f"Erro ao processar lote {num_lote + 1}: {str(e)}", exc_info=True)
-        
-        # Resumo final
-        self._adicionar_log(f'<div style="background-color: #f0f0f0; padding: 10px; margin: 10px 0; border-left: 5px solid #17a2b8;">')
-        self._adicionar_log(f'<strong>Importação concluída</strong>')
-        self._adicionar_log(f'Total de lotes processados: {total_lotes}')
-        self._adicionar_log(f'Total de arquivos: {total_arquivos}')
-        self._adicionar_log(f'Total de NFes importadas: {len(nfes_importadas)}')
-        self._adicionar_log(f'Total de sucessos: {self.total_importados}')
-        self._adicionar_log(f'Total de erros: {self.total_erros}')
-        self._adicionar_log(f'</div>')
-        
-        if not nfes_importadas:
             return {
                 'type': 'ir.actions.act_window',
-                'res_model': 'importar_nfe.wizard',
-                'view_mode': 'form',
-                'res_id': self.id,
-                'target': 'new',
-                'context': {'default_mensagem_log': self.mensagem_log}
+                'res_model': 'importar_nfe.nfe',
+                'view_mode': 'list,form',
+                'domain': [('id', 'in', nfes_importadas)],
+                'target': 'current',
             }
-                
+            
+        except Exception as e:
+            self._adicionar_log(f'Erro ao importar da pasta: {str(e)}', 'erro')
+            raise UserError(_('Erro ao importar da pasta: %s') % str(e))
+    
+    def _criar_importacao_em_segundo_plano(self):
+        """Cria a importação da pasta em segundo plano e abre o registro para acompanhamento"""
+        if not os.path.isdir(self.pasta_path):
+            raise UserError(_('A pasta especificada não existe.'))
+        
+        importacao = self.env['importar_nfe.importacao'].create({
+            'pasta_path': self.pasta_path,
+            'incluir_subpastas': self.incluir_subpastas,
+            'processos_leitura': self.processos_leitura,
+            'modificados_desde': self.modificados_desde,
+        })
+        importacao._agendar_execucao()
+        
         return {
             'type': 'ir.actions.act_window',
-            'res_model': 'importar_nfe.nfe',
-            'view_mode': 'list,form',
-            'domain': [('id', 'in', nfes_importadas)],
+            'res_model': 'importar_nfe.importacao',
+            'view_mode': 'form',
+            'res_id': importacao.id,
             'target': 'current',
         }
     
-    def _processar_lote(self, arquivos_lote, offset_inicial):
-        """Processa um lote de arquivos XML"""
-        nfes_lote = []
-        
-        for i, arquivo in enumerate(arquivos_lote):
-            try:
-                indice_global = offset_inicial + i + 1
-                
-                with open(arquivo, 'rb') as f:
-                    xml_content = f.read()
-                    nome_arquivo = os.path.basename(arquivo)
-                    
-                    # Atualizar o log com informações do progresso
-                    if i % 10 == 0 or i == len(arquivos_lote) - 1:
-                        self._adicionar_log(f'Processando arquivo {indice_global}/{len(arquivos_lote) + offset_inicial}: {nome_arquivo}')
-                    
-                    # Importar o XML
-                    nfe = self._importar_xml_seguro(xml_content, nome_arquivo)
-                    if nfe:
-                        nfes_lote.append(nfe.id)
-                        
-                        # A cada 100 arquivos processados dentro do lote, atualizar o log
-                        if len(nfes_lote) % 100 == 0:
-                            self._adicionar_log(f'Progresso intermediário: {len(nfes_lote)} NFes importadas no lote atual')
-                            
-            except Exception as e:
-                self._adicionar_log(f'<span style="color: red;">Erro ao processar arquivo {os.path.basename(arquivo)}: {str(e)}</span>')
-                _logger.error(f"Erro ao processar arquivo {os.path.basename(arquivo)}: {str(e)}", exc_info=True)
-        
-        return nfes_lote
-    
-    def _limpar_recursos(self):
-        """Limpa cache e libera memória após processamento de um lote"""
-        # Limpar cache do ORM para evitar crescimento excessivo de memória, mas sem fechar o cursor
-        self.env.cache.clear()
-        
-        # Sugestão para o garbage collector fazer seu trabalho
-        gc.collect()
-        
-        # Registrar no log
-        self._adicionar_log('Cache limpo e memória liberada')
-
     def action_selecionar_pasta(self):
         if self.pasta_path:
             return self.action_import()
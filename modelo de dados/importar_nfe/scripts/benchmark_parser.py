@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Microbenchmark da etapa de leitura (parse) da importação de NFe
+
+Mede, de ponta a ponta, nfe_parser.ler_conteudo (XML em memória) e
+nfe_parser.ler_arquivo (leitura do disco incluída), comparando-os com a
+leitura antiga sobre os mesmos XMLs: fromstring seguido da extração por
+xpath com o mapa de namespaces e nova tentativa sem namespace a cada campo.
+A aceleração informada é a de ler_conteudo/ler_arquivo; os tempos só da
+extração, sobre árvores já montadas, aparecem em seguida para referência.
+Não requer o Odoo nem banco de dados.
+
+Uso:
+    python benchmark_parser.py                      # XMLs sintéticos
+    python benchmark_parser.py --pasta /caminho/xmls --repeticoes 5
+"""
+
+import argparse
+import glob
+import importlib.util
+import logging
+import os
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+
+
+def carregar_nfe_parser():
+    """Carrega tools/nfe_parser.py diretamente, sem importar o módulo Odoo"""
+    caminho = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools', 'nfe_parser.py')
+    spec = importlib.util.spec_from_file_location('nfe_parser', caminho)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+nfe_parser = carregar_nfe_parser()
+
+
+def gerar_xml(numero, itens):
+    """Gera um XML de NFe sintético com a quantidade de itens informada"""
+    dets = ''.join(
+        f'<det nItem="{i}"><prod><cProd>P{i}</cProd><cEAN/><xProd>Produto {i}</xProd>'
+        f'<NCM>30049099</NCM><CFOP>5102</CFOP><uCom>UN</uCom><qCom>2.0000</qCom>'
+        f'<vUnCom>10.50</vUnCom><vProd>21.00</vProd><vDesc>0.00</vDesc></prod>'
+        f'<imposto><ICMS><ICMS00><orig>0</orig><CST>00</CST><vICMS>3.78</vICMS></ICMS00></ICMS>'
+        f'<IPI><cEnq>999</cEnq><IPITrib><vIPI>0.50</vIPI></IPITrib></IPI>'
+        f'<PIS><PISAliq><vPIS>0.35</vPIS></PISAliq></PIS>'
+        f'<COFINS><COFINSAliq><vCOFINS>1.60</vCOFINS></COFINSAliq></COFINS></imposto></det>'
+        for i in range(1, itens + 1)
+    )
+    chave = f'3524051234567800019555001{numero:09d}1{numero:08d}0'
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><nfeProc xmlns="{NS_NFE}" versao="4.00">'
+        f'<NFe><infNFe Id="NFe{chave}" versao="4.00">'
+        f'<ide><cUF>35</cUF><nNF>{numero}</nNF><serie>1</serie><mod>55</mod>'
+        f'<dhEmi>2024-05-03T10:15:00-03:00</dhEmi></ide>'
+        f'<emit><CNPJ>12345678000195</CNPJ><xNome>Emitente</xNome><enderEmit><xLgr>Rua A</xLgr>'
+        f'<nro>10</nro><xMun>Sao Paulo</xMun><UF>SP</UF></enderEmit><IE>111</IE></emit>'
+        f'<dest><CPF>12345678909</CPF><xNome>Cliente</xNome></dest>{dets}'
+        f'<total><ICMSTot><vICMS>3.78</vICMS><vProd>21.00</vProd><vFrete>0</vFrete><vSeg>0</vSeg>'
+        f'<vDesc>0</vDesc><vIPI>0.50</vIPI><vPIS>0.35</vPIS><vCOFINS>1.60</vCOFINS><vOutro>0</vOutro>'
+        f'<vNF>21.00</vNF></ICMSTot></total></infNFe></NFe></nfeProc>'
+    ).encode('utf-8')
+
+
+# --- Extração antiga (reproduz _extrair_texto_seguro/_extrair_valor_seguro) ---
+
+def _texto_antigo(elemento, ns, xpath):
+    texto_elem = elemento.find(xpath, ns)
+    if texto_elem is not None and texto_elem.text:
+        return texto_elem.text.strip()
+    texto_elem = elemento.find(xpath.replace('nfe:', ''))
+    if texto_elem is not None and texto_elem.text:
+        return texto_elem.text.strip()
+    return False
+
+
+def _valor_antigo(elemento, ns, xpath):
+    try:
+        valor_elem = elemento.find(xpath, ns)
+        if valor_elem is not None and valor_elem.text:
+            return float(valor_elem.text.replace(',', '.'))
+        valor_elem = elemento.find(xpath.replace('nfe:', ''))
+        if valor_elem is not None and valor_elem.text:
+            return float(valor_elem.text.replace(',', '.'))
+    except ValueError:
+        pass
+    return None
+
+
+def extrair_antigo(root):
+    ns = {'nfe': NS_NFE}
+    inf = root.find('.//nfe:infNFe', ns)
+    dados = {'itens': []}
+    for bloco, campos, endereco in (('emit', nfe_parser.CAMPOS_PARTE, 'enderEmit'),
+                                    ('dest', nfe_parser.CAMPOS_PARTE, 'enderDest')):
+        elemento = inf.find(f'.//nfe:{bloco}', ns)
+        dados[bloco] = {c: _texto_antigo(elemento, ns, f'nfe:{c}') for c in campos}
+        dados[bloco].update({c: _texto_antigo(elemento, ns, f'nfe:{endereco}/nfe:{c}')
+                             for c in nfe_parser.CAMPOS_ENDERECO})
+    ide = inf.find('.//nfe:ide', ns)
+    dados['ide'] = {c: _texto_antigo(ide, ns, f'nfe:{c}') for c in nfe_parser.CAMPOS_IDE}
+    total = inf.find('.//nfe:total', ns)
+    dados['total'] = {c: _valor_antigo(total, ns, f'.//nfe:{c}') for c in nfe_parser.CAMPOS_TOTAL}
+    for det in inf.findall('.//nfe:det', ns):
+        prod = det.find('nfe:prod', ns)
+        item = {c: _texto_antigo(prod, ns, f'nfe:{c}') for c in nfe_parser.CAMPOS_PROD_TEXTO}
+        item.update({c: _valor_antigo(prod, ns, f'nfe:{c}') for c in nfe_parser.CAMPOS_PROD_VALOR})
+        imposto = det.find('nfe:imposto', ns)
+        for grupo, tag_valor in nfe_parser.GRUPOS_IMPOSTO.items():
+            elemento_grupo = imposto.find(f'.//nfe:{grupo}', ns)
+            if elemento_grupo is not None:
+                for subgrupo in elemento_grupo:
+                    valor = _valor_antigo(subgrupo, ns, f'nfe:{tag_valor}')
+                    if valor is not None:
+                        item[tag_valor] = valor
+                        break
+        dados['itens'].append(item)
+    return dados
+
+
+def extrair_plano(root):
+    ns = {'nfe': NS_NFE}
+    inf = root.find('.//nfe:infNFe', ns)
+    return nfe_parser.extrair_infnfe(inf)
+
+
+def ler_antigo(xml):
+    return extrair_antigo(ET.fromstring(xml))
+
+
+def ler_arquivo_antigo(caminho):
+    with open(caminho, 'rb') as f:
+        return ler_antigo(f.read())
+
+
+def ler_conteudo(xml):
+    _dados, erro = nfe_parser.ler_conteudo(xml)
+    if erro:
+        raise RuntimeError(erro)
+
+
+def ler_arquivo(caminho):
+    _dados, _conteudo, erro = nfe_parser.ler_arquivo(caminho)
+    if erro:
+        raise RuntimeError(erro)
+
+
+def consumir_stream(xml):
+    for _evento in nfe_parser.iterar_nfe(xml):
+        pass
+
+
+def medir(nome, funcao, entradas, repeticoes):
+    """Executa a função sobre todas as entradas e retorna o melhor tempo"""
+    melhor = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for entrada in entradas:
+            funcao(entrada)
+        decorrido = time.perf_counter() - inicio
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+    logger.info(f"{nome:<40} {melhor * 1000:10.1f} ms")
+    return melhor
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description='Microbenchmark da leitura de XMLs de NFe')
+    parser.add_argument('--pasta', help='Pasta com XMLs reais (padrão: XMLs sintéticos)')
+    parser.add_argument('--arquivos', type=int, default=200, help='Quantidade de XMLs sintéticos')
+    parser.add_argument('--itens', type=int, default=30, help='Itens por XML sintético')
+    parser.add_argument('--repeticoes', type=int, default=3, help='Repetições (vale o melhor tempo)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporaria:
+        if args.pasta:
+            caminhos = glob.glob(os.path.join(args.pasta, '**', '*.xml'), recursive=True)
+            xmls = []
+            for caminho in caminhos:
+                with open(caminho, 'rb') as f:
+                    xmls.append(f.read())
+        else:
+            xmls = [gerar_xml(n, args.itens) for n in range(1, args.arquivos + 1)]
+            caminhos = []
+            for n, xml in enumerate(xmls):
+                caminho = os.path.join(temporaria, f'{n}.xml')
+                with open(caminho, 'wb') as f:
+                    f.write(xml)
+                caminhos.append(caminho)
+
+        logger.info(f"{len(xmls)} XMLs, {sum(len(x) for x in xmls) / 1024:.0f} KiB")
+
+        # Leitura completa, como feita na importação
+        tempo_antigo = medir('conteúdo: fromstring + extração antiga', ler_antigo, xmls, args.repeticoes)
+        tempo_conteudo = medir('conteúdo: ler_conteudo', ler_conteudo, xmls, args.repeticoes)
+        medir('conteúdo: streaming (iterparse + plano)', consumir_stream, xmls, args.repeticoes)
+        tempo_arquivo_antigo = medir('arquivo: leitura + extração antiga', ler_arquivo_antigo,
+                                     caminhos, args.repeticoes)
+        tempo_arquivo = medir('arquivo: ler_arquivo', ler_arquivo, caminhos, args.repeticoes)
+        logger.info(f"Aceleração de ler_conteudo: {tempo_antigo / tempo_conteudo:.1f}x")
+        logger.info(f"Aceleração de ler_arquivo: {tempo_arquivo_antigo / tempo_arquivo:.1f}x")
+
+    # Só a extração, sobre árvores já montadas
+    arvores = [ET.fromstring(x) for x in xmls]
+    tempo_extracao_antiga = medir('extração antiga (xpath + retry)', extrair_antigo, arvores, args.repeticoes)
+    tempo_plano = medir('extração com plano pré-compilado', extrair_plano, arvores, args.repeticoes)
+    logger.info(f"Aceleração só da extração: {tempo_extracao_antiga / tempo_plano:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""Testes das ferramentas de tools/, que não dependem do Odoo nem de banco
+
+Os módulos de tools/ são importados diretamente (``import nfe_parser``), sem
+passar pelo pacote do módulo Odoo, como em scripts/benchmark_parser.py:
+
+    python -m pytest "modelo de dados/importar_nfe/tests"
+"""
+
+import os
+import sys
+
+PASTA_TOOLS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools')
+
+if PASTA_TOOLS not in sys.path:
+    sys.path.insert(0, PASTA_TOOLS)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Testes do dimensionamento adaptativo dos lotes (tools/dimensionamento.py)"""
+
+import pytest
+
+pytest.importorskip('psutil')
+
+import dimensionamento  # noqa: E402
+from dimensionamento import DimensionadorLote  # noqa: E402
+
+MIB = 1024 * 1024
+
+
+def test_tamanho_inicial():
+    assert DimensionadorLote(200).tamanho == dimensionamento.TAMANHO_INICIAL
+    assert DimensionadorLote(20).tamanho == 20
+    assert DimensionadorLote(0).tamanho == 1
+
+
+def test_cresce_no_maximo_o_dobro():
+    """Lotes rápidos e leves crescem até o máximo, dobrando a cada lote"""
+    dimensionador = DimensionadorLote(500)
+    tamanhos = []
+    for _ in range(5):
+        tamanhos.append(dimensionador.registrar(dimensionador.tamanho, 0.5, 100 * MIB, 100 * MIB))
+    assert tamanhos == [100, 200, 400, 500, 500]
+
+
+def test_limitado_pelo_tempo_alvo():
+    dimensionador = DimensionadorLote(500, tempo_alvo=30.0)
+    # 1 segundo por arquivo: cabem 30 arquivos no tempo alvo
+    assert dimensionador.registrar(50, 50.0, 0, 0) == 30
+
+
+def test_limitado_pela_memoria():
+    """Arquivos grandes reduzem o lote para caber abaixo do teto de memória"""
+    dimensionador = DimensionadorLote(500, limite_memoria=1000 * MIB)
+    # 4 MiB por arquivo, com 600 MiB em uso: livres 800 - 600 = 200 MiB -> 50 arquivos
+    assert dimensionador.registrar(50, 1.0, 400 * MIB, 600 * MIB) == 50
+    # Perto do teto, nunca abaixo do mínimo
+    assert dimensionador.recalcular(790 * MIB) == dimensionamento.TAMANHO_MINIMO
+
+
+def test_perto_do_limite():
+    assert not DimensionadorLote(100).perto_do_limite(10 ** 12)
+    dimensionador = DimensionadorLote(100, limite_memoria=1000)
+    assert not dimensionador.perto_do_limite(699)
+    assert dimensionador.perto_do_limite(700)
+
+
+def test_lote_vazio_nao_altera():
+    dimensionador = DimensionadorLote(100)
+    assert dimensionador.registrar(0, 1.0, 0, 0) == dimensionador.tamanho
+    assert dimensionador.segundos_por_arquivo is None
+
+
+def test_memoria_em_uso():
+    assert dimensionamento.memoria_em_uso() > 0
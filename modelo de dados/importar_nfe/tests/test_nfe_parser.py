@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""Testes da leitura de XMLs de NFe (tools/nfe_parser.py)"""
+
+import io
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+import pytest
+
+import nfe_parser
+
+NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+
+
+def montar_chave(uf='35', aamm='2405', cnpj='12345678000195', modelo='55', serie=1, numero=123):
+    """Monta uma chave de acesso com o dígito verificador correto"""
+    sem_digito = f'{uf}{aamm}{cnpj}{modelo}{serie:03d}{numero:09d}1{numero:08d}'
+    return sem_digito + str(nfe_parser.calcular_digito(sem_digito))
+
+
+CHAVE = montar_chave()
+
+
+def gerar_xml(chave=CHAVE, com_namespace=True, itens=3, id_infnfe=True, protocolo=True):
+    """Gera um XML de NFe com os blocos lidos pelo parser"""
+    dets = ''.join(
+        f'<det nItem="{i}"><prod><cProd>P{i}</cProd><xProd>Produto {i}</xProd>'
+        f'<NCM>30049099</NCM><CFOP>5102</CFOP><uCom>UN</uCom><qCom>2,5000</qCom>'
+        f'<vUnCom>10.00</vUnCom><vProd>25.00</vProd><vDesc>1.00</vDesc></prod>'
+        f'<imposto><ICMS><ICMS00><orig>0</orig><CST>00</CST><vICMS>4.50</vICMS></ICMS00></ICMS>'
+        f'<PIS><PISAliq><vPIS>0.41</vPIS></PISAliq></PIS>'
+        f'<COFINS><COFINSAliq><vCOFINS>1.90</vCOFINS></COFINSAliq></COFINS></imposto></det>'
+        for i in range(1, itens + 1)
+    )
+    xmlns = f' xmlns="{NS_NFE}"' if com_namespace else ''
+    atributo_id = f' Id="NFe{chave}"' if id_infnfe else ''
+    prot = f'<protNFe><infProt><chNFe>{chave}</chNFe></infProt></protNFe>' if protocolo else ''
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><nfeProc{xmlns} versao="4.00">'
+        f'<NFe><infNFe{atributo_id} versao="4.00">'
+        f'<ide><cUF>35</cUF><nNF>123</nNF><serie>1</serie><mod>55</mod>'
+        f'<dhEmi>2024-05-03T10:15:00-03:00</dhEmi></ide>'
+        f'<emit><CNPJ>12345678000195</CNPJ><xNome>Emitente</xNome><enderEmit><xLgr>Rua A</xLgr>'
+        f'<nro>10</nro><xMun>Sao Paulo</xMun><UF>SP</UF><CEP>01000000</CEP></enderEmit><IE>111</IE></emit>'
+        f'<dest><CPF>12345678909</CPF><xNome>Cliente</xNome></dest>{dets}'
+        f'<total><ICMSTot><vICMS>13.50</vICMS><vProd>75.00</vProd><vDesc>3.00</vDesc>'
+        f'<vPIS>1.23</vPIS><vCOFINS>5.70</vCOFINS><vNF>72.00</vNF></ICMSTot></total>'
+        f'</infNFe></NFe>{prot}</nfeProc>'
+    ).encode('utf-8')
+
+
+# --- Leitura em memória, em streaming e da árvore ---
+
+@pytest.mark.parametrize('com_namespace', [True, False])
+def test_leituras_equivalentes(com_namespace):
+    """ler_nfe (bytes e streaming) e ler_nfe_arvore produzem os mesmos registros"""
+    xml = gerar_xml(com_namespace=com_namespace)
+    em_memoria = nfe_parser.ler_nfe(xml)
+    em_streaming = nfe_parser.ler_nfe(io.BytesIO(xml))
+    da_arvore = nfe_parser.ler_nfe_arvore(ET.fromstring(xml))
+    assert em_memoria == em_streaming == da_arvore
+    assert nfe_parser.ler_nfe(memoryview(xml)) == em_memoria
+
+
+@pytest.mark.parametrize('com_namespace', [True, False])
+def test_campos_extraidos(com_namespace):
+    """Os campos de cada bloco são lidos com ou sem namespace"""
+    dados = nfe_parser.ler_nfe(gerar_xml(com_namespace=com_namespace))
+    assert dados.chave_acesso == CHAVE
+    assert dados.identificacao.numero == '123'
+    assert dados.identificacao.data_emissao == '2024-05-03T10:15:00-03:00'
+    assert dados.emitente.cnpj == '12345678000195'
+    assert dados.emitente.municipio == 'Sao Paulo'
+    assert dados.destinatario.cpf == '12345678909'
+    assert dados.totais.valor_total == 72.0
+    assert len(dados.itens) == 3
+    item = dados.itens[0]
+    assert item.codigo == 'P1'
+    assert item.quantidade == 2.5
+    assert item.impostos.valor_icms == 4.5
+    assert item.impostos.valor_ipi == 0.0
+
+
+def aninhar_blocos(xml):
+    """Coloca ide, emit e os itens dentro de um elemento a mais no infNFe"""
+    texto = xml.decode('utf-8')
+    inicio = texto.index('<ide>')
+    fim = texto.index('<total>')
+    return (texto[:inicio] + '<extra>' + texto[inicio:fim] + '</extra>' + texto[fim:]).encode('utf-8')
+
+
+@pytest.mark.parametrize('com_namespace', [True, False])
+def test_blocos_aninhados(com_namespace, tmp_path):
+    """Blocos fora da posição esperada são lidos pelo índice de tags, em todos os caminhos"""
+    esperado = nfe_parser.ler_nfe(gerar_xml(com_namespace=com_namespace))
+    xml = aninhar_blocos(gerar_xml(com_namespace=com_namespace))
+
+    caminho = tmp_path / 'aninhada.xml'
+    caminho.write_bytes(xml)
+    dados, conteudo, erro = nfe_parser.ler_arquivo(str(caminho))
+    assert erro is None and conteudo == xml
+    assert dados == esperado
+
+    assert nfe_parser.ler_conteudo(xml) == (esperado, None)
+    assert nfe_parser.ler_nfe(io.BytesIO(xml)) == esperado
+    assert nfe_parser.ler_nfe(str(caminho)) == esperado
+    assert nfe_parser.ler_nfe_arvore(ET.fromstring(xml)) == esperado
+
+
+def test_blocos_aninhados_grandes(monkeypatch):
+    """Conteúdos lidos em streaming também são relidos pela árvore"""
+    monkeypatch.setattr(nfe_parser, 'TAMANHO_MAXIMO_ARVORE', 0)
+    dados = nfe_parser.ler_nfe(aninhar_blocos(gerar_xml()))
+    assert dados == nfe_parser.ler_nfe(gerar_xml())
+
+
+def test_sem_destinatario(monkeypatch):
+    """dest é opcional: sua ausência não provoca a releitura pela árvore"""
+    xml = gerar_xml().replace(b'<dest><CPF>12345678909</CPF><xNome>Cliente</xNome></dest>', b'')
+    monkeypatch.setattr(nfe_parser, 'ler_nfe_arvore', None)
+    dados = nfe_parser.ler_nfe(xml)
+    assert dados.destinatario is None
+    assert dados.emitente.cnpj == '12345678000195'
+
+
+def test_data_emissao_nfe_2():
+    """NFes 2.0 trazem só a data (dEmi) em vez de dhEmi"""
+    xml = gerar_xml().replace(b'<dhEmi>2024-05-03T10:15:00-03:00</dhEmi>', b'<dEmi>2024-05-03</dEmi>')
+    assert nfe_parser.ler_nfe(xml).identificacao.data_emissao == '2024-05-03'
+
+
+def test_chave_do_protocolo():
+    """Sem Id no infNFe, a chave vem do chNFe do protocolo"""
+    xml = gerar_xml(id_infnfe=False)
+    assert nfe_parser.ler_nfe(xml).chave_acesso == CHAVE
+    assert nfe_parser.ler_nfe(io.BytesIO(xml)).chave_acesso == CHAVE
+
+
+def test_sem_chave():
+    xml = gerar_xml(id_infnfe=False, protocolo=False)
+    with pytest.raises(nfe_parser.NFeInvalida):
+        nfe_parser.ler_nfe(xml)
+    with pytest.raises(nfe_parser.NFeInvalida):
+        nfe_parser.ler_nfe(io.BytesIO(xml))
+
+
+def test_parar_se():
+    """parar_se recebe a chave e interrompe a leitura de NFes já importadas"""
+    xml = gerar_xml()
+    chaves = []
+
+    def parar_se(chave):
+        chaves.append(chave)
+        return True
+
+    assert nfe_parser.ler_nfe(xml, parar_se) is None
+    assert nfe_parser.ler_nfe(io.BytesIO(xml), parar_se) is None
+    assert chaves == [CHAVE, CHAVE]
+    assert nfe_parser.ler_nfe(xml, lambda chave: False).chave_acesso == CHAVE
+
+
+def test_xml_invalido():
+    dados, erro = nfe_parser.ler_conteudo(b'<nfeProc><NFe>')
+    assert dados is None and erro
+
+
+def test_farejar_chave():
+    assert nfe_parser.farejar_chave(gerar_xml()) == CHAVE
+    assert nfe_parser.farejar_chave(gerar_xml(id_infnfe=False)) is None
+    assert nfe_parser.chave_do_nome(f'/xmls/{CHAVE}-nfe.xml') == CHAVE
+
+
+# --- Datas ---
+
+@pytest.mark.parametrize('texto, esperado', [
+    # Datas com "-0" no dia, no mês e no fuso
+    ('2024-05-03T10:15:00-03:00', datetime(2024, 5, 3, 13, 15)),
+    ('2024-01-09T23:30:00-03:00', datetime(2024, 1, 10, 2, 30)),
+    ('2024-05-03T10:15:00+00:00', datetime(2024, 5, 3, 10, 15)),
+    ('2024-05-03T10:15:00-0300', datetime(2024, 5, 3, 13, 15)),
+    ('2024-05-03T10:15:00Z', datetime(2024, 5, 3, 10, 15)),
+    ('2024-05-03', datetime(2024, 5, 3)),
+    ('2024-05-03 10:15:00', datetime(2024, 5, 3, 10, 15)),
+    ('03/05/2024 10:15:00', datetime(2024, 5, 3, 10, 15)),
+    ('03/05/2024', datetime(2024, 5, 3)),
+    ('20240503', datetime(2024, 5, 3)),
+    ('2024-05', datetime(2024, 5, 1)),
+    ('2024', datetime(2024, 1, 1)),
+])
+def test_converter_data(texto, esperado):
+    assert nfe_parser.converter_data(texto) == esperado
+
+
+@pytest.mark.parametrize('texto', [None, '', 'ontem', '2024-13-45'])
+def test_converter_data_invalida(texto):
+    assert nfe_parser.converter_data(texto) is None
+
+
+# --- Chave de acesso ---
+
+def test_chave_valida():
+    assert nfe_parser.chave_valida(CHAVE)
+    digito_errado = CHAVE[:43] + str((int(CHAVE[43]) + 1) % 10)
+    assert not nfe_parser.chave_valida(digito_errado)
+    assert not nfe_parser.chave_valida(CHAVE[:43])
+    assert not nfe_parser.chave_valida('a' * 44)
+    assert not nfe_parser.chave_valida(None)
+
+
+def test_decodificar_chave():
+    chave = nfe_parser.decodificar_chave(f' {CHAVE} ')
+    assert chave.chave == CHAVE
+    assert (chave.uf, chave.ano, chave.mes) == ('35', 2024, 5)
+    assert chave.cnpj == '12345678000195'
+    assert (chave.modelo, chave.serie, chave.numero) == ('55', '1', '123')
+    assert chave.data_emissao == datetime(2024, 5, 1)
+
+
+def test_decodificar_chave_invalida():
+    with pytest.raises(nfe_parser.NFeInvalida):
+        nfe_parser.decodificar_chave(CHAVE[:43] + str((int(CHAVE[43]) + 1) % 10))
+    with pytest.raises(nfe_parser.NFeInvalida):
+        nfe_parser.decodificar_chave(montar_chave(aamm='2413'))
+
+
+def test_identificacao_da_chave():
+    ide = nfe_parser.identificacao_da_chave(CHAVE)
+    assert (ide.numero, ide.serie, ide.modelo) == ('123', '1', '55')
+    assert ide.data_emissao == '2024-05-01'
+    assert nfe_parser.converter_data(ide.data_emissao) == datetime(2024, 5, 1)
+    assert nfe_parser.identificacao_da_chave('123') is None
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Testes da varredura de pastas (tools/varredura.py)"""
+
+import os
+
+import pytest
+
+import varredura
+
+
+@pytest.fixture
+def pasta(tmp_path):
+    """Árvore com XMLs em vários níveis, outros arquivos e uma pasta vazia"""
+    for relativo in ('a.xml', 'b.XML', 'c.txt', 'm/1.xml', 'm/2.xml', 'm/n/3.xml', 'z.xml'):
+        caminho = tmp_path / relativo
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        caminho.write_bytes(b'<a/>')
+    (tmp_path / 'vazia').mkdir()
+    return tmp_path
+
+
+def relativos(pasta, caminhos):
+    return [os.path.relpath(caminho, pasta).replace(os.sep, '/') for caminho in caminhos]
+
+
+def test_ordem_alfabetica(pasta):
+    caminhos = varredura.percorrer_pasta(str(pasta))
+    assert relativos(pasta, caminhos) == ['a.xml', 'b.XML', 'm/1.xml', 'm/2.xml', 'm/n/3.xml', 'z.xml']
+
+
+def test_sem_subpastas(pasta):
+    caminhos = varredura.percorrer_pasta(str(pasta), incluir_subpastas=False)
+    assert relativos(pasta, caminhos) == ['a.xml', 'b.XML', 'z.xml']
+
+
+def test_todas_as_extensoes(pasta):
+    caminhos = varredura.percorrer_pasta(str(pasta), incluir_subpastas=False, extensoes=None)
+    assert relativos(pasta, caminhos) == ['a.xml', 'b.XML', 'c.txt', 'z.xml']
+
+
+def test_retomada(pasta):
+    """Com apos, a varredura continua logo depois do arquivo informado"""
+    todos = list(varredura.percorrer_pasta(str(pasta)))
+    for posicao, ultimo in enumerate(todos):
+        assert list(varredura.percorrer_pasta(str(pasta), apos=ultimo)) == todos[posicao + 1:]
+
+
+def test_retomada_requer_ordem(pasta):
+    with pytest.raises(ValueError):
+        list(varredura.percorrer_pasta(str(pasta), ordenar=False, apos=str(pasta / 'a.xml')))
+
+
+def test_filtro_por_modificacao(pasta):
+    os.utime(pasta / 'a.xml', (1000, 1000))
+    os.utime(pasta / 'z.xml', (3000, 3000))
+    for relativo in ('b.XML', 'm/1.xml', 'm/2.xml', 'm/n/3.xml'):
+        os.utime(pasta / relativo, (2000, 2000))
+    caminhos = varredura.percorrer_pasta(str(pasta), modificados_desde=1500, modificados_ate=2500)
+    assert relativos(pasta, caminhos) == ['b.XML', 'm/1.xml', 'm/2.xml', 'm/n/3.xml']
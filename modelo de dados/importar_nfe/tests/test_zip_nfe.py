@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Testes da leitura de XMLs em ZIPs (tools/zip_nfe.py)"""
+
+import io
+import zipfile
+
+import pytest
+
+import zip_nfe
+
+
+def montar_zip(membros):
+    """Monta um ZIP em memória a partir de {nome: bytes}, na ordem informada"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as pacote:
+        for nome, conteudo in membros.items():
+            pacote.writestr(nome, conteudo)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pacote():
+    interno = montar_zip({'i1.xml': b'<i1/>', 'i2.xml': b'<i2/>'})
+    return montar_zip({
+        'a.xml': b'<a/>',
+        'leiame.txt': b'ignorado',
+        'sub/interno.zip': interno,
+        'b.XML': b'<b/>',
+    })
+
+
+def nomes(pacote, apos=None):
+    return [nome for nome, _conteudo, _erro in zip_nfe.iterar_xmls_zip(io.BytesIO(pacote), 'envio.zip/', apos=apos)]
+
+
+def test_eh_zip_preserva_posicao(pacote):
+    arquivo = io.BytesIO(pacote)
+    arquivo.seek(3)
+    assert zip_nfe.eh_zip(arquivo)
+    assert arquivo.tell() == 3
+    assert not zip_nfe.eh_zip(io.BytesIO(b'<nfeProc/>'))
+
+
+def test_iterar_xmls_zip(pacote):
+    """XMLs do ZIP e dos ZIPs internos, na ordem gravada, sem outros arquivos"""
+    membros = list(zip_nfe.iterar_xmls_zip(io.BytesIO(pacote), 'envio.zip/'))
+    assert membros == [
+        ('envio.zip/a.xml', b'<a/>', None),
+        ('envio.zip/sub/interno.zip/i1.xml', b'<i1/>', None),
+        ('envio.zip/sub/interno.zip/i2.xml', b'<i2/>', None),
+        ('envio.zip/b.XML', b'<b/>', None),
+    ]
+
+
+def test_retomada(pacote):
+    """Com apos, a leitura continua logo depois do membro informado, inclusive em ZIP interno"""
+    todos = nomes(pacote)
+    for posicao, ultimo in enumerate(todos):
+        assert nomes(pacote, apos=ultimo) == todos[posicao + 1:]
+
+
+def test_zip_interno_invalido():
+    pacote = montar_zip({'quebrado.zip': b'nao e zip', 'a.xml': b'<a/>'})
+    membros = list(zip_nfe.iterar_xmls_zip(io.BytesIO(pacote)))
+    assert membros[0][0] == 'quebrado.zip'
+    assert membros[0][1] is None and membros[0][2]
+    assert membros[1] == ('a.xml', b'<a/>', None)
+
+
+def test_profundidade_maxima(monkeypatch):
+    monkeypatch.setattr(zip_nfe, 'PROFUNDIDADE_MAXIMA', 1)
+    nivel2 = montar_zip({'x.xml': b'<x/>'})
+    nivel1 = montar_zip({'n2.zip': nivel2})
+    membros = list(zip_nfe.iterar_xmls_zip(io.BytesIO(montar_zip({'n1.zip': nivel1}))))
+    assert [(nome, conteudo) for nome, conteudo, _erro in membros] == [('n1.zip/n2.zip', None)]
+
+
+def test_xml_maior_que_o_limite(monkeypatch):
+    monkeypatch.setattr(zip_nfe, 'TAMANHO_MAXIMO_XML', 10)
+    pacote = montar_zip({'grande.xml': b'<a>' + b'x' * 20 + b'</a>', 'ok.xml': b'<a/>'})
+    membros = list(zip_nfe.iterar_xmls_zip(io.BytesIO(pacote)))
+    assert membros[0][1] is None and membros[0][2]
+    assert membros[1] == ('ok.xml', b'<a/>', None)
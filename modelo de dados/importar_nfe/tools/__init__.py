@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+
+from . import nfe_parser
+from . import xml_html
+from . import zip_nfe
+from . import varredura
+from . import dimensionamento
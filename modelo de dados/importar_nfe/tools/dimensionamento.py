@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Dimensionamento adaptativo dos lotes de importação.
+
+O tamanho de cada lote é escolhido a partir do tempo e do crescimento de
+memória (RSS) por arquivo observados nos lotes anteriores: lotes de arquivos
+pequenos crescem até o máximo configurado, e lotes de arquivos grandes
+diminuem para que a memória do processo fique abaixo do teto.
+"""
+
+import psutil
+
+# Tamanho do primeiro lote, antes de qualquer medição
+TAMANHO_INICIAL = 50
+
+# Menor lote usado, mesmo perto do teto de memória
+TAMANHO_MINIMO = 10
+
+# Duração desejada de um lote (segundos): limita o trabalho perdido quando um lote falha
+TEMPO_ALVO_LOTE = 30.0
+
+# Fração do teto de memória que os lotes podem ocupar
+FRACAO_OCUPACAO = 0.8
+
+# Fração do teto de memória a partir da qual os caches do ORM são descartados
+FRACAO_LIMPEZA = 0.7
+
+# Peso da medição mais recente nas médias móveis
+PESO_MEDICAO = 0.5
+
+
+def memoria_em_uso():
+    """Memória residente (RSS, em bytes) do processo atual"""
+    return psutil.Process().memory_info().rss
+
+
+class DimensionadorLote:
+    """Escolhe o tamanho do próximo lote pelo tempo e pela memória observados
+
+    Args:
+        maximo: maior tamanho de lote permitido (configurado na importação)
+        limite_memoria: teto de memória do processo, em bytes; None desativa
+            o controle por memória
+        tempo_alvo: duração desejada de cada lote, em segundos
+    """
+
+    def __init__(self, maximo, limite_memoria=None, tempo_alvo=TEMPO_ALVO_LOTE):
+        self.maximo = max(maximo, 1)
+        self.minimo = min(TAMANHO_MINIMO, self.maximo)
+        self.limite_memoria = limite_memoria
+        self.tempo_alvo = tempo_alvo
+        self.tamanho = min(TAMANHO_INICIAL, self.maximo)
+        self.ultimo_lote = self.tamanho
+        self.segundos_por_arquivo = None
+        self.bytes_por_arquivo = None
+
+    def registrar(self, arquivos, segundos, memoria_antes, memoria_depois):
+        """Registra a medição de um lote concluído e recalcula o próximo tamanho
+
+        Args:
+            arquivos: quantidade de arquivos do lote
+            segundos: duração do lote
+            memoria_antes: RSS no início do lote
+            memoria_depois: RSS ao fim do lote, antes de qualquer limpeza
+        """
+        if arquivos <= 0:
+            return self.tamanho
+        self.segundos_por_arquivo = _media(self.segundos_por_arquivo, segundos / arquivos)
+        self.bytes_por_arquivo = _media(self.bytes_por_arquivo, max(memoria_depois - memoria_antes, 0) / arquivos)
+        self.ultimo_lote = arquivos
+        return self.recalcular(memoria_depois)
+
+    def recalcular(self, memoria):
+        """Recalcula o próximo tamanho para a memória em uso (ex.: após liberar os caches)"""
+        tamanho = self.maximo
+        if self.segundos_por_arquivo:
+            tamanho = min(tamanho, int(self.tempo_alvo / self.segundos_por_arquivo))
+        if self.limite_memoria and self.bytes_por_arquivo:
+            livre = self.limite_memoria * FRACAO_OCUPACAO - memoria
+            tamanho = min(tamanho, int(livre / self.bytes_por_arquivo))
+        # Crescer aos poucos: no máximo o dobro do lote anterior
+        tamanho = min(tamanho, self.ultimo_lote * 2)
+        self.tamanho = max(self.minimo, tamanho)
+        return self.tamanho
+
+    def perto_do_limite(self, memoria):
+        """Indica se a memória está perto do teto e os caches devem ser descartados"""
+        return bool(self.limite_memoria) and memoria >= self.limite_memoria * FRACAO_LIMPEZA
+
+
+def _media(anterior, medicao):
+    """Média móvel exponencial; a primeira medição é usada como está"""
+    if anterior is None:
+        return medicao
+    return PESO_MEDICAO * medicao + (1 - PESO_MEDICAO) * anterior
@@ -0,0 +1,989 @@
+# -*- coding: utf-8 -*-
+"""Leitura de XMLs de NFe, independente do ORM.
+
+Transforma o XML de uma NFe em registros compactos (``NFeDados`` e seus
+blocos), sem acesso ao banco de dados. Assim a leitura pode ser executada
+em outros processos, armazenada em cache, medida e testada isoladamente;
+o modelo ``importar_nfe.nfe`` apenas persiste os registros.
+
+Os campos são extraídos por um plano de extração compilado uma única vez
+por namespace (tags já qualificadas no formato ``{uri}tag``), reutilizado
+por todos os arquivos de um lote, sem reescrita de xpath nem nova tentativa
+sem namespace a cada campo.
+
+XMLs em memória de tamanho usual são lidos com ``fromstring``, que monta a
+árvore em C de uma só vez. Caminhos, arquivos e XMLs muito grandes são
+lidos em streaming com ``iterparse``: cada bloco da nota (ide, emit, dest,
+det, total) é emitido assim que seu elemento é fechado e, em seguida,
+removido da árvore, de modo que notas com milhares de itens não ficam
+inteiras em memória.
+"""
+
+import functools
+import io
+import logging
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+_logger = logging.getLogger(__name__)
+
+NAMESPACE_PADRAO = 'http://www.portalfiscal.inf.br/nfe'
+
+# Tag do XML -> atributo do registro correspondente
+CAMPOS_IDE = {
+    'nNF': 'numero',
+    'serie': 'serie',
+    'mod': 'modelo',
+    'dhEmi': 'data_emissao',
+    'dEmi': 'data_emissao',  # NFe 2.0: apenas a data
+    'dhSaiEnt': 'data_entrada',
+}
+CAMPOS_PARTE = {
+    'CNPJ': 'cnpj',
+    'CPF': 'cpf',
+    'xNome': 'nome',
+    'IE': 'ie',
+}
+CAMPOS_ENDERECO = {
+    'xLgr': 'logradouro',
+    'nro': 'numero',
+    'xCpl': 'complemento',
+    'xBairro': 'bairro',
+    'xMun': 'municipio',
+    'UF': 'uf',
+    'CEP': 'cep',
+    'fone': 'telefone',
+}
+TAGS_ENDERECO = ('enderEmit', 'enderDest')
+CAMPOS_TOTAL = {
+    'vProd': 'valor_produtos',
+    'vFrete': 'valor_frete',
+    'vSeg': 'valor_seguro',
+    'vDesc': 'valor_desconto',
+    'vOutro': 'valor_outros',
+    'vNF': 'valor_total',
+    'vICMS': 'valor_icms',
+    'vIPI': 'valor_ipi',
+    'vPIS': 'valor_pis',
+    'vCOFINS': 'valor_cofins',
+}
+CAMPOS_PROD_TEXTO = {
+    'cProd': 'codigo',
+    'xProd': 'descricao',
+    'NCM': 'ncm',
+    'CFOP': 'cfop',
+    'uCom': 'unidade',
+}
+CAMPOS_PROD_VALOR = {
+    'qCom': 'quantidade',
+    'vUnCom': 'valor_unitario',
+    'vProd': 'valor_total',
+    'vDesc': 'valor_desconto',
+}
+
+# Grupo de imposto do item -> tag com o valor do imposto em seus subgrupos
+GRUPOS_IMPOSTO = {
+    'ICMS': 'vICMS',
+    'IPI': 'vIPI',
+    'PIS': 'vPIS',
+    'COFINS': 'vCOFINS',
+}
+CAMPOS_IMPOSTO = {
+    'vICMS': 'valor_icms',
+    'vIPI': 'valor_ipi',
+    'vPIS': 'valor_pis',
+    'vCOFINS': 'valor_cofins',
+}
+
+# Blocos filhos de infNFe extraídos pelo leitor
+BLOCOS = ('ide', 'emit', 'dest', 'det', 'total')
+
+# Bytes iniciais do arquivo onde se procura a chave de acesso sem parsear o XML;
+# o infNFe é o primeiro elemento da NFe, então o Id costuma estar no início
+TAMANHO_CABECALHO = 8192
+
+# Acima deste tamanho, o XML em memória é lido em streaming em vez de virar
+# uma árvore completa (a árvore ocupa várias vezes o tamanho do XML)
+TAMANHO_MAXIMO_ARVORE = 4 * 1024 * 1024
+
+# Id="NFe<chave>" do infNFe, procurado direto nos bytes do XML
+_RE_CHAVE_ID = re.compile(rb'\bId\s*=\s*["\']NFe(\d{44})["\']')
+
+# Chave de acesso no nome do arquivo (ex.: <chave>-nfe.xml, NFe<chave>.xml)
+_RE_CHAVE_NOME = re.compile(r'(?<!\d)(\d{44})(?!\d)')
+
+
+class NFeInvalida(ValueError):
+    """XML que não pode ser lido como NFe"""
+
+
+# --- Registros ---
+
+@dataclass(slots=True)
+class Identificacao:
+    """Bloco ide: número, série, modelo e datas (texto original do XML)"""
+    numero: str = None
+    serie: str = None
+    modelo: str = None
+    data_emissao: str = None
+    data_entrada: str = None
+
+
+@dataclass(slots=True)
+class Parte:
+    """Emitente ou destinatário"""
+    cnpj: str = None
+    cpf: str = None
+    nome: str = None
+    ie: str = None
+    logradouro: str = None
+    numero: str = None
+    complemento: str = None
+    bairro: str = None
+    municipio: str = None
+    uf: str = None
+    cep: str = None
+    telefone: str = None
+
+
+@dataclass(slots=True)
+class Totais:
+    """Totais da nota (ICMSTot); os atributos seguem os campos de importar_nfe.nfe"""
+    valor_produtos: float = 0.0
+    valor_frete: float = 0.0
+    valor_seguro: float = 0.0
+    valor_desconto: float = 0.0
+    valor_outros: float = 0.0
+    valor_total: float = 0.0
+    valor_icms: float = 0.0
+    valor_ipi: float = 0.0
+    valor_pis: float = 0.0
+    valor_cofins: float = 0.0
+
+
+@dataclass(slots=True)
+class Impostos:
+    """Valores de impostos de um item"""
+    valor_icms: float = 0.0
+    valor_ipi: float = 0.0
+    valor_pis: float = 0.0
+    valor_cofins: float = 0.0
+
+
+@dataclass(slots=True)
+class Item:
+    """Item (det) da nota, com os dados do produto"""
+    numero_item: int = 0
+    codigo: str = None
+    descricao: str = None
+    ncm: str = None
+    cfop: str = None
+    unidade: str = None
+    quantidade: float = 1.0
+    valor_unitario: float = 0.0
+    valor_total: float = 0.0
+    valor_desconto: float = 0.0
+    impostos: Impostos = field(default_factory=Impostos)
+
+
+@dataclass(slots=True)
+class NFeDados:
+    """NFe lida do XML; blocos ausentes ficam como None"""
+    chave_acesso: str = None
+    identificacao: Identificacao = None
+    emitente: Parte = None
+    destinatario: Parte = None
+    totais: Totais = None
+    itens: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class ChaveAcesso:
+    """Campos codificados na chave de acesso (44 dígitos)
+
+    Layout: cUF(2) AAMM(4) CNPJ(14) mod(2) serie(3) nNF(9) tpEmis(1) cNF(8) cDV(1).
+    Série e número ficam sem os zeros à esquerda, como no bloco ide.
+    """
+    chave: str
+    uf: str
+    ano: int
+    mes: int
+    cnpj: str
+    modelo: str
+    serie: str
+    numero: str
+    tipo_emissao: str
+    codigo_numerico: str
+    digito: str
+
+    @property
+    def data_emissao(self):
+        """Primeiro dia do mês de emissão (a chave não traz o dia)"""
+        return datetime(self.ano, self.mes, 1)
+
+
+# --- Plano de extração ---
+
+def nome_local(tag):
+    """Retorna o nome da tag sem o namespace"""
+    return tag.rpartition('}')[2]
+
+
+def farejar_chave(conteudo):
+    """Localiza a chave de acesso no Id do infNFe direto nos bytes, sem parsear o XML
+
+    Procura primeiro no cabeçalho (TAMANHO_CABECALHO) e depois no conteúdo
+    inteiro. Serve apenas para descartar duplicados antes da leitura; a
+    chave válida continua sendo a lida do XML.
+
+    Returns:
+        a chave (44 dígitos) ou None
+    """
+    match = _RE_CHAVE_ID.search(conteudo, 0, TAMANHO_CABECALHO)
+    if match is None and len(conteudo) > TAMANHO_CABECALHO:
+        match = _RE_CHAVE_ID.search(conteudo)
+    return match.group(1).decode('ascii') if match else None
+
+
+def chave_do_nome(nome_arquivo):
+    """Retorna a chave de acesso contida no nome do arquivo, ou None"""
+    match = _RE_CHAVE_NOME.search(nome_arquivo or '')
+    return match.group(1) if match else None
+
+
+def calcular_digito(chave_sem_digito):
+    """Calcula o dígito verificador (módulo 11) dos 43 primeiros dígitos da chave"""
+    soma = 0
+    peso = 2
+    for digito in reversed(chave_sem_digito):
+        soma += int(digito) * peso
+        peso = 2 if peso == 9 else peso + 1
+    resto = soma % 11
+    return 0 if resto < 2 else 11 - resto
+
+
+def chave_valida(chave):
+    """Indica se a chave tem 44 dígitos e dígito verificador correto"""
+    return bool(
+        chave and len(chave) == 44 and chave.isdigit()
+        and calcular_digito(chave[:43]) == int(chave[43])
+    )
+
+
+def decodificar_chave(chave):
+    """Decodifica a chave de acesso, validando o dígito verificador
+
+    Raises:
+        NFeInvalida: se a chave não tem 44 dígitos, o dígito verificador não
+            confere ou o mês de emissão é inválido
+    """
+    chave = (chave or '').strip()
+    if not chave_valida(chave):
+        raise NFeInvalida(f'Chave de acesso inválida: {chave}')
+    mes = int(chave[4:6])
+    if not 1 <= mes <= 12:
+        raise NFeInvalida(f'Chave de acesso com mês de emissão inválido: {chave}')
+    return ChaveAcesso(
+        chave=chave,
+        uf=chave[0:2],
+        ano=2000 + int(chave[2:4]),
+        mes=mes,
+        cnpj=chave[6:20],
+        modelo=chave[20:22],
+        serie=str(int(chave[22:25])),
+        numero=str(int(chave[25:34])),
+        tipo_emissao=chave[34],
+        codigo_numerico=chave[35:43],
+        digito=chave[43],
+    )
+
+
+def identificacao_da_chave(chave):
+    """Monta o bloco ide a partir da chave de acesso (sem o dia de emissão)
+
+    A data de emissão é o primeiro dia do mês da chave, sem hora nem fuso
+    (YYYY-MM-DD): cabe a quem a grava situá-la no horário local.
+
+    Returns:
+        Identificacao, ou None se a chave for inválida
+    """
+    try:
+        dados_chave = decodificar_chave(chave)
+    except NFeInvalida:
+        return None
+    return Identificacao(
+        numero=dados_chave.numero,
+        serie=dados_chave.serie,
+        modelo=dados_chave.modelo,
+        data_emissao=dados_chave.data_emissao.date().isoformat(),
+    )
+
+
+def namespace(tag):
+    """Retorna a URI do namespace de uma tag ('' se não houver)"""
+    if tag[:1] == '{':
+        return tag[1:].partition('}')[0]
+    return ''
+
+
+def converter_valor(texto):
+    """Converte o texto de um campo numérico, retornando None se inválido"""
+    try:
+        return float(texto.replace(',', '.'))
+    except (ValueError, AttributeError):
+        return None
+
+
+# Fuso horário no final de data/hora: Z, ±hh:mm ou ±hhmm
+_RE_FUSO = re.compile(r'(?:Z|([+-])(\d{2}):?(\d{2}))$')
+
+# Formatos aceitos quando a data não está em ISO-8601
+FORMATOS_DATA = (
+    '%Y-%m-%dT%H:%M:%S',  # 2023-01-01T10:30:00
+    '%Y-%m-%d %H:%M:%S',  # 2023-01-01 10:30:00
+    '%d/%m/%Y %H:%M:%S',  # 01/01/2023 10:30:00
+    '%d/%m/%Y',           # 01/01/2023
+    '%Y%m%d%H%M%S',       # 20230101103000
+    '%Y%m%d',             # 20230101
+    '%Y-%m-%d',           # 2023-01-01
+)
+
+
+def _converter_data_legado(texto):
+    """Converte datas fora do padrão ISO-8601, respeitando o fuso se houver"""
+    fuso = None
+    # Apenas datas com hora podem ter fuso (evita confundir '2023-01-01')
+    if len(texto) > 10:
+        match = _RE_FUSO.search(texto)
+        if match:
+            texto = texto[:match.start()].strip()
+            if match.group(1):
+                minutos = int(match.group(2)) * 60 + int(match.group(3))
+                if match.group(1) == '-':
+                    minutos = -minutos
+                fuso = timezone(timedelta(minutes=minutos))
+            else:
+                fuso = timezone.utc
+
+    data = None
+    partes = texto.split('-')
+    if len(partes) == 2 and all(p.isdigit() for p in partes) and len(partes[0]) == 4 and len(partes[1]) <= 2:
+        # Apenas ano e mês (YYYY-MM): usar o dia 1º
+        data = datetime(int(partes[0]), int(partes[1]), 1)
+    elif texto.isdigit() and len(texto) == 4:
+        # Apenas o ano (YYYY): usar 1º de janeiro
+        data = datetime(int(texto), 1, 1)
+    else:
+        for formato in FORMATOS_DATA:
+            try:
+                data = datetime.strptime(texto, formato)
+                break
+            except ValueError:
+                continue
+
+    if data is not None and fuso is not None:
+        data = data.replace(tzinfo=fuso)
+    return data
+
+
+def converter_data(texto):
+    """Converte data/hora do XML em datetime UTC sem fuso (como o Odoo armazena)
+
+    O formato da SEFAZ para dhEmi/dhSaiEnt (YYYY-MM-DDThh:mm:ss±hh:mm) é
+    lido diretamente por datetime.fromisoformat; os demais formatos aceitos
+    anteriormente ficam apenas como alternativa.
+
+    Returns:
+        datetime, ou None se o texto não puder ser convertido
+    """
+    if not texto:
+        return None
+    texto = texto.strip()
+    try:
+        data = datetime.fromisoformat(texto)
+    except ValueError:
+        try:
+            data = _converter_data_legado(texto)
+        except ValueError:
+            return None
+        if data is None:
+            return None
+
+    if data.tzinfo is not None:
+        data = data.astimezone(timezone.utc).replace(tzinfo=None)
+    return data
+
+
+class PlanoExtracao:
+    """Tags qualificadas de todos os campos extraídos, para um namespace
+
+    Os mapas ``{uri}tag -> atributo`` permitem extrair cada bloco com uma única
+    passagem pelos filhos do elemento, com uma consulta de dicionário por tag.
+    """
+
+    __slots__ = (
+        'uri', 'inf_nfe', 'blocos', 'prod', 'imposto', 'enderecos',
+        'campos_ide', 'campos_parte', 'campos_endereco', 'campos_total',
+        'campos_prod_texto', 'campos_prod_valor', 'grupos_imposto', 'campos_imposto',
+    )
+
+    def __init__(self, uri):
+        prefixo = '{%s}' % uri if uri else ''
+
+        def q(tag):
+            return prefixo + tag
+
+        def qualificar(campos):
+            return {q(tag): atributo for tag, atributo in campos.items()}
+
+        self.uri = uri
+        self.inf_nfe = q('infNFe')
+        self.blocos = {q(bloco): bloco for bloco in BLOCOS}
+        self.prod = q('prod')
+        self.imposto = q('imposto')
+        self.enderecos = frozenset(q(tag) for tag in TAGS_ENDERECO)
+        self.campos_ide = qualificar(CAMPOS_IDE)
+        self.campos_parte = qualificar(CAMPOS_PARTE)
+        self.campos_endereco = qualificar(CAMPOS_ENDERECO)
+        self.campos_total = qualificar(CAMPOS_TOTAL)
+        self.campos_prod_texto = qualificar(CAMPOS_PROD_TEXTO)
+        self.campos_prod_valor = qualificar(CAMPOS_PROD_VALOR)
+        self.grupos_imposto = {q(grupo): q(tag) for grupo, tag in GRUPOS_IMPOSTO.items()}
+        self.campos_imposto = qualificar(CAMPOS_IMPOSTO)
+
+    def __repr__(self):
+        return '<PlanoExtracao %r>' % self.uri
+
+
+@functools.lru_cache(maxsize=16)
+def plano_para(uri):
+    """Retorna o plano de extração do namespace, compilado na primeira chamada"""
+    return PlanoExtracao(uri)
+
+
+def plano_do_elemento(elemento):
+    """Retorna o plano de extração do namespace de um elemento (ex.: infNFe)"""
+    return plano_para(namespace(elemento.tag))
+
+
+# --- Extração dos blocos ---
+
+def _textos_filhos(elemento, campos):
+    """Extrai o texto dos filhos diretos cujas tags estão no mapa campos"""
+    dados = {}
+    for filho in elemento:
+        atributo = campos.get(filho.tag)
+        if atributo and atributo not in dados and filho.text:
+            dados[atributo] = filho.text.strip()
+    return dados
+
+
+def _ler_ide(ide, plano):
+    return Identificacao(**_textos_filhos(ide, plano.campos_ide))
+
+
+def _ler_parte(parte, plano):
+    """Extrai identificação e endereço do emitente ou destinatário"""
+    dados = _textos_filhos(parte, plano.campos_parte)
+    for filho in parte:
+        if filho.tag in plano.enderecos:
+            endereco = _textos_filhos(filho, plano.campos_endereco)
+            endereco.update(dados)
+            dados = endereco
+            break
+    return Parte(**dados)
+
+
+def _ler_total(total, plano):
+    """Extrai os totais, usando a primeira ocorrência de cada campo (como './/')"""
+    totais = Totais()
+    vistos = set()
+    campos = plano.campos_total
+    for elemento in total.iter():
+        atributo = campos.get(elemento.tag)
+        if not atributo or atributo in vistos:
+            continue
+        vistos.add(atributo)
+        valor = converter_valor(elemento.text)
+        if valor is not None:
+            setattr(totais, atributo, valor)
+    return totais
+
+
+def _ler_det(det, plano):
+    """Extrai um item (det), ou None se não houver o elemento prod"""
+    try:
+        numero_item = int(det.get('nItem', '0'))
+    except ValueError:
+        numero_item = 0
+
+    item = None
+    impostos = Impostos()
+    for filho in det:
+        if filho.tag == plano.prod:
+            dados = _textos_filhos(filho, plano.campos_prod_texto)
+            campos_valor = plano.campos_prod_valor
+            for campo in filho:
+                atributo = campos_valor.get(campo.tag)
+                if atributo and atributo not in dados:
+                    valor = converter_valor(campo.text)
+                    if valor is not None:
+                        dados[atributo] = valor
+            item = Item(numero_item=numero_item, **dados)
+        elif filho.tag == plano.imposto:
+            for grupo in filho:
+                tag_valor = plano.grupos_imposto.get(grupo.tag)
+                if not tag_valor:
+                    continue
+                # O valor fica no subgrupo (ex.: ICMS/ICMS00/vICMS)
+                for subgrupo in grupo:
+                    valor = None
+                    for campo in subgrupo:
+                        if campo.tag == tag_valor:
+                            valor = converter_valor(campo.text)
+                            break
+                    if valor is not None:
+                        setattr(impostos, plano.campos_imposto[tag_valor], valor)
+                        break
+
+    if item is None:
+        _logger.warning("Elemento prod não encontrado no item %s", det.get('nItem', '?'))
+        return None
+
+    item.impostos = impostos
+    return item
+
+
+EXTRATORES = {
+    'ide': _ler_ide,
+    'emit': _ler_parte,
+    'dest': _ler_parte,
+    'det': _ler_det,
+    'total': _ler_total,
+}
+
+# Bloco -> atributo de NFeDados
+ATRIBUTOS_BLOCO = {
+    'ide': 'identificacao',
+    'emit': 'emitente',
+    'dest': 'destinatario',
+    'total': 'totais',
+}
+
+# Blocos presentes em toda NFe válida (dest é opcional na NFC-e); se algum
+# não é filho direto de infNFe, a nota é relida pela árvore e pelo índice de tags
+BLOCOS_OBRIGATORIOS = ('ide', 'emit', 'total')
+
+
+def extrair_bloco(bloco, elemento, plano=None):
+    """Extrai um bloco isolado (ex.: 'emit') de um elemento já localizado"""
+    if plano is None:
+        plano = plano_do_elemento(elemento)
+    return EXTRATORES[bloco](elemento, plano)
+
+
+def extrair_infnfe(inf_nfe, plano=None, dados=None):
+    """Extrai os blocos filhos diretos de um elemento infNFe já carregado
+
+    Returns:
+        NFeDados (o informado em dados, se houver); blocos que não sejam
+        filhos diretos de infNFe ficam como None
+    """
+    if plano is None:
+        plano = plano_do_elemento(inf_nfe)
+    if dados is None:
+        dados = NFeDados()
+
+    blocos = plano.blocos
+    for filho in inf_nfe:
+        bloco = blocos.get(filho.tag)
+        if not bloco:
+            continue
+        registro = EXTRATORES[bloco](filho, plano)
+        if bloco == 'det':
+            if registro is not None:
+                dados.itens.append(registro)
+        elif getattr(dados, ATRIBUTOS_BLOCO[bloco]) is None:
+            setattr(dados, ATRIBUTOS_BLOCO[bloco], registro)
+    return dados
+
+
+# --- Leitura em streaming ---
+
+def _como_arquivo(origem):
+    if isinstance(origem, (bytes, bytearray, memoryview)):
+        return io.BytesIO(origem)
+    return origem
+
+
+def iterar_nfe(origem):
+    """Percorre um XML de NFe uma única vez, emitindo seus blocos
+
+    Args:
+        origem: conteúdo do XML (bytes/memoryview), caminho ou arquivo binário
+
+    Yields:
+        Tuplas (evento, registro). O evento 'chave' é emitido assim que
+        infNFe é aberto, permitindo interromper a leitura de notas já
+        importadas. Em seguida vêm 'ide' (Identificacao), 'emit' e 'dest'
+        (Parte), um 'det' (Item) por item e 'total' (Totais), na ordem do
+        documento. Ao final, 'chNFe' traz a chave do protocolo, se presente.
+    """
+    pilha = []
+    inf_nfe = None
+    plano = None
+    for evento, elemento in ET.iterparse(_como_arquivo(origem), events=('start', 'end')):
+        if evento == 'start':
+            pilha.append(elemento)
+            if inf_nfe is None and elemento.tag.endswith('infNFe'):
+                inf_nfe = elemento
+                plano = plano_do_elemento(elemento)
+                chave = elemento.get('Id', '')
+                if chave.startswith('NFe'):
+                    chave = chave[3:]  # Remover prefixo 'NFe'
+                if chave:
+                    yield 'chave', chave
+            continue
+
+        pilha.pop()
+        if not pilha or pilha[-1] is not inf_nfe:
+            if elemento.tag.endswith('chNFe') and elemento.text:
+                yield 'chNFe', elemento.text.strip()
+            continue
+
+        bloco = plano.blocos.get(elemento.tag)
+        if bloco:
+            registro = EXTRATORES[bloco](elemento, plano)
+            if registro is not None:
+                yield bloco, registro
+
+        # Liberar o bloco já consumido
+        elemento.clear()
+        inf_nfe.remove(elemento)
+
+
+def _ler_nfe_conteudo(conteudo, parar_se=None):
+    """Lê um XML em memória montando a árvore inteira com fromstring
+
+    Mesmo resultado de ler_nfe em streaming: os blocos são extraídos dos
+    filhos diretos de infNFe pelo mesmo plano, sem os eventos do iterparse.
+    """
+    root = ET.fromstring(conteudo)
+    inf_nfe = next((e for e in root.iter() if e.tag.endswith('infNFe')), None)
+
+    chave = ''
+    if inf_nfe is not None:
+        chave = inf_nfe.get('Id', '')
+        if chave.startswith('NFe'):
+            chave = chave[3:]  # Remover prefixo 'NFe'
+    if not chave:
+        chave = next((e.text.strip() for e in root.iter()
+                      if e.tag.endswith('chNFe') and e.text), None)
+        if not chave:
+            raise NFeInvalida('XML inválido: chave de acesso não encontrada.')
+    if parar_se and parar_se(chave):
+        return None
+
+    dados = NFeDados(chave_acesso=chave)
+    if inf_nfe is not None:
+        extrair_infnfe(inf_nfe, dados=dados)
+    if _faltam_blocos(dados):
+        return _completar_pela_arvore(root, dados)
+    return dados
+
+
+def _faltam_blocos(dados):
+    """Indica se algum bloco obrigatório ou os itens não foram encontrados"""
+    return not dados.itens or any(getattr(dados, ATRIBUTOS_BLOCO[bloco]) is None
+                                  for bloco in BLOCOS_OBRIGATORIOS)
+
+
+def _completar_pela_arvore(root, dados):
+    """Relê a NFe por ler_nfe_arvore, que busca os blocos fora da posição esperada
+
+    Mantém a chave já conferida por parar_se; se a árvore também não puder
+    ser lida como NFe, devolve a leitura original.
+    """
+    try:
+        completos = ler_nfe_arvore(root)
+    except NFeInvalida:
+        return dados
+    _logger.info("NFe %s com blocos fora da posição esperada; lida pelo índice de tags", dados.chave_acesso)
+    completos.chave_acesso = dados.chave_acesso
+    return completos
+
+
+def _reler_arvore(origem, dados):
+    """Monta a árvore da origem lida em streaming para completar os blocos que faltaram"""
+    if isinstance(origem, (bytes, bytearray, memoryview)):
+        root = ET.fromstring(origem)
+    elif isinstance(origem, str):
+        root = ET.parse(origem).getroot()
+    elif hasattr(origem, 'seek') and origem.seekable():
+        origem.seek(0)
+        root = ET.parse(origem).getroot()
+    else:
+        return dados
+    return _completar_pela_arvore(root, dados)
+
+
+def ler_nfe(origem, parar_se=None):
+    """Lê um XML de NFe
+
+    Conteúdos em memória de até TAMANHO_MAXIMO_ARVORE bytes são lidos com
+    fromstring; caminhos, arquivos e conteúdos maiores, em streaming. Os
+    dois caminhos só consideram os blocos filhos diretos de infNFe; se falta
+    algum de BLOCOS_OBRIGATORIOS ou os itens (ex.: emit dentro de um
+    elemento a mais), a nota é relida por ler_nfe_arvore, que os procura na
+    subárvore inteira.
+
+    Args:
+        origem: conteúdo do XML (bytes/memoryview), caminho ou arquivo binário
+        parar_se: função opcional chamada com a chave de acesso assim que ela
+            é conhecida; se retornar verdadeiro, a leitura é interrompida
+
+    Returns:
+        NFeDados, ou None se a leitura foi interrompida por parar_se
+    """
+    if isinstance(origem, (bytes, bytearray, memoryview)) and len(origem) <= TAMANHO_MAXIMO_ARVORE:
+        return _ler_nfe_conteudo(origem, parar_se)
+
+    dados = NFeDados()
+    chave_protocolo = None
+
+    eventos = iterar_nfe(origem)
+    for evento, registro in eventos:
+        if evento == 'det':
+            dados.itens.append(registro)
+        elif evento == 'chave':
+            if parar_se and parar_se(registro):
+                eventos.close()
+                return None
+            dados.chave_acesso = registro
+        elif evento == 'chNFe':
+            chave_protocolo = chave_protocolo or registro
+        elif getattr(dados, ATRIBUTOS_BLOCO[evento]) is None:
+            setattr(dados, ATRIBUTOS_BLOCO[evento], registro)
+
+    if not dados.chave_acesso:
+        if not chave_protocolo:
+            raise NFeInvalida('XML inválido: chave de acesso não encontrada.')
+        if parar_se and parar_se(chave_protocolo):
+            return None
+        dados.chave_acesso = chave_protocolo
+
+    if _faltam_blocos(dados):
+        return _reler_arvore(origem, dados)
+    return dados
+
+
+def ler_arquivo(caminho):
+    """Lê e interpreta um arquivo de NFe, para uso em processos de leitura paralelos
+
+    Não acessa o banco nem levanta exceções: o erro volta como texto para o
+    processo do Odoo, que registra a falha e segue com os demais arquivos.
+
+    Returns:
+        tupla (dados, conteudo, erro): NFeDados e bytes originais do arquivo,
+        ou (None, None, mensagem de erro)
+    """
+    try:
+        with open(caminho, 'rb') as f:
+            conteudo = f.read()
+        return ler_nfe(conteudo), conteudo, None
+    except Exception as e:
+        return None, None, str(e) or e.__class__.__name__
+
+
+def ler_conteudo(conteudo):
+    """Como ler_arquivo, para um XML já em memória
+
+    Returns:
+        tupla (dados, erro): NFeDados, ou None e a mensagem de erro
+    """
+    try:
+        return ler_nfe(conteudo), None
+    except Exception as e:
+        return None, str(e) or e.__class__.__name__
+
+
+# --- Leitura de uma árvore já carregada ---
+
+def detectar_namespace(root):
+    """Detecta automaticamente o namespace do XML da NFe"""
+    nsmap = {}
+
+    # Verificar se o root já tem o namespace definido (lxml)
+    if hasattr(root, 'nsmap') and root.nsmap:
+        for prefix, uri in root.nsmap.items():
+            if uri and ('portalfiscal' in uri or 'nfe' in uri):
+                if prefix is None:
+                    nsmap['nfe'] = uri
+                else:
+                    nsmap[prefix] = uri
+
+    # Se não encontrou namespace, tentar detectar pelos elementos
+    if not nsmap:
+        uri = namespace(root.tag)
+        if uri:
+            nsmap['nfe'] = uri
+
+        # Tentar encontrar nos filhos
+        for child in root:
+            uri = namespace(child.tag)
+            if uri:
+                nsmap['nfe'] = uri
+                break
+
+    # Se ainda não encontrou, usar um namespace padrão
+    if not nsmap:
+        _logger.warning("Namespace não detectado, usando namespace padrão")
+        nsmap['nfe'] = NAMESPACE_PADRAO
+
+    return nsmap
+
+
+class IndiceTags:
+    """Índice nome local -> elementos de um documento XML
+
+    Substitui a busca recursiva usada quando um elemento não está no caminho
+    esperado (XMLs sem namespace ou malformados): o índice é montado em uma
+    única passada na primeira busca e reutilizado nas seguintes, de modo que
+    k buscas custam O(n) em vez de O(k·n). É usado por ler_nfe_arvore, para
+    onde ler_nfe desvia as notas com blocos fora da posição esperada.
+    """
+
+    __slots__ = ('raiz', '_elementos')
+
+    def __init__(self, raiz):
+        self.raiz = raiz
+        self._elementos = None
+
+    def _montar(self):
+        elementos = {}
+        for elemento in self.raiz.iter():
+            tag = elemento.tag
+            # lxml devolve comentários e instruções de processamento com tag não textual
+            if isinstance(tag, str):
+                elementos.setdefault(nome_local(tag), []).append(elemento)
+        self._elementos = elementos
+        return elementos
+
+    def buscar_todos(self, tag_procurada):
+        """Retorna todos os elementos com o nome local informado, na ordem do documento"""
+        elementos = self._elementos
+        if elementos is None:
+            elementos = self._montar()
+        return elementos.get(tag_procurada, [])
+
+    def buscar(self, tag_procurada):
+        """Retorna o primeiro elemento com o nome local informado, ou None"""
+        encontrados = self.buscar_todos(tag_procurada)
+        return encontrados[0] if encontrados else None
+
+
+def extrair_elemento_seguro(root, caminho_elementos, ns=None, indice=None):
+    """Extrai um elemento de forma segura usando um caminho de elementos
+
+    Quando um passo do caminho não é encontrado como filho direto, busca no
+    documento inteiro pelo índice de tags (montado sob demanda se não informado).
+    """
+    elemento_atual = root
+
+    for tag in caminho_elementos:
+        proximo = None
+
+        # Tentar com namespace
+        if ns:
+            proximo = elemento_atual.find(f'nfe:{tag}', ns)
+
+        # Se não encontrou, tentar sem namespace
+        if proximo is None:
+            proximo = elemento_atual.find(tag)
+
+        # Se ainda não encontrou, consultar o índice do documento
+        if proximo is None:
+            if indice is None:
+                indice = IndiceTags(root)
+            proximo = indice.buscar(tag)
+
+        if proximo is None:
+            return None
+        elemento_atual = proximo
+
+    return elemento_atual
+
+
+def _extrair_chave_arvore(root, ns, indice):
+    """Localiza a chave de acesso e o elemento infNFe na árvore XML"""
+    chave_acesso = None
+
+    # Tentar encontrar a chave de acesso em diferentes locais
+    # Primeiro no padrão mais comum
+    inf_nfe = root.find('.//nfe:infNFe', ns)
+    if inf_nfe is not None:
+        chave_acesso = inf_nfe.get('Id', '')
+        if chave_acesso and chave_acesso.startswith('NFe'):
+            chave_acesso = chave_acesso[3:]  # Remover prefixo 'NFe'
+
+    # Se não encontrou, tentar outros caminhos
+    if not chave_acesso:
+        chave_acesso_elem = root.find('.//nfe:chNFe', ns)
+        if chave_acesso_elem is not None and chave_acesso_elem.text:
+            chave_acesso = chave_acesso_elem.text
+
+    if not chave_acesso:
+        chave_acesso_elem = indice.buscar('chNFe')
+        if chave_acesso_elem is not None and chave_acesso_elem.text:
+            chave_acesso = chave_acesso_elem.text
+
+    return chave_acesso, inf_nfe
+
+
+def ler_nfe_arvore(root, parar_se=None):
+    """Lê uma NFe de uma árvore XML já carregada (ElementTree ou lxml)
+
+    Args:
+        root: elemento raiz do documento
+        parar_se: mesma semântica de ler_nfe
+
+    Returns:
+        NFeDados, ou None se a leitura foi interrompida por parar_se
+    """
+    ns = detectar_namespace(root)
+    indice = IndiceTags(root)
+
+    chave_acesso, inf_nfe = _extrair_chave_arvore(root, ns, indice)
+    if not chave_acesso:
+        raise NFeInvalida('XML inválido: chave de acesso não encontrada.')
+
+    if parar_se and parar_se(chave_acesso):
+        return None
+
+    if inf_nfe is None:
+        # Tentar encontrar em outros locais
+        inf_nfe = extrair_elemento_seguro(root, ['NFe', 'infNFe'], ns, indice)
+
+    if inf_nfe is None:
+        raise NFeInvalida('XML inválido: elemento infNFe não encontrado.')
+
+    plano = plano_do_elemento(inf_nfe)
+    dados = extrair_infnfe(inf_nfe, plano, NFeDados(chave_acesso=chave_acesso))
+
+    # Blocos fora da posição esperada: buscar na subárvore do infNFe, com um
+    # único índice para todos os blocos que faltarem
+    indice_inf_nfe = indice if inf_nfe is root else IndiceTags(inf_nfe)
+    for bloco, atributo in ATRIBUTOS_BLOCO.items():
+        if getattr(dados, atributo) is None:
+            elemento = indice_inf_nfe.buscar(bloco)
+            if elemento is not None:
+                setattr(dados, atributo, extrair_bloco(bloco, elemento))
+    if not dados.itens:
+        for det in indice_inf_nfe.buscar_todos('det'):
+            item = extrair_bloco('det', det)
+            if item is not None:
+                dados.itens.append(item)
+
+    return dados
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Varredura de pastas com os.scandir, entregando os arquivos à medida que são encontrados.
+
+Ao contrário de glob com ordenação global, nenhuma lista com todos os
+caminhos é montada: a importação começa com os primeiros arquivos
+encontrados, e a memória usada é a de um diretório por vez (apenas quando a
+ordenação por diretório está ativa).
+"""
+
+import os
+
+# Extensões consideradas arquivos de NFe (comparação sem diferenciar maiúsculas)
+EXTENSOES_XML = ('.xml',)
+
+
+def percorrer_pasta(pasta, incluir_subpastas=True, extensoes=EXTENSOES_XML,
+                    modificados_desde=None, ordenar=True, apos=None, modificados_ate=None):
+    """Gera os caminhos dos arquivos da pasta
+
+    Com ordenar=True as entradas de cada diretório são visitadas em ordem
+    alfabética (arquivos e subpastas intercalados), o que torna a ordem de
+    toda a varredura determinística e permite retomá-la.
+
+    Args:
+        pasta: diretório raiz
+        incluir_subpastas: se True, percorre as subpastas recursivamente
+        extensoes: extensões aceitas (ex.: ('.xml',)); None aceita todas
+        modificados_desde: timestamp (st_mtime); se informado, apenas
+            arquivos modificados a partir dele são gerados
+        ordenar: visita as entradas de cada diretório em ordem alfabética
+        apos: caminho do último arquivo já processado; a varredura continua
+            logo após ele, sem listar as subpastas que ficaram para trás.
+            Requer ordenar=True.
+        modificados_ate: timestamp (st_mtime); se informado, arquivos
+            modificados depois dele não são gerados (ex.: ainda em gravação)
+
+    Yields:
+        caminhos dos arquivos encontrados
+    """
+    if apos and not ordenar:
+        raise ValueError('A retomada da varredura (apos) requer ordenar=True')
+    extensoes = tuple(extensao.lower() for extensao in extensoes) if extensoes else None
+    partes_apos = os.path.relpath(apos, pasta).split(os.sep) if apos else None
+    yield from _percorrer(pasta, incluir_subpastas, extensoes, modificados_desde, ordenar, partes_apos,
+                          modificados_ate)
+
+
+def _percorrer(diretorio, incluir_subpastas, extensoes, modificados_desde, ordenar, apos, modificados_ate=None):
+    """Percorre um diretório; apos são as partes restantes do caminho de retomada"""
+    with os.scandir(diretorio) as entradas:
+        if ordenar:
+            entradas = sorted(entradas, key=lambda entrada: entrada.name)
+        for entrada in entradas:
+            restante = None
+            if apos:
+                if entrada.name < apos[0]:
+                    continue
+                if entrada.name == apos[0]:
+                    if len(apos) == 1:
+                        # O próprio arquivo de retomada já foi processado
+                        continue
+                    restante = apos[1:]
+                else:
+                    # Depois do caminho de retomada, tudo é novo
+                    apos = None
+
+            try:
+                eh_diretorio = entrada.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if eh_diretorio:
+                if incluir_subpastas:
+                    yield from _percorrer(entrada.path, incluir_subpastas, extensoes,
+                                          modificados_desde, ordenar, restante, modificados_ate)
+                continue
+
+            if extensoes and not entrada.name.lower().endswith(extensoes):
+                continue
+            if modificados_desde is not None or modificados_ate is not None:
+                try:
+                    modificado_em = entrada.stat().st_mtime
+                except OSError:
+                    continue
+                if modificados_desde is not None and modificado_em < modificados_desde:
+                    continue
+                if modificados_ate is not None and modificado_em > modificados_ate:
+                    continue
+            yield entrada.path
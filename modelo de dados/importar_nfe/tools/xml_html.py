@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Renderização do XML de uma NFe em HTML com sintaxe colorida.
+
+O XML é percorrido em streaming e convertido em uma linha HTML por tag; a
+renderização para assim que o limite de linhas é atingido, de modo que abrir
+uma nota com centenas de itens custa apenas a primeira página. As páginas já
+renderizadas ficam em um cache LRU, chaveado pelo checksum do anexo.
+"""
+
+import html
+import itertools
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+from .nfe_parser import _como_arquivo, nome_local
+
+# Quantidade de linhas (tags) exibidas por página do visualizador
+LINHAS_POR_PAGINA = 500
+
+# Quantidade de renderizações mantidas em cache por processo
+TAMANHO_CACHE = 64
+
+_ESTILO_TAG = 'color: #0000FF;'
+_ESTILO_ATRIBUTO = 'color: #0000AA;'
+_ESTILO_VALOR = 'color: #AA0000;'
+_ESTILO_TEXTO = 'color: #000000;'
+
+
+class CacheLRU:
+    """Cache LRU simples e seguro entre threads"""
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            valor = self._itens.get(chave)
+            if valor is not None:
+                self._itens.move_to_end(chave)
+            return valor
+
+    def put(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho:
+                self._itens.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._itens.clear()
+
+
+cache_renderizacao = CacheLRU(TAMANHO_CACHE)
+
+
+def _abertura(elemento):
+    tag = nome_local(elemento.tag)
+    attrs = ''
+    if elemento.attrib:
+        attrs = ' ' + ' '.join(
+            f'<span style="{_ESTILO_ATRIBUTO}">{nome_local(k)}</span>='
+            f'<span style="{_ESTILO_VALOR}">"{html.escape(v)}"</span>'
+            for k, v in elemento.attrib.items()
+        )
+    return f'<span style="{_ESTILO_TAG}">&lt;{tag}</span>{attrs}<span style="{_ESTILO_TAG}">&gt;</span>'
+
+
+def _texto(elemento):
+    if elemento.text and elemento.text.strip():
+        return f'<span style="{_ESTILO_TEXTO}">{html.escape(elemento.text.strip())}</span>'
+    return ''
+
+
+def _fechamento(elemento):
+    return f'<span style="{_ESTILO_TAG}">&lt;/{nome_local(elemento.tag)}&gt;</span>'
+
+
+def _recuo(nivel):
+    return '&nbsp;' * 4 * nivel
+
+
+def iterar_linhas(origem):
+    """Gera as linhas HTML do XML, uma por tag, na ordem do documento
+
+    Elementos sem filhos ocupam uma única linha (abertura, texto e
+    fechamento); os demais abrem e fecham em linhas próprias.
+    """
+    # Pilha de [elemento, linha de abertura já emitida]
+    pilha = []
+    for evento, elemento in ET.iterparse(_como_arquivo(origem), events=('start', 'end')):
+        if evento == 'start':
+            if pilha and not pilha[-1][1]:
+                pai = pilha[-1][0]
+                yield _recuo(len(pilha) - 1) + _abertura(pai) + _texto(pai)
+                pilha[-1][1] = True
+            pilha.append([elemento, False])
+            continue
+
+        _elemento, aberto = pilha.pop()
+        if aberto:
+            yield _recuo(len(pilha)) + _fechamento(elemento)
+        else:
+            yield _recuo(len(pilha)) + _abertura(elemento) + _texto(elemento) + _fechamento(elemento)
+        elemento.clear()
+
+
+def renderizar(origem, limite=LINHAS_POR_PAGINA):
+    """Renderiza as primeiras linhas do XML em HTML
+
+    Args:
+        origem: conteúdo do XML (bytes/memoryview), caminho ou arquivo binário
+        limite: quantidade máxima de linhas (tags) a renderizar
+
+    Returns:
+        tupla (html, tem_mais), onde tem_mais indica que o XML foi truncado
+    """
+    linhas = list(itertools.islice(iterar_linhas(origem), limite + 1))
+    tem_mais = len(linhas) > limite
+    if tem_mais:
+        del linhas[limite:]
+    conteudo = '<br/>'.join(linhas)
+    return f'<pre style="font-family: monospace; white-space: pre-wrap;">{conteudo}</pre>', tem_mais
+
+
+def renderizar_com_cache(checksum, ler_conteudo, limite=LINHAS_POR_PAGINA):
+    """Renderiza o XML reutilizando o cache LRU
+
+    Args:
+        checksum: checksum do anexo (identifica o conteúdo do XML)
+        ler_conteudo: função sem argumentos que retorna os bytes do XML,
+            chamada apenas quando a renderização não está em cache
+        limite: quantidade máxima de linhas (tags) a renderizar
+    """
+    chave = (checksum, limite)
+    resultado = cache_renderizacao.get(chave)
+    if resultado is None:
+        resultado = renderizar(ler_conteudo(), limite)
+        cache_renderizacao.put(chave, resultado)
+    return resultado
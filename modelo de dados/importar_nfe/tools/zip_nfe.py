@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Leitura em streaming dos XMLs de NFe contidos em arquivos ZIP.
+
+Os membros são lidos um a um diretamente do ZIP (ZipFile.open), sem extrair
+o pacote para o disco: a memória usada é a de um XML por vez. ZIPs contidos
+em outros ZIPs também são percorridos; como o ZipFile precisa de acesso
+aleatório, cada ZIP interno é copiado para um arquivo temporário que fica em
+memória enquanto for pequeno.
+"""
+
+import os
+import shutil
+import tempfile
+import zipfile
+
+# Tamanho máximo de um XML dentro do ZIP (proteção contra ZIPs maliciosos)
+TAMANHO_MAXIMO_XML = 50 * 1024 * 1024
+
+# ZIPs internos até este tamanho ficam em memória; maiores vão para o disco
+TAMANHO_MEMORIA_ZIP_INTERNO = 32 * 1024 * 1024
+
+# Profundidade máxima de ZIPs dentro de ZIPs
+PROFUNDIDADE_MAXIMA = 5
+
+
+def eh_zip(arquivo):
+    """Indica se o arquivo binário (com seek) é um ZIP, sem mudar sua posição"""
+    posicao = arquivo.tell()
+    try:
+        return zipfile.is_zipfile(arquivo)
+    finally:
+        arquivo.seek(posicao)
+
+
+def iterar_xmls_zip(arquivo, prefixo='', profundidade=0, apos=None):
+    """Gera os XMLs contidos no ZIP, incluindo os de ZIPs internos
+
+    Os membros são gerados na ordem em que estão gravados no ZIP; essa ordem
+    fixa permite retomar a leitura logo após um membro já processado.
+
+    Args:
+        arquivo: caminho ou arquivo binário com seek do ZIP
+        prefixo: caminho do ZIP externo, usado no nome dos membros internos
+        profundidade: nível de aninhamento (uso interno)
+        apos: nome (como gerado aqui) do último membro já processado; os
+            membros até ele, inclusive, são pulados sem serem lidos
+
+    Yields:
+        tuplas (nome, conteudo, erro): nome do membro (com o caminho dos ZIPs
+        que o contêm), bytes do XML e, se o membro não puder ser lido,
+        conteudo None e a mensagem de erro
+    """
+    with zipfile.ZipFile(arquivo) as pacote:
+        for info in pacote.infolist():
+            if info.is_dir():
+                continue
+            nome = prefixo + info.filename
+            extensao = os.path.splitext(info.filename)[1].lower()
+
+            # Retomada: pular os membros até o último processado; se ele está
+            # em um ZIP interno, a leitura continua dentro desse ZIP
+            apos_interno = None
+            if apos is not None:
+                if nome == apos:
+                    apos = None
+                    continue
+                if extensao != '.zip' or not apos.startswith(nome + '/'):
+                    continue
+                apos_interno, apos = apos, None
+
+            if extensao == '.zip':
+                if profundidade >= PROFUNDIDADE_MAXIMA:
+                    yield nome, None, 'ZIP aninhado além da profundidade máxima'
+                    continue
+                try:
+                    with tempfile.SpooledTemporaryFile(max_size=TAMANHO_MEMORIA_ZIP_INTERNO) as interno:
+                        with pacote.open(info) as membro:
+                            shutil.copyfileobj(membro, interno)
+                        interno.seek(0)
+                        yield from iterar_xmls_zip(interno, nome + '/', profundidade + 1, apos_interno)
+                except (zipfile.BadZipFile, OSError) as e:
+                    yield nome, None, f'ZIP interno inválido: {e}'
+                continue
+
+            if extensao != '.xml':
+                continue
+            if info.file_size > TAMANHO_MAXIMO_XML:
+                yield nome, None, f'XML maior que o limite de {TAMANHO_MAXIMO_XML // (1024 * 1024)} MB'
+                continue
+            try:
+                with pacote.open(info) as membro:
+                    conteudo = membro.read(TAMANHO_MAXIMO_XML + 1)
+            except (zipfile.BadZipFile, OSError, RuntimeError) as e:
+                yield nome, None, str(e)
+                continue
+            if len(conteudo) > TAMANHO_MAXIMO_XML:
+                yield nome, None, f'XML maior que o limite de {TAMANHO_MAXIMO_XML // (1024 * 1024)} MB'
+                continue
+            yield nome, conteudo, None